@@ -0,0 +1,73 @@
+"""
+The reader of tiff-files for napari. Uncompressed tiff-files are opened as
+memory maps, so that the planes of large stacks are only read from the disk
+when they are displayed or processed. The metadata of the files is taken from
+the metadata index of their folder.
+
+see: https://napari.org/stable/plugins/building_a_plugin/guides.html#readers
+"""
+
+import os
+
+from napari_sphot.image import TiffMetadataIndex, readTiff
+
+lengthUnits = ("pm", "nm", "µm", "um", "mm", "cm", "m")
+
+
+def napari_get_reader(path):
+    """Answer the reader function for tiff-files or None for other files.
+
+    :param path: The path of a file or a list of paths
+    """
+    paths = [path] if isinstance(path, str) else list(path)
+    if not paths or not all(
+        str(aPath).lower().endswith(TiffMetadataIndex.extensions)
+        for aPath in paths
+    ):
+        return None
+    return readerFunction
+
+
+def readerFunction(path):
+    """Answer the layer data of the tiff-files under the path or paths."""
+    paths = [path] if isinstance(path, str) else list(path)
+    indices = {}
+    layerData = []
+    for aPath in paths:
+        folder = os.path.dirname(os.path.abspath(aPath))
+        if folder not in indices:
+            indices[folder] = TiffMetadataIndex(folder)
+        data, entry = readTiff(aPath, indices[folder])
+        layerData.append(
+            (data, getLayerAttributes(aPath, data.shape, entry), "image")
+        )
+    return layerData
+
+
+def getLayerAttributes(path, shape, entry):
+    """Answer the name, the scale and the units of the image layer for the
+    metadata entry of the file.
+
+    The pixel size is applied to the x- and y-axes and the spacing to the
+    z-axis of the series, only if the unit of the file is a length. Files
+    without a length unit, for example with a resolution in dots per inch,
+    get the default scale of napari. The samples of rgb-images are not an
+    axis of the layer.
+    """
+    attributes = {"name": os.path.splitext(os.path.basename(path))[0]}
+    if entry["unit"] not in lengthUnits:
+        return attributes
+    ndim = len(shape)
+    axes = entry.get("axes", "")
+    if len(axes) != ndim:
+        axes = ("ZYX" if ndim > 2 else "YX")[-ndim:].rjust(ndim, "Q")
+    if ndim > 2 and axes[-1] == "S" and shape[-1] in (3, 4):
+        attributes["rgb"] = True
+        axes = axes[:-1]
+    spacing = entry["spacing"] if entry["spacing"] else entry["pixelSize"]
+    sizes = {"X": entry["pixelSize"], "Y": entry["pixelSize"], "Z": spacing}
+    attributes["scale"] = tuple(sizes.get(axis, 1.0) for axis in axes)
+    attributes["units"] = tuple(
+        entry["unit"] if axis in sizes else "pixel" for axis in axes
+    )
+    return attributes
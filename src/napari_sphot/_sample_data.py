@@ -12,6 +12,7 @@ from __future__ import annotations
 import numpy
 from skimage import io
 import pandas as pd
+from napari_sphot.synthetic import SyntheticEmbryo
 
 
 def make_sample_data():
@@ -55,3 +56,31 @@ def make_sample_data():
              "points"
             )
             ]
+
+
+
+def make_synthetic_sample_data(size='small', seed=0):
+    """Generates a synthetic embryo, without downloading data"""
+    embryo = SyntheticEmbryo.ofSize(size, seed=seed)
+    embryo.run()
+    scale = embryo.scale
+    units = embryo.units
+    return [(embryo.nucleiImage,
+             {'scale': scale,
+              'name': 'synthetic nuclei',
+              'units': units}),
+            (embryo.image,
+             {'scale': scale,
+              'name': 'synthetic spots',
+              'units': units}),
+            (embryo.labels,
+             {'scale': scale,
+              'name': 'synthetic labels',
+              'units': units},
+             "labels"),
+            (embryo.spots,
+             {'scale': scale,
+              'name': 'synthetic points',
+              'units': units},
+             "points")
+            ]
@@ -0,0 +1,39 @@
+import pytest
+
+from napari_sphot.benchmark import Benchmark
+from napari_sphot.telemetry import Telemetry
+
+
+def test_benchmark_records_each_case_and_size(tmp_path):
+    telemetry = Telemetry(path=str(tmp_path / "benchmark.jsonl"))
+    benchmark = Benchmark(
+        sizes=["small"],
+        cases=[
+            "relabel",
+            "spot export",
+            "histogram h-function",
+            "local correlation",
+        ],
+        telemetry=telemetry,
+    )
+    benchmark.nrOfSimulations = 3
+    steps = list(benchmark.run())
+    assert len(steps) == 4
+    table = benchmark.getTable()
+    assert table["case"] == [
+        "relabel",
+        "spot export",
+        "histogram h-function",
+        "local correlation",
+    ]
+    assert table["size"] == ["small"] * 4
+    assert table["task"][2] == "HistogramHFunctionTask"
+    assert all(wallTime >= 0 for wallTime in table["wall_time_s"])
+    assert table["voxels"][0] == 32 * 128 * 128
+    assert table["labels"][0] == 6
+    assert len((tmp_path / "benchmark.jsonl").read_text().splitlines()) == 4
+
+
+def test_unknown_case():
+    with pytest.raises(ValueError):
+        list(Benchmark(sizes=["small"], cases=["sorting"]).run())
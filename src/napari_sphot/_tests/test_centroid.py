@@ -0,0 +1,35 @@
+import numpy as np
+
+from napari_sphot.centroid import CentroidProfilesTask
+
+
+def test_centroid_profiles_task():
+    labels = np.zeros((10, 20, 40), dtype=np.uint16)
+    labels[:, :, :20] = 1
+    labels[:, :, 20:] = 7
+    spots = np.array(
+        [[4.5, 9.5, 9.5], [4.5, 9.5, 29.5], [0, 0, 20], [4.5, 9.5, 35.5]]
+    )
+    task = CentroidProfilesTask(labels, spots, (2, 1, 1), "nm")
+    task.binWidth = 1
+    for _ in task.run():
+        pass
+    assert np.allclose(task.centroids, [[9, 9.5, 9.5], [9, 9.5, 29.5]])
+    assert list(task.distancesTable["label"]) == [1, 7, 7, 7]
+    assert np.allclose(task.distancesTable["distance"][[0, 1, 3]], [0, 0, 6])
+    table = task.table
+    for label in (1, 7):
+        for profile in CentroidProfilesTask.profiles:
+            rows = [
+                index
+                for index, (aLabel, aProfile) in enumerate(
+                    zip(table["label"], table["profile"], strict=False)
+                )
+                if aLabel == label and aProfile == profile
+            ]
+            assert np.isclose(
+                sum(table["volume"][row] for row in rows), 10 * 20 * 20 * 2
+            )
+            assert sum(table["nr_of_spots"][row] for row in rows) == (
+                1 if label == 1 else 3
+            )
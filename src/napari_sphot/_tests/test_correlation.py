@@ -0,0 +1,66 @@
+import numpy as np
+
+from napari_sphot.correlation import LocalCorrelator, MultiChannelCorrelator
+
+
+def test_multi_channel_correlator():
+    rng = np.random.default_rng(0)
+    a = rng.random((8, 16, 16))
+    b = np.roll(a, 2, axis=2)
+    c = rng.random((8, 16, 16))
+    correlator = MultiChannelCorrelator([a, b, c], ["a", "b", "c"])
+    correlator.keepCorrelationImages = True
+    for _ in correlator.run():
+        pass
+    assert len(correlator.profiles) == 6
+    assert np.allclose(np.diag(correlator.matrix), 1, atol=1e-5)
+    assert np.allclose(correlator.matrix, correlator.matrix.T)
+    assert correlator.correlationImages[("a", "a")].shape == a.shape
+    assert np.argmax(correlator.correlationImages[("a", "b")]) != np.argmax(
+        correlator.correlationImages[("a", "a")]
+    )
+    assert list(correlator.table.keys())[0] == "radius"
+    assert "a-b" in correlator.table
+
+
+def test_local_correlator():
+    rng = np.random.default_rng(1)
+    a = rng.random((8, 16, 16))
+    b = a.copy()
+    b[:, :, 8:] = rng.random((8, 16, 8))
+    correlator = LocalCorrelator(a, b)
+    correlator.windowSize = (8, 8, 8)
+    correlator.run()
+    assert correlator.correlationMap.shape == (1, 2, 2)
+    assert np.allclose(correlator.correlationMap[:, :, 0], 1)
+    window = (slice(0, 8), slice(0, 8), slice(8, 16))
+    expected = np.corrcoef(a[window].ravel(), b[window].ravel())[0, 1]
+    assert np.isclose(correlator.correlationMap[0, 0, 1], expected, atol=1e-5)
+    labels = np.zeros(a.shape, dtype=int)
+    labels[:, :, :8] = 1
+    labels[:, :, 8:] = 2
+    correlator = LocalCorrelator(a, b, labels)
+    correlator.mode = "labels"
+    correlator.run()
+    assert list(correlator.table["label"]) == [1, 2]
+    assert np.isclose(correlator.table["ncc"][0], 1)
+    assert np.isclose(
+        correlator.table["ncc"][1],
+        np.corrcoef(a[:, :, 8:].ravel(), b[:, :, 8:].ravel())[0, 1],
+    )
+
+
+def test_local_correlator_with_large_offset():
+    rng = np.random.default_rng(2)
+    a = 60000 + rng.integers(0, 4, (16, 64, 64)).astype(np.uint16)
+    b = a.copy()
+    b[:, :, 32:] = 60000 + rng.integers(0, 4, (16, 64, 32))
+    correlator = LocalCorrelator(a, b)
+    correlator.windowSize = (16, 32, 32)
+    correlator.run()
+    window = (slice(0, 16), slice(0, 32), slice(32, 64))
+    expected = np.corrcoef(
+        a[window].ravel().astype(float), b[window].ravel().astype(float)
+    )[0, 1]
+    assert np.allclose(correlator.correlationMap[:, :, 0], 1, atol=1e-5)
+    assert np.isclose(correlator.correlationMap[0, 0, 1], expected, atol=1e-5)
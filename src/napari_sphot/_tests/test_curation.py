@@ -0,0 +1,68 @@
+import numpy as np
+from napari.layers import Labels
+
+from napari_sphot.curation import DirtyLabelsTracker, RemeasureTask
+from napari_sphot.spots_util import SpotsPerCellTask
+
+
+def get_labels():
+    labels = np.zeros((4, 10, 10), dtype=np.uint16)
+    labels[:, :5, :5] = 1
+    labels[:, :5, 5:] = 2
+    labels[:, 5:, :] = 3
+    return labels
+
+
+def test_dirty_labels_tracker():
+    layer = Labels(get_labels())
+    tracker = DirtyLabelsTracker(layer)
+    assert not tracker.hasChanges()
+    layer.data_setitem(
+        (np.array([0, 1]), np.array([0, 0]), np.array([0, 0])), 2
+    )
+    assert tracker.pop() == ([1, 2], ([0, 0, 0], [2, 1, 1]))
+    assert not tracker.hasChanges()
+    layer.data = get_labels()
+    assert tracker.pop() == (None, None)
+    tracker.disconnect()
+
+
+def test_remeasure_task():
+    labels = get_labels()
+    labels[labels == 2] = 1
+    spots = np.array([[0, 0, 0], [0, 1, 7], [0, 7, 7]])
+    task = RemeasureTask(spots, labels, [1, 2])
+    task.taskFactories = [
+        lambda spots, changed: SpotsPerCellTask(spots, changed, (1, 1, 1))
+    ]
+    for _ in task.run():
+        pass
+    assert task.removedLabels == [2]
+    assert list(task.table["label"]) == [1]
+    assert list(task.table["nr_of_spots"]) == [2]
+    assert list(task.spotLabels) == [1, 1, 3]
+
+
+def test_remeasure_task_on_crop():
+    labels = np.zeros((4, 40, 40), dtype=np.uint16)
+    labels[:, 2:10, 2:10] = 1
+    labels[:, 20:30, 20:36] = 2
+    spots = np.array([[1, 3, 3], [1, 25, 21], [1, 25, 35], [2, 28, 30]])
+    crop, offset = RemeasureTask.getCrop(
+        labels, [2], ([1, 24, 24], [2, 25, 25])
+    )
+    assert np.all(crop[:, 0, :] != 2) and np.all(crop[:, -1, :] != 2)
+    assert np.count_nonzero(crop == 2) == np.count_nonzero(labels == 2)
+    assert not np.any(crop == 1)
+    labels[:, 20:30, 20:36] = 0
+    assert np.count_nonzero(crop == 2) > 0
+    task = RemeasureTask(spots, crop, [2], offset)
+    task.taskFactories = [
+        lambda spots, changed: SpotsPerCellTask(spots, changed, (1, 1, 1))
+    ]
+    for _ in task.run():
+        pass
+    assert list(task.spotIndices) == [1, 2, 3]
+    assert list(task.spotLabels) == [2, 2, 2]
+    assert list(task.table["label"]) == [2]
+    assert list(task.table["nr_of_spots"]) == [3]
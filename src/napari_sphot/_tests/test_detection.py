@@ -0,0 +1,88 @@
+import bigfish.detection
+import numpy as np
+
+from napari_sphot import detection
+from napari_sphot.detection import (
+    ParallelDecomposeDenseRegions,
+    RoiSpotDetectionTask,
+    detectSpotsInRoi,
+)
+from napari_sphot.progress import Total
+
+
+class FixedSpotDetection:
+
+    def __init__(self, image):
+        self.image = image
+        self.spots = np.array([[1, 1, 1], [1, 2, 6], [0, 0, 0]])
+
+    def run(self):
+        pass
+
+
+def test_get_regions():
+    labels = np.zeros((10, 30, 30), dtype=np.uint16)
+    labels[4:6, 10:14, 10:14] = 2
+    labels[0:2, 0:3, 25:30] = 5
+    task = RoiSpotDetectionTask(
+        np.zeros(labels.shape), labels, (1.0, 0.5, 0.5)
+    )
+    task.spotRadius = (1.0, 1.0, 1.0)
+    task.marginFactor = 2
+    assert list(task.getMargin()) == [2, 4, 4]
+    regions = dict(task.getRegions())
+    assert sorted(regions) == [2, 5]
+    assert regions[2] == (slice(2, 8), slice(6, 18), slice(6, 18))
+    assert regions[5] == (slice(0, 4), slice(0, 7), slice(21, 30))
+
+
+def test_detect_spots_in_roi_keeps_spots_in_cell(monkeypatch):
+    monkeypatch.setattr(detection, "SpotDetection", FixedSpotDetection)
+    mask = np.zeros((3, 4, 8), dtype=bool)
+    mask[1, 1:3, 0:3] = True
+    spots = detectSpotsInRoi(np.zeros(mask.shape), mask, {"threshold": None})
+    assert np.array_equal(spots, [[1, 1, 1]])
+
+
+def get_image_with_dense_region():
+    rng = np.random.default_rng(1)
+    image = rng.poisson(5, (16, 48, 48)).astype(np.float64)
+    z, y, x = np.mgrid[:16, :48, :48]
+    centers = [
+        (4 + i % 8, 6 + 9 * (i % 5), 6 + 9 * (i // 5)) for i in range(15)
+    ]
+    for center, amplitude in zip(
+        centers + [(8, 30, 33), (8, 31, 35), (9, 32, 33)],
+        [200] * 15 + [300] * 3,
+        strict=False,
+    ):
+        image += amplitude * np.exp(
+            -(
+                (z - center[0]) ** 2 / 2
+                + (y - center[1]) ** 2 / 2.5
+                + (x - center[2]) ** 2 / 2.5
+            )
+        )
+    spots = np.array(centers + [(8, 31, 34)], dtype=np.int64)
+    return image.astype(np.uint16), spots
+
+
+def test_parallel_decompose_dense_regions_as_bigfish():
+    image, spots = get_image_with_dense_region()
+    expected, _, referenceSpot = bigfish.detection.decompose_dense(
+        image, spots, (300, 100, 100), (350, 150, 150)
+    )
+    task = ParallelDecomposeDenseRegions(image, spots)
+    task.voxelSize = (300, 100, 100)
+    task.spotRadius = (350, 150, 150)
+    task.nrOfWorkers = 2
+    steps = list(task.run())
+    assert task.nrOfDenseRegions >= 1
+    assert isinstance(steps[0], Total)
+    assert steps[0] == len(steps) - 1 == task.nrOfDenseRegions
+    assert len(task.denseRegions["area"]) == task.nrOfDenseRegions
+    assert len(task.decomposedSpots) > len(spots)
+    assert np.array_equal(
+        np.unique(task.decomposedSpots, axis=0), np.unique(expected, axis=0)
+    )
+    assert np.array_equal(task.referenceSpot, referenceSpot)
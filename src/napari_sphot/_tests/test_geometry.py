@@ -0,0 +1,54 @@
+import numpy as np
+from scipy.spatial import Delaunay
+
+from napari_sphot.geometry import GeometryMetricsTask, TessellationUtil
+from napari_sphot.progress import Total
+
+
+def test_edge_vectors():
+    points = np.array(
+        [[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 1, 1]], dtype=float
+    )
+    tess = Delaunay(points)
+    edges = TessellationUtil.getUniqueEdges(tess.simplices)
+    expected = {
+        tuple(sorted(pair))
+        for simplex in tess.simplices
+        for pair in [(a, b) for a in simplex for b in simplex if a < b]
+    }
+    assert {tuple(edge) for edge in edges} == expected
+    vectors = TessellationUtil.getVectors(points, edges)
+    assert vectors.shape == (len(edges), 2, 3)
+    assert np.allclose(vectors[:, 0] + vectors[:, 1], points[edges[:, 1]])
+
+
+def test_polygons_to_surface():
+    square = np.array([[0, 0, 0], [0, 1, 0], [0, 1, 1], [0, 0, 1]])
+    triangle = np.array([[1, 0, 0], [1, 1, 0], [1, 0, 1]])
+    vertices, faces = TessellationUtil.polygonsToSurface(
+        [square, triangle, square[:2]]
+    )
+    assert len(vertices) == 7
+    assert faces.tolist() == [[0, 1, 2], [0, 2, 3], [4, 5, 6]]
+
+
+def test_geometry_metrics_task():
+    rng = np.random.default_rng(0)
+    labels = np.zeros((20, 20, 40), dtype=np.uint16)
+    labels[:, :, :20] = 1
+    labels[:, :, 20:] = 2
+    spots = rng.random((200, 3)) * (20, 20, 40)
+    task = GeometryMetricsTask(spots, labels, (2, 1, 1), ("nm", "nm", "nm"))
+    task.mergeHulls = True
+    task.nrOfWorkers = 2
+    steps = list(task.run())
+    assert isinstance(steps[0], Total)
+    assert steps[0] == len(steps) - 1 == 2
+    assert task.table["label"] == [1, 2]
+    assert sum(task.table["nr_of_spots"]) == 200
+    assert all(
+        0 < volume <= 2 * 20 * 20 * 20 for volume in task.table["hull_volume"]
+    )
+    assert all(count > 0 for count in task.table["voronoi_cells"])
+    vertices, faces, values = task.surface
+    assert faces.max() < len(vertices) == len(values)
@@ -0,0 +1,45 @@
+import numpy as np
+
+from napari_sphot.label_filter import LabelFilterTask
+
+
+def get_labels():
+    labels = np.zeros((5, 20, 20), dtype=np.uint16)
+    labels[1:4, 1:5, 1:5] = 3
+    labels[1:4, 8:12, 8:12] = 12
+    labels[1:4, 14:16, 14:15] = 20
+    labels[0:3, 0:3, 15:20] = 40
+    return labels
+
+
+def test_parse_labels():
+    assert list(LabelFilterTask.parseLabels("1, 5,10-13 ,")) == [
+        1,
+        5,
+        10,
+        11,
+        12,
+        13,
+    ]
+    assert len(LabelFilterTask.parseLabels("")) == 0
+
+
+def test_keep_and_remove_labels():
+    labels = get_labels()
+    task = LabelFilterTask(labels)
+    task.keep = LabelFilterTask.parseLabels("3, 10-20, 99")
+    task.run()
+    assert np.array_equal(np.unique(task.result), [0, 3, 12, 20])
+    assert task.result.dtype == labels.dtype
+    task = LabelFilterTask(labels)
+    task.remove = [12]
+    task.run()
+    assert np.array_equal(np.unique(task.result), [0, 3, 20, 40])
+
+
+def test_remove_border_and_small_labels():
+    task = LabelFilterTask(get_labels())
+    task.removeBorder = True
+    task.minSize = 10
+    task.run()
+    assert np.array_equal(np.unique(task.result), [0, 3, 12])
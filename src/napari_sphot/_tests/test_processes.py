@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from napari_sphot.processes import ProcessBackend, SharedArray
+from napari_sphot.progress import Total
+
+
+class VolumeTask:
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.nrOfSteps = 3
+        self.callback = None
+        self.doubled = None
+        self.sizes = None
+
+    def run(self):
+        yield Total(self.nrOfSteps)
+        for _ in range(self.nrOfSteps):
+            yield
+        self.doubled = self.labels.astype(np.int64) * 2
+        self.sizes = np.bincount(self.labels.ravel())
+        return int(self.sizes[1:].sum())
+
+
+@pytest.fixture(scope="module")
+def backend():
+    aBackend = ProcessBackend(nrOfWorkers=1)
+    yield aBackend
+    aBackend.shutdown()
+
+
+def get_labels():
+    labels = np.zeros((20, 128, 256), dtype=np.uint16)
+    labels[2:10, 10:60, 10:60] = 1
+    labels[12:18, 70:120, 70:120] = 2
+    return labels
+
+
+def run(generator):
+    steps = 0
+    try:
+        while True:
+            if not isinstance(next(generator), Total):
+                steps = steps + 1
+    except StopIteration as stop:
+        return steps, stop.value
+
+
+def test_shared_array():
+    array = np.arange(12, dtype=np.float32).reshape(3, 4)
+    sharedArray, block = SharedArray.share(array)
+    view, viewBlock = sharedArray.attach()
+    assert np.array_equal(view, array)
+    del view
+    viewBlock.close()
+    copy = sharedArray.copy()
+    block.close()
+    assert np.array_equal(copy, array)
+    assert copy.dtype == np.float32
+
+
+def test_run_task_in_worker_process(backend):
+    labels = get_labels()
+    assert SharedArray.isLarge(labels)
+    task = VolumeTask(labels)
+    generator = backend.run(task)
+    total = next(generator)
+    assert isinstance(total, Total)
+    assert total == 3
+    steps, result = run(generator)
+    assert steps == 3
+    assert result == 8 * 50 * 50 + 6 * 50 * 50
+    assert task.labels is labels
+    assert np.array_equal(task.doubled, labels * 2)
+    assert list(task.sizes[1:]) == [8 * 50 * 50, 6 * 50 * 50]
+
+
+def test_task_that_can_not_be_pickled_runs_in_thread(backend):
+    task = VolumeTask(get_labels())
+    task.callback = lambda: None
+    steps, result = run(backend.run(task))
+    assert steps == 3
+    assert result == 8 * 50 * 50 + 6 * 50 * 50
+
+
+def test_cancelled_task_keeps_its_state(backend):
+    task = VolumeTask(get_labels())
+    task.nrOfSteps = 1000
+    generator = backend.run(task)
+    next(generator)
+    generator.close()
+    assert task.doubled is None
@@ -0,0 +1,94 @@
+import numpy as np
+from qtpy.QtWidgets import QDockWidget, QWidget
+
+from napari_sphot.qtutil import JobQueueWidget, PerformanceWidget, PlotManager
+from napari_sphot.scheduler import TaskScheduler
+from napari_sphot.telemetry import Telemetry
+
+
+class DockingWindow:
+    """Wraps the widgets in dock widgets and deletes them on removal, like
+    the window of the napari viewer.
+    """
+
+    def __init__(self):
+        self.parent = QWidget()
+        self.docks = []
+
+    def add_dock_widget(self, widget, **kwargs):
+        dock = QDockWidget(self.parent)
+        dock.setWidget(widget)
+        self.docks.append(dock)
+        return dock
+
+    def remove_dock_widget(self, dock):
+        dock.widget().setParent(None)
+        self.docks.remove(dock)
+        dock.deleteLater()
+
+
+class Options:
+    """Options that are not saved."""
+
+    def set(self, name, value):
+        pass
+
+    def save(self):
+        pass
+
+
+class Viewer:
+
+    def __init__(self):
+        self.window = DockingWindow()
+
+
+def test_plot_manager_reuses_plots(qtbot):
+    viewer = Viewer()
+    manager = PlotManager(viewer)
+    for run in range(3):
+        plot = manager.getPlot("G-Function")
+        plot.addData(np.arange(10), np.arange(10) * run, "b-")
+        plot.addData(np.arange(10), np.ones(10), "r--")
+        plot.addCurves(np.arange(10), np.random.random((50, 10)))
+        plot.display()
+    assert len(viewer.window.docks) == 1
+    assert len(plot.lines) == 2
+    assert np.allclose(plot.lines[0][0].get_ydata(), np.arange(10) * 2)
+    assert len(plot.collection.get_segments()) == 50
+    manager.closeAll()
+    assert len(viewer.window.docks) == 0
+
+
+def test_plot_manager_forgets_removed_plots(qtbot):
+    viewer = Viewer()
+    manager = PlotManager(viewer)
+    plot = manager.getPlot("G-Function")
+    plot.addData(np.arange(10), np.arange(10))
+    plot.display()
+    dock = plot.dockWidget
+    with qtbot.waitSignal(dock.destroyed):
+        viewer.window.remove_dock_widget(dock)
+    assert not plot.isDocked()
+    assert "G-Function" not in manager.plots
+    assert plot.lines == []
+    assert manager.getPlot("G-Function") is not plot
+
+
+def test_performance_widget_displays_records(qtbot, tmp_path):
+    telemetry = Telemetry(path=str(tmp_path / "performance.jsonl"))
+    widget = PerformanceWidget(telemetry)
+    qtbot.addWidget(widget)
+    telemetry.add({"job": "segment", "wall_time_s": 1.5})
+    assert widget.table.rowCount() == 1
+    assert widget.table.item(0, 0).text() == "segment"
+
+
+def test_job_queue_widget_switches_telemetry(qtbot, tmp_path, monkeypatch):
+    telemetry = Telemetry(path=str(tmp_path / "performance.jsonl"))
+    monkeypatch.setattr(telemetry, "getOptions", lambda: Options())
+    widget = JobQueueWidget(TaskScheduler(telemetry=telemetry))
+    qtbot.addWidget(widget)
+    assert widget.telemetryCheckBox.isChecked()
+    widget.telemetryCheckBox.setChecked(False)
+    assert not telemetry.enabled
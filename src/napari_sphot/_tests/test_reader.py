@@ -0,0 +1,87 @@
+import numpy as np
+import tifffile
+
+from napari_sphot._reader import napari_get_reader
+from napari_sphot.image import TiffFileTags, TiffMetadataIndex
+
+
+def write_stack(path, compression=None):
+    data = np.arange(4 * 6 * 5, dtype=np.uint16).reshape(4, 6, 5)
+    tifffile.imwrite(
+        path,
+        data,
+        imagej=compression is None,
+        compression=compression,
+        resolution=(1 / 0.2, 1 / 0.2),
+        metadata={"unit": "micron", "spacing": 0.5, "axes": "ZYX"},
+    )
+    return data
+
+
+def test_reader_memory_maps_uncompressed_stack(tmp_path):
+    path = str(tmp_path / "spots.tif")
+    data = write_stack(path)
+    assert napari_get_reader(str(tmp_path / "spots.csv")) is None
+    reader = napari_get_reader(path)
+    layerData, attributes, layerType = reader(path)[0]
+    assert isinstance(layerData, np.memmap)
+    assert np.array_equal(layerData, data)
+    assert layerType == "image"
+    assert attributes["name"] == "spots"
+    assert np.allclose(attributes["scale"], (0.5, 0.2, 0.2))
+    assert attributes["units"] == ("µm",) * 3
+
+
+def test_reader_loads_compressed_stack(tmp_path):
+    path = str(tmp_path / "nuclei.tif")
+    data = write_stack(path, compression="zlib")
+    layerData, _, _ = napari_get_reader([path])([path])[0]
+    assert not isinstance(layerData, np.memmap)
+    assert np.array_equal(layerData, data)
+
+
+def test_index_does_not_reopen_unchanged_files(tmp_path, monkeypatch):
+    path = str(tmp_path / "spots.tif")
+    write_stack(path)
+    assert TiffMetadataIndex(str(tmp_path)).update() == ["spots.tif"]
+
+    def fail(path):
+        raise AssertionError("the file has been reopened")
+
+    monkeypatch.setattr(TiffMetadataIndex, "readEntry", staticmethod(fail))
+    index = TiffMetadataIndex(str(tmp_path))
+    entry = index.get(path)
+    assert entry["shape"] == [4, 6, 5]
+    assert entry["dtype"] == "uint16"
+    tags = TiffFileTags(path, index)
+    tags.getPixelSizeAndUnit()
+    assert np.isclose(tags.pixelSize, 0.2)
+    assert tags.unit == "µm"
+
+
+def test_reader_ignores_resolution_without_length_unit(tmp_path):
+    path = str(tmp_path / "scan.tif")
+    tifffile.imwrite(
+        path,
+        np.zeros((4, 6, 5), dtype=np.uint8),
+        photometric="minisblack",
+        resolution=(72, 72),
+    )
+    _, attributes, _ = napari_get_reader(path)(path)[0]
+    assert "scale" not in attributes
+    assert "units" not in attributes
+
+
+def test_reader_scales_spatial_axes_of_rgb_image(tmp_path):
+    path = str(tmp_path / "cells.tif")
+    tifffile.imwrite(
+        path,
+        np.zeros((6, 5, 3), dtype=np.uint8),
+        photometric="rgb",
+        resolution=(1 / 0.2, 1 / 0.2),
+        description="unit=micron",
+    )
+    _, attributes, _ = napari_get_reader(path)(path)[0]
+    assert attributes["rgb"]
+    assert np.allclose(attributes["scale"], (0.2, 0.2))
+    assert attributes["units"] == ("µm",) * 2
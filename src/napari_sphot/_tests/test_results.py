@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+
+from napari_sphot.results import ResultsWriter
+
+
+def test_results_writer(tmp_path):
+    table = {"radius": np.arange(4), "ncc": np.linspace(1, 0, 4)}
+    writer = ResultsWriter("csv")
+    writer.add("corr.: a-b", table)
+    writer.add("corr.: a-c", table)
+    writer.flush(str(tmp_path), "corr.: all-pairs")
+    writer.join()
+    assert sorted(os.listdir(tmp_path)) == ["corr._a-b.csv", "corr._a-c.csv"]
+    data = np.loadtxt(tmp_path / "corr._a-b.csv", delimiter=",", skiprows=1)
+    assert np.allclose(data[:, 1], table["ncc"])
+    writer = ResultsWriter("npz")
+    writer.add("corr.: a-b", table)
+    writer.add("corr.: a-c", table)
+    writer.flush(str(tmp_path / "out"), "corr.: all-pairs")
+    writer.join()
+    archive = np.load(tmp_path / "out" / "corr._all-pairs.npz")
+    assert np.allclose(archive["corr.: a-c/ncc"], table["ncc"])
+
+
+def test_get_output_folder():
+    path = os.path.join("data", "embryo.tif")
+    assert ResultsWriter.getOutputFolder(path) == os.path.join(
+        "data", "embryo_results"
+    )
+    assert ResultsWriter.getOutputFolder(path, "out") == "out"
+    assert ResultsWriter.getOutputFolder(None, "", "fallback") == "fallback"
+
+
+def test_close_writes_remaining_batches(tmp_path):
+    writer = ResultsWriter("csv")
+    errors = []
+    writer.errorCallback = errors.append
+    for index in range(5):
+        writer.add("table " + str(index), {"radius": np.arange(3)})
+        writer.flush(str(tmp_path), "tables")
+    writer.add("no folder", {"radius": np.arange(3)})
+    writer.flush(str(tmp_path / "table_0.csv"), "tables")
+    writer.close()
+    assert not writer.thread.is_alive()
+    assert len(os.listdir(tmp_path)) == 5
+    assert len(errors) == 1
+    writer.close()
+
+
+def test_writer_survives_errors_of_a_batch(tmp_path):
+    writer = ResultsWriter("csv")
+    errors = []
+    writer.errorCallback = errors.append
+    writer.add("ragged", {"radius": np.arange(3), "ncc": np.arange(2)})
+    writer.flush(str(tmp_path), "tables")
+    writer.add("profile", {"radius": np.arange(3)})
+    writer.flush(str(tmp_path), "tables")
+    writer.close()
+    assert len(errors) == 1
+    assert isinstance(errors[0], ValueError)
+    assert os.listdir(tmp_path) == ["profile.csv"]
@@ -5,3 +5,13 @@
 
 def test_something():
     pass
+
+
+def test_make_synthetic_sample_data():
+    from napari_sphot._sample_data import make_synthetic_sample_data
+    layers = make_synthetic_sample_data()
+    assert [layer[1]['name'] for layer in layers] == ['synthetic nuclei', 'synthetic spots', 'synthetic labels',
+                                                      'synthetic points']
+    assert layers[2][2] == "labels"
+    assert layers[3][2] == "points"
+    assert layers[0][0].shape == layers[2][0].shape
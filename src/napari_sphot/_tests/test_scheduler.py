@@ -0,0 +1,245 @@
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from napari_sphot import scheduler
+from napari_sphot.processes import ProcessBackend
+from napari_sphot.progress import Total
+from napari_sphot.scheduler import Job, TaskScheduler
+from napari_sphot.telemetry import Telemetry
+
+
+class Signal:
+
+    def __init__(self):
+        self.callbacks = []
+
+    def connect(self, callback):
+        self.callbacks.append(callback)
+
+    def emit(self, *args):
+        for callback in self.callbacks:
+            callback(*args)
+
+
+class ManualWorker:
+    """A worker that only finishes when the test tells it to."""
+
+    def __init__(self, function, _progress=None):
+        self.function = function
+        self.started = False
+        self.quitRequested = False
+        self.yielded = Signal()
+        self.returned = Signal()
+        self.errored = Signal()
+        self.finished = Signal()
+
+    def start(self):
+        self.started = True
+
+    def quit(self):
+        self.quitRequested = True
+
+    def finish(self, error=None):
+        if error is None:
+            self.returned.emit(None)
+        else:
+            self.errored.emit(error)
+        self.finished.emit()
+
+
+class Owner:
+
+    def __init__(self):
+        self.layer = None
+        self.task = None
+        self.finished = []
+
+    def onFinished(self):
+        self.finished.append((self.layer, self.task))
+
+
+class Task:
+
+    def run(self):
+        yield
+
+
+def get_scheduler(monkeypatch, maxCpuJobs=1):
+    monkeypatch.setattr(scheduler, "create_worker", ManualWorker)
+    return TaskScheduler(
+        maxCpuJobs=maxCpuJobs,
+        maxIoJobs=1,
+        telemetry=Telemetry(path=os.devnull),
+    )
+
+
+def test_limits_priorities_and_groups(monkeypatch):
+    aScheduler = get_scheduler(monkeypatch, maxCpuJobs=2)
+    first = aScheduler.submit(Task().run, "first", group="segmentation")
+    second = aScheduler.submit(Task().run, "second", group="segmentation")
+    third = aScheduler.submit(Task().run, "third")
+    low = aScheduler.submit(Task().run, "low")
+    high = aScheduler.submit(Task().run, "high", priority=5)
+    export = aScheduler.submit(Task().run, "export", kind=TaskScheduler.IO)
+    assert [job.state for job in (first, second, third, export)] == [
+        Job.RUNNING,
+        Job.QUEUED,
+        Job.RUNNING,
+        Job.RUNNING,
+    ]
+    assert aScheduler.getQueuedJobs() == [high, second, low]
+    third.worker.finish()
+    assert high.state == Job.RUNNING
+    assert second.state == Job.QUEUED
+    first.worker.finish()
+    assert second.state == Job.RUNNING
+    assert low.state == Job.QUEUED
+
+
+def test_cancel_queued_and_running_jobs(monkeypatch):
+    aScheduler = get_scheduler(monkeypatch)
+    owner = Owner()
+    running = aScheduler.submit(
+        Task().run, "running", onFinished=owner.onFinished
+    )
+    queued = aScheduler.submit(
+        Task().run, "queued", onFinished=owner.onFinished
+    )
+    aScheduler.cancel(queued)
+    aScheduler.cancel(running)
+    assert queued.state == Job.CANCELLED
+    assert running.worker.quitRequested
+    running.worker.finish()
+    assert running.state == Job.CANCELLED
+    assert queued.worker is None
+    assert owner.finished == []
+
+
+def test_failed_job(monkeypatch):
+    aScheduler = get_scheduler(monkeypatch)
+    owner = Owner()
+    job = aScheduler.submit(Task().run, "failing", onFinished=owner.onFinished)
+    job.worker.finish(ValueError("no spots"))
+    assert job.state == Job.FAILED
+    assert owner.finished == []
+
+
+def test_context_is_restored_for_each_job(monkeypatch):
+    aScheduler = get_scheduler(monkeypatch, maxCpuJobs=2)
+    owner = Owner()
+    owner.layer, owner.task = "nuclei", Task()
+    firstTask = owner.task
+    first = aScheduler.submit(
+        owner.task.run,
+        "first",
+        onFinished=owner.onFinished,
+        owner=owner,
+        context=TaskScheduler.getContext(owner, owner.task.run, ["layer"]),
+    )
+    owner.layer, owner.task = "spots", Task()
+    second = aScheduler.submit(
+        owner.task.run,
+        "second",
+        onFinished=owner.onFinished,
+        owner=owner,
+        context=TaskScheduler.getContext(owner, owner.task.run, ["layer"]),
+    )
+    first.worker.finish()
+    second.worker.finish()
+    assert owner.finished == [("nuclei", firstTask), ("spots", second.task)]
+
+
+def test_finished_jobs_are_measured(monkeypatch):
+    aScheduler = get_scheduler(monkeypatch)
+    task = Task()
+    task.spots = [(1, 2, 3), (4, 5, 6)]
+    job = aScheduler.submit(task.run, "measured")
+    list(job.worker.function())
+    job.worker.finish()
+    record = aScheduler.telemetry.records[-1]
+    assert record["job"] == "measured"
+    assert record["state"] == Job.FINISHED
+    assert record["task"] == "Task"
+    assert record["spots"] == 2
+    assert record["wall_time_s"] >= 0
+
+
+def test_total_yielded_by_job(monkeypatch):
+    aScheduler = get_scheduler(monkeypatch)
+    job = aScheduler.submit(Task().run, "counting")
+    assert job.total is None
+    job.worker.yielded.emit(Total(3))
+    job.worker.yielded.emit(None)
+    assert job.total == 3
+    assert job.progress == 1
+
+
+class SlowTask:
+
+    def __init__(self):
+        self.image = np.zeros((64, 64, 64), dtype=np.float32)
+        self.steps = 0
+
+    def run(self):
+        for _ in range(1000):
+            time.sleep(0.05)
+            self.steps = self.steps + 1
+            yield
+
+
+def test_cancel_process_job_stops_worker_process(qtbot, monkeypatch):
+    backend = ProcessBackend(nrOfWorkers=1)
+    monkeypatch.setattr(ProcessBackend, "instance", backend)
+    aScheduler = TaskScheduler(
+        maxCpuJobs=1, telemetry=Telemetry(path=os.devnull)
+    )
+    try:
+        job = aScheduler.submit(
+            SlowTask().run, "slow", kind=TaskScheduler.PROCESS
+        )
+        qtbot.waitUntil(lambda: job.progress > 0, timeout=30000)
+        run = backend.runs[job.runId]
+        names = [block.name for block in run["blocks"]]
+        assert names
+        aScheduler.cancel(job)
+        qtbot.waitUntil(lambda: job.state == Job.CANCELLED, timeout=5000)
+        qtbot.waitUntil(run["future"].done, timeout=5000)
+        assert job.runId not in backend.runs
+        for name in names:
+            with pytest.raises(FileNotFoundError):
+                shared_memory.SharedMemory(name=name)
+    finally:
+        backend.shutdown()
+
+
+def test_done_callback_is_called_in_every_final_state(monkeypatch):
+    aScheduler = get_scheduler(monkeypatch)
+    done = []
+    finished = aScheduler.submit(
+        Task().run, "finished", onDone=lambda: done.append("finished")
+    )
+    failed = aScheduler.submit(
+        Task().run, "failed", onDone=lambda: done.append("failed")
+    )
+    running = aScheduler.submit(
+        Task().run, "running", onDone=lambda: done.append("running")
+    )
+    queued = aScheduler.submit(
+        Task().run, "queued", onDone=lambda: done.append("queued")
+    )
+    finished.worker.finish()
+    failed.worker.finish(ValueError("no labels"))
+    aScheduler.cancel(queued)
+    aScheduler.cancel(running)
+    running.worker.finish()
+    assert done == ["finished", "failed", "queued", "running"]
+    assert [job.state for job in (finished, failed, running, queued)] == [
+        Job.FINISHED,
+        Job.FAILED,
+        Job.CANCELLED,
+        Job.CANCELLED,
+    ]
@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+
+from napari_sphot.segmentation import ResampledSegmentation, TiledSegmentation
+
+
+def test_each_run_gets_a_new_output_file(tmp_path):
+    first = TiledSegmentation.getNewOutputPath(str(tmp_path), "embryo")
+    second = TiledSegmentation.getNewOutputPath(str(tmp_path), "embryo")
+    assert first != second
+    assert os.path.basename(first).startswith("embryo_labels_")
+    assert first.endswith(".npy")
+    assert os.path.exists(first)
+
+
+def test_get_tiles_cover_image():
+    segmentation = TiledSegmentation(np.zeros((20, 100, 70)), None)
+    segmentation.tileSize = (16, 40, 40)
+    segmentation.overlap = (4, 10, 10)
+    covered = np.zeros((20, 100, 70), dtype=int)
+    for tile in segmentation.getTiles():
+        covered[tile] += 1
+        assert covered[tile].shape == (16, 40, 40)
+    assert np.all(covered > 0)
+
+
+def test_stitch_tiles(tmp_path):
+    truth = np.zeros((10, 10, 60), dtype=np.uint32)
+    truth[2:8, 2:8, 5:15] = 1
+    truth[2:8, 2:8, 25:40] = 2
+    truth[2:8, 2:8, 50:58] = 3
+    segmentation = TiledSegmentation(truth, str(tmp_path / "labels.npy"))
+    segmentation.labels = np.lib.format.open_memmap(
+        segmentation.outputPath, mode="w+", dtype=np.uint32, shape=truth.shape
+    )
+    left = (slice(0, 10), slice(0, 10), slice(0, 35))
+    right = (slice(0, 10), slice(0, 10), slice(30, 60))
+    segmentation.stitch(left, np.where(truth[left] > 0, truth[left] + 4, 0))
+    segmentation.stitch(
+        right,
+        np.where(truth[right] == 2, 1, np.where(truth[right] == 3, 2, 0)),
+    )
+    assert segmentation.nrOfLabels == 3
+    labels = np.asarray(segmentation.labels)
+    assert np.array_equal(np.unique(labels[truth == 2]), [2])
+    assert np.array_equal(np.unique(labels[truth == 3]), [3])
+    assert np.array_equal(labels > 0, truth > 0)
+    segmentation.minSize = 300
+    segmentation.chunkSize = 4
+    steps = len(list(segmentation.postProcess()))
+    assert (
+        steps
+        == segmentation.getNrOfSteps() - len(segmentation.getTiles())
+        == 6
+    )
+    assert np.array_equal(np.unique(segmentation.labels), [0, 1, 2])
+
+
+def test_resampled_segmentation_upsample():
+    grids = np.ogrid[0:20, 0:80, 0:80]
+    truth = (
+        ((grids[0] - 10) * 3) ** 2
+        + (grids[1] - 40) ** 2
+        + (grids[2] - 40) ** 2
+        < 30**2
+    ).astype(np.uint16)
+    segmentation = ResampledSegmentation(truth, (0.3, 0.1, 0.1))
+    segmentation.scaleFactor = 0.25
+    assert np.allclose(segmentation.getZoom(), (0.75, 0.25, 0.25))
+    small = truth[1::2, 2::4, 2::4]
+    errors = {}
+    for mode in ResampledSegmentation.upsamplingModes:
+        segmentation.upsampling = mode
+        labels = segmentation.upsample(small, truth.shape)
+        assert labels.shape == truth.shape
+        errors[mode] = np.sum(labels != truth)
+    assert errors["refine"] < errors["nearest"] < 0.15 * truth.sum()
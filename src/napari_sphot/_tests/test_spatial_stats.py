@@ -0,0 +1,152 @@
+import numpy as np
+from scipy.spatial.distance import pdist
+
+from napari_sphot.spatial_stats import (
+    CrossTypeTask,
+    EcdfResult,
+    ExactFFunctionTask,
+    HeterogeneityTask,
+    HistogramHFunctionTask,
+    RipleyTask,
+)
+
+
+def get_ellipsoid(shape, label=1):
+    grids = np.ogrid[tuple(slice(0, size) for size in shape)]
+    distance = sum(
+        ((grid - (size - 1) / 2) / (size / 2 - 1)) ** 2
+        for grid, size in zip(grids, shape, strict=False)
+    )
+    labels = np.zeros(shape, dtype=np.uint8)
+    labels[distance < 1] = label
+    return labels
+
+
+def get_random_spots(labels, label, nrOfSpots, seed=0):
+    rng = np.random.default_rng(seed)
+    voxels = np.argwhere(labels == label)
+    return voxels[rng.choice(len(voxels), nrOfSpots)] + rng.random(
+        (nrOfSpots, 3)
+    )
+
+
+def test_ripley_task_csr():
+    labels = get_ellipsoid((30, 50, 50), 3)
+    spots = get_random_spots(labels, 3, 2000)
+    task = RipleyTask(spots, labels, (2, 1, 1), "nm", 3)
+    task.nrOfSimulations = 10
+    task.seed = 1
+    for _ in task.run():
+        pass
+    assert np.allclose(task.l[10:], task.radii[10:], rtol=0.05)
+    assert np.allclose(task.g[10:], 1, atol=0.15)
+    assert len(task.envelop) == 4
+
+
+def test_exact_f_function_task():
+    labels = np.zeros((10, 20, 20), dtype=np.uint8)
+    labels[:, :, :10] = 1
+    labels[:, :, 10:] = 2
+    spots = np.array([[5, 5, 5], [5, 5, 15]], dtype=float)
+    task = ExactFFunctionTask(spots, labels, (2, 1, 1), "nm", 1)
+    task.nrOfSimulations = 5
+    task.seed = 0
+    for _ in task.run():
+        pass
+    assert len(task.distances) == 10 * 20 * 10
+    assert task.distances[0] == 0
+    expected = np.sqrt((5 * 2) ** 2 + 14**2 + 5**2)
+    assert np.isclose(task.distances[-1], expected)
+    assert np.isclose(task.result.observed[-1], 1)
+    assert np.all(np.diff(task.result.observed) >= 0)
+    assert len(task.result.envelop[0]) == len(task.result.xValues)
+
+
+def test_histogram_h_function_task():
+    rng = np.random.default_rng(0)
+    labels = np.ones((10, 30, 30), dtype=np.uint8)
+    spots = rng.random((300, 3)) * (10, 30, 30)
+    task = HistogramHFunctionTask(spots, labels, (2, 1, 1), "nm", 1)
+    task.nrOfSimulations = 3
+    task.maxBlockSize = 1000
+    for _ in task.run():
+        pass
+    distances = pdist(spots * (2, 1, 1))
+    assert task.histogram.sum() == len(distances)
+    assert np.isclose(task.maxDistance, distances.max())
+    result = task.result
+    assert np.isclose(
+        result.observed[50],
+        np.mean(distances <= result.xValues[50]),
+        atol=1e-3,
+    )
+    assert np.allclose(result.values[:, -1], 1)
+    assert len(result.envelop[3]) == len(result.xValues)
+
+
+def test_cross_type_task():
+    rng = np.random.default_rng(0)
+    labels = np.ones((20, 40, 40), dtype=np.uint8)
+    spotsA = rng.random((200, 3)) * (20, 40, 40)
+    spotsB = np.clip(
+        spotsA + rng.normal(0, 0.5, spotsA.shape),
+        0,
+        np.array([20, 40, 40]) - 0.01,
+    )
+    task = CrossTypeTask(spotsA, spotsB, labels, (1, 1, 1), "nm", 1)
+    task.nrOfPermutations = 20
+    task.seed = 0
+    for _ in task.run():
+        pass
+    assert (
+        len(task.result.observed)
+        == len(task.result.xValues)
+        == len(task.result.envelop[0])
+    )
+    assert len(task.k) == len(task.radii) == len(task.kEnvelop[0])
+    assert task.pValue < 0.1
+    assert task.table["label"] == [1]
+
+
+def test_ecdf_result_from_samples():
+    rng = np.random.default_rng(0)
+    observed = rng.random(50) * 10
+    simulated = [rng.random(40) * 10 for _ in range(5)]
+    result = EcdfResult.fromSamples("G", 3, observed, simulated, step=0.5)
+    expected = [
+        np.mean(samples[:, None] <= result.xValues, axis=0)
+        for samples in [observed] + simulated
+    ]
+    assert np.allclose(result.values, expected)
+    assert np.allclose(result.envelop[0], np.min(expected[1:], axis=0))
+    summary = result.getSummary()
+    assert summary["label"] == [3]
+    assert 0 <= summary["G_outside_envelop"][0] <= 1
+
+
+def test_heterogeneity_task():
+    rng = np.random.default_rng(0)
+    labels = np.zeros((40, 40, 80), dtype=np.uint8)
+    labels[:, :, :40] = 1
+    labels[:, :, 40:] = 2
+    random = rng.random((2000, 3)) * 40
+    centers = rng.random((10, 3)) * 30 + 5
+    clustered = (
+        centers[rng.integers(10, size=2000)]
+        + rng.normal(0, 1, (2000, 3))
+        + (0, 0, 40)
+    )
+    spots = np.concatenate((random, np.clip(clustered, 0, 79.9)))
+    task = HeterogeneityTask(spots, labels, (1, 1, 1), "nm")
+    task.quadratSize = 5
+    for _ in task.run():
+        pass
+    table = task.table
+    assert list(table["label"]) == [1, 2]
+    assert list(table["nr_of_quadrats"]) == [512, 512]
+    assert 0.8 < table["quadrat_dispersion"][0] < 1.2
+    assert 0.9 < table["morisita_index"][0] < 1.1
+    assert 0.9 < table["clark_evans_ratio"][0] < 1.15
+    assert table["quadrat_dispersion"][1] > 5
+    assert table["morisita_index"][1] > 5
+    assert table["clark_evans_ratio"][1] < 0.7
@@ -0,0 +1,16 @@
+import numpy as np
+
+from napari_sphot.spots_util import SpotsPerCellTask
+
+
+def test_spots_per_cell_task():
+    labels = np.zeros((4, 10, 10), dtype=np.uint16)
+    labels[:, :5, :] = 2
+    labels[:, 5:, :5] = 5
+    spots = np.array([[0, 0, 0], [1, 2, 3], [3, 4, 9], [2, 7, 2], [2, 7, 7]])
+    task = SpotsPerCellTask(spots, labels, (2, 0.5, 0.5))
+    task.run()
+    assert list(task.table["label"]) == [2, 5]
+    assert list(task.table["nr_of_spots"]) == [3, 1]
+    assert np.allclose(task.table["volume"], [200 * 0.5, 100 * 0.5])
+    assert np.allclose(task.table["spot_density"], [0.03, 0.02])
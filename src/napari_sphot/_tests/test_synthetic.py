@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from napari_sphot.synthetic import SyntheticEmbryo
+
+
+def test_embryo_is_deterministic():
+    embryo = SyntheticEmbryo.ofSize("small", seed=3)
+    embryo.run()
+    other = SyntheticEmbryo.ofSize("small", seed=3)
+    other.run()
+    assert np.array_equal(embryo.labels, other.labels)
+    assert np.array_equal(embryo.spots, other.spots)
+    assert np.array_equal(embryo.image, other.image)
+    different = SyntheticEmbryo.ofSize("small", seed=4)
+    different.run()
+    assert not np.array_equal(embryo.spots, different.spots)
+
+
+def test_spots_are_in_nuclei():
+    embryo = SyntheticEmbryo(shape=(16, 64, 64), nrOfNuclei=3)
+    embryo.nucleusRadius = (5, 12, 12)
+    embryo.nrOfRandomSpots = 50
+    embryo.nrOfClusters = 4
+    embryo.run()
+    assert embryo.labels.shape == (16, 64, 64)
+    assert set(np.unique(embryo.labels)) <= {0, 1, 2, 3}
+    assert len(embryo.randomSpots) == 50
+    assert 0 < len(embryo.clusteredSpots) <= 4 * embryo.spotsPerCluster
+    assert np.all(embryo.labels[tuple(embryo.spots.astype(np.int64).T)] > 0)
+    assert embryo.image.dtype == np.uint16
+    assert (
+        embryo.image.shape == embryo.nucleiImage.shape == embryo.labels.shape
+    )
+    assert (
+        embryo.nucleiImage[embryo.labels > 0].mean()
+        > embryo.nucleiImage[embryo.labels == 0].mean()
+    )
+
+
+def test_unknown_size():
+    with pytest.raises(ValueError):
+        SyntheticEmbryo.ofSize("huge")
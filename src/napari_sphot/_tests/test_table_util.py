@@ -0,0 +1,25 @@
+import numpy as np
+
+from napari_sphot.table_util import TableUtil
+
+
+def test_merge_rows():
+    measurements = {
+        "image": ["a.tif", "a.tif"],
+        "label": [1, 2],
+        "volume": [10, 20],
+    }
+    table = {
+        "image": ["a.tif", "a.tif"],
+        "label": [np.int64(2), 3],
+        "hull_volume": [2.5, 3.5],
+    }
+    TableUtil.mergeRows(table, measurements)
+    assert measurements["label"] == [1, 2, 3]
+    assert measurements["volume"][:2] == [10, 20]
+    assert np.isnan(measurements["volume"][2])
+    assert np.isnan(measurements["hull_volume"][0])
+    assert measurements["hull_volume"][1:] == [2.5, 3.5]
+    empty = {}
+    TableUtil.mergeRows(table, empty)
+    assert empty["hull_volume"] == [2.5, 3.5]
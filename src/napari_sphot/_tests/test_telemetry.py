@@ -0,0 +1,108 @@
+import json
+
+import appdirs
+import numpy as np
+import pytest
+
+from napari_sphot.telemetry import Measurement, Telemetry, getRSS, resetPeakRSS
+
+
+class LabelsTask:
+
+    def __init__(self, image, labels):
+        self.image = image
+        self.labels = labels
+
+    def run(self):
+        for _ in range(3):
+            yield
+        return self.labels.max()
+
+    def measure(self):
+        return int(self.image.sum())
+
+
+def test_measure_generator_function():
+    labels = np.zeros((4, 10, 10), dtype=np.uint16)
+    labels[1, 2:5, 2:5] = 7
+    task = LabelsTask(np.ones((4, 10, 10)), labels)
+    measurement = Measurement(task)
+    steps = measurement.wrap(task.run)()
+    assert len(list(steps)) == 3
+    record = measurement.getRecord(job="labels")
+    assert record["job"] == "labels"
+    assert record["task"] == "LabelsTask"
+    assert record["voxels"] == 400
+    assert record["labels"] == 7
+    assert record["spots"] is None
+    assert record["wall_time_s"] >= 0
+    assert record["cpu_time_s"] >= 0
+
+
+def test_measure_function():
+    task = LabelsTask(np.ones((2, 3, 4)), None)
+    measurement = Measurement(task)
+    assert measurement.wrap(task.measure)() == 24
+    assert measurement.wallTime is not None
+    assert measurement.voxels == 24
+
+
+def test_records_are_appended_to_log(tmp_path):
+    path = tmp_path / "logs" / "performance.jsonl"
+    telemetry = Telemetry(path=str(path))
+    received = []
+    telemetry.listeners.append(received.append)
+    telemetry.add({"job": "first", "wall_time_s": 1.5})
+    telemetry.add({"job": "second", "wall_time_s": 0.5})
+    lines = path.read_text().splitlines()
+    assert [json.loads(line)["job"] for line in lines] == ["first", "second"]
+    assert [record["job"] for record in received] == ["first", "second"]
+    assert len(telemetry.records) == 2
+
+
+@pytest.mark.skipif(
+    getRSS() is None, reason="the resident set size is only read on Linux"
+)
+def test_peak_memory_is_increase_during_run():
+    resetPeakRSS()
+    allocating = Measurement()
+    allocating.wrap(lambda: np.ones(64 * 1024 * 1024 // 8).sum())()
+    idle = Measurement()
+    idle.wrap(lambda: None)()
+    assert allocating.peakRSS >= 48
+    assert idle.peakRSS < 48
+    assert allocating.getRecord()["peak_rss_increase_mb"] == round(
+        allocating.peakRSS, 3
+    )
+
+
+def test_disabled_telemetry_is_remembered(tmp_path, monkeypatch):
+    monkeypatch.setattr(appdirs, "user_data_dir", lambda name: str(tmp_path))
+    monkeypatch.setattr(Telemetry, "instance", None)
+    telemetry = Telemetry.getInstance()
+    assert telemetry.enabled
+    telemetry.setEnabled(False)
+    telemetry.add({"job": "ignored"})
+    assert telemetry.records == []
+    monkeypatch.setattr(Telemetry, "instance", None)
+    assert not Telemetry.getInstance().enabled
+
+
+def test_labels_of_large_or_mapped_volumes_are_not_counted(
+    tmp_path, monkeypatch
+):
+    labels = np.lib.format.open_memmap(
+        str(tmp_path / "labels.npy"),
+        mode="w+",
+        dtype=np.uint16,
+        shape=(4, 10, 10),
+    )
+    labels[0, 0, 0] = 3
+    measurement = Measurement(LabelsTask(np.ones((4, 10, 10)), labels))
+    measurement.readInputSizes()
+    assert measurement.voxels == 400
+    assert measurement.labels is None
+    monkeypatch.setattr(Measurement, "maxScannedLabelVoxels", 100)
+    measurement = Measurement(LabelsTask(None, np.array(labels)))
+    measurement.readInputSizes()
+    assert measurement.labels is None
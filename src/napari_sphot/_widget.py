@@ -2,20 +2,21 @@ from typing import TYPE_CHECKING
 import math
 import numpy as np
 import os
+import tempfile
 from pathlib import Path
 from napari.utils import notifications
 from napari_bigfish.bigfishapp import BigfishApp
 from sphot.filter import MedianFilter
 from qtpy.QtGui import QIcon
+from qtpy.QtCore import QTimer, Signal
 from qtpy.QtWidgets import QVBoxLayout, QHBoxLayout, QPushButton, QWidget, QGroupBox, QCheckBox
 from qtpy.QtWidgets import QFormLayout
 from napari.layers import Image
 from napari.layers import Labels
 from napari.utils.events import Event
-from napari.qt.threading import create_worker
+from napari_sphot.scheduler import TaskScheduler
 from sphot.image import Segmentation
 from sphot.image import SpotDetection
-from sphot.image import DecomposeDenseRegions
 from sphot.image import Correlator
 from sphot.image import FFunctionTask
 from sphot.image import GFunctionTask
@@ -30,10 +31,34 @@ from sphot.image import DensityByRadiusTask
 from sphot.image import DensityAlongAxisTask
 from sphot.measure import TableTool
 from napari_sphot.qtutil import WidgetTool
-from napari_sphot.qtutil import PlotWidget
+from napari_sphot.qtutil import PlotManager
 from napari_sphot.napari_util import NapariUtil
 from napari_sphot.qtutil import TableView
+from napari_sphot.qtutil import JobQueueWidget
+from napari_sphot.qtutil import PerformanceWidget
 from napari_sphot.options import Options
+from napari_sphot.correlation import MultiChannelCorrelator
+from napari_sphot.correlation import LocalCorrelator
+from napari_sphot.results import ResultsWriter
+from napari_sphot.geometry import TessellationUtil
+from napari_sphot.geometry import GeometryMetricsTask
+from napari_sphot.table_util import TableUtil
+from napari_sphot.spatial_stats import RipleyTask
+from napari_sphot.spatial_stats import ExactFFunctionTask
+from napari_sphot.spatial_stats import HistogramHFunctionTask
+from napari_sphot.spatial_stats import CrossTypeTask
+from napari_sphot.spatial_stats import EcdfResult
+from napari_sphot.spatial_stats import HeterogeneityTask
+from napari_sphot.centroid import CentroidProfilesTask
+from napari_sphot.spots_util import SpotsPerCellTask
+from napari_sphot.spots_util import SpotsUtil
+from napari_sphot.curation import DirtyLabelsTracker
+from napari_sphot.curation import RemeasureTask
+from napari_sphot.segmentation import TiledSegmentation
+from napari_sphot.segmentation import ResampledSegmentation
+from napari_sphot.label_filter import LabelFilterTask
+from napari_sphot.detection import RoiSpotDetectionTask
+from napari_sphot.detection import ParallelDecomposeDenseRegions
 if TYPE_CHECKING:
     import napari
 
@@ -53,16 +78,31 @@ class DistanceFromCentroidWidget(QWidget):
         self.labelLayers = self.napariUtil.getLabelLayers()
         self.spotsCombo = None
         self.labelsCombo = None
+        self.layer = None
+        self.scheduler = TaskScheduler.getInstance()
         self.distancesFromCentroidTask = None
         self.densityByRadiusTask = None
         self.densityAlongAxisTask = None
+        self.centroidProfilesTask = None
+        self.allCellsCheckbox = None
         self.distancesTableDockWidget = None
+        self.profilesTableDockWidget = None
         self.distancesMeasurements = {}
         self.distancesStatisticsMeasurements = {}
         self.distancesTable = TableView(self.distancesMeasurements)
+        self.plotManager = PlotManager(self.viewer)
         self.createLayout()
         self.viewer.layers.events.inserted.connect(self.onLayerAddedOrRemoved)
         self.viewer.layers.events.removed.connect(self.onLayerAddedOrRemoved)
+        self.destroyed.connect(lambda: self.plotManager.closeAll(removeDocks=False))
+
+
+    def submitJob(self, function, description, onFinished=None, total=None, **kwargs):
+        """Submit the function as a job to the scheduler. The input layer and
+        the task of the job are restored before onFinished is called.
+        """
+        return self.scheduler.submit(function, description, onFinished=onFinished, total=total, owner=self,
+                                     context=TaskScheduler.getContext(self, function, ['layer']), **kwargs)
 
 
     def createLayout(self):
@@ -100,8 +140,10 @@ class DistanceFromCentroidWidget(QWidget):
                                                                       self.labelOfNucleus,
                                                                       self.fieldWidth,
                                                                       self.selectedCellInputChanged)
+        self.allCellsCheckbox = QCheckBox("All cells")
         cellSelectionLayout.addWidget(cellLabel)
         cellSelectionLayout.addWidget(self.selectedCellInput)
+        cellSelectionLayout.addWidget(self.allCellsCheckbox)
 
         distancesButton = QPushButton("Distances")
         distancesButton.clicked.connect(self._onDistancesButtonClicked)
@@ -146,6 +188,9 @@ class DistanceFromCentroidWidget(QWidget):
 
 
     def _onDistancesButtonClicked(self):
+        if self.allCellsCheckbox.isChecked():
+            self.runCentroidProfilesTask()
+            return
         label = int(self.selectedCellInput.text().strip())
         if not label:
             return
@@ -157,18 +202,19 @@ class DistanceFromCentroidWidget(QWidget):
         labels = self.napariUtil.getDataOfLayerWithName(text)
 
         self.distancesFromCentroidTask = DistancesFromCentroidTask(labels, spots, scale, unit)
-        worker = create_worker(self.distancesFromCentroidTask.run,
-                               _progress={'desc': 'Calculating Distances from Centroid...'}
-                               )
-        worker.finished.connect(self.onDistancesFromCentroidTaskFinished)
-        worker.start()
+        self.submitJob(self.distancesFromCentroidTask.run, 'Calculating Distances from Centroid...',
+                       onFinished=self.onDistancesFromCentroidTaskFinished)
 
 
     def onDistancesFromCentroidTaskFinished(self):
-        self.distancesMeasurements.clear()
         newTable = {}
         for key, value in self.distancesFromCentroidTask.table.items():
             newTable[str(key)] = value
+        self.showDistances(newTable)
+
+
+    def showDistances(self, newTable):
+        self.distancesMeasurements.clear()
         if self.distancesTableDockWidget:
             self.distancesTableDockWidget.close()
         TableTool.addColumnsTableAToB(newTable, self.distancesMeasurements)
@@ -179,7 +225,32 @@ class DistanceFromCentroidWidget(QWidget):
                                                                   tabify=True)
 
 
+    def runCentroidProfilesTask(self):
+        text = self.spotsCombo.currentText()
+        spots, scale, unit = self.napariUtil.getDataAndScaleOfLayerWithName(text)
+        text = self.labelsCombo.currentText()
+        self.layer = self.napariUtil.getLayerWithName(text)
+        labels = self.napariUtil.getDataOfLayerWithName(text)
+        self.centroidProfilesTask = CentroidProfilesTask(labels, spots, scale, unit)
+        self.submitJob(self.centroidProfilesTask.run, 'Calculating Distances and Densities of all cells...',
+                       onFinished=self.onCentroidProfilesTaskFinished,
+                       total=labels.shape[0])
+
+
+    def onCentroidProfilesTaskFinished(self):
+        self.showDistances(self.centroidProfilesTask.distancesTable)
+        if self.profilesTableDockWidget:
+            self.profilesTableDockWidget.close()
+        self.profilesTableDockWidget = self.viewer.window.add_dock_widget(TableView(self.centroidProfilesTask.table),
+                                                                        area='left',
+                                                                        name='Density Profiles',
+                                                                        tabify=True)
+
+
     def _onDensityButtonClicked(self):
+        if self.allCellsCheckbox.isChecked():
+            self.runCentroidProfilesTask()
+            return
         label = int(self.selectedCellInput.text().strip())
         if not label:
             return
@@ -191,15 +262,12 @@ class DistanceFromCentroidWidget(QWidget):
         labels = self.napariUtil.getDataOfLayerWithName(text)
 
         self.densityByRadiusTask = DensityByRadiusTask(label, labels, spots, scale, unit)
-        worker = create_worker(self.densityByRadiusTask.run,
-                               _progress={'desc': 'Calculating Density by radius...'}
-                               )
-        worker.finished.connect(self.onDensityByRadiusTaskFinished)
-        worker.start()
+        self.submitJob(self.densityByRadiusTask.run, 'Calculating Density by radius...',
+                       onFinished=self.onDensityByRadiusTaskFinished)
 
 
     def onDensityByRadiusTaskFinished(self):
-        plotWidget = PlotWidget(self.viewer)
+        plotWidget = self.plotManager.getPlot("Density by radius")
         plotWidget.addData(self.densityByRadiusTask.radii,
                            self.densityByRadiusTask.densities)
         title = "Density by radius label=" + str(self.densityByRadiusTask.label)
@@ -213,6 +281,9 @@ class DistanceFromCentroidWidget(QWidget):
 
 
     def _onDensityZButtonClicked(self):
+        if self.allCellsCheckbox.isChecked():
+            self.runCentroidProfilesTask()
+            return
         label = int(self.selectedCellInput.text().strip())
         if not label:
             return
@@ -224,15 +295,15 @@ class DistanceFromCentroidWidget(QWidget):
         labels = self.napariUtil.getDataOfLayerWithName(text)
         self.densityAlongAxisTask = DensityAlongAxisTask(label, labels, spots, scale, unit)
         self.densityAlongAxisTask.axis = 0
-        worker = create_worker(self.densityAlongAxisTask.run,
-                               _progress={'desc': 'Calculating Density along axis ' +
-                                                  str(self.densityAlongAxisTask.axis) + '...'}
-                               )
-        worker.finished.connect(self._onDensityTaskFinished)
-        worker.start()
+        self.submitJob(self.densityAlongAxisTask.run,
+                       'Calculating Density along axis ' + str(self.densityAlongAxisTask.axis) + '...',
+                       onFinished=self._onDensityTaskFinished)
 
 
     def _onDensityYButtonClicked(self):
+        if self.allCellsCheckbox.isChecked():
+            self.runCentroidProfilesTask()
+            return
         label = int(self.selectedCellInput.text().strip())
         if not label:
             return
@@ -244,15 +315,15 @@ class DistanceFromCentroidWidget(QWidget):
         labels = self.napariUtil.getDataOfLayerWithName(text)
         self.densityAlongAxisTask = DensityAlongAxisTask(label, labels, spots, scale, unit)
         self.densityAlongAxisTask.axis = 1
-        worker = create_worker(self.densityAlongAxisTask.run,
-                               _progress={'desc': 'Calculating Density along axis ' +
-                                                  str(self.densityAlongAxisTask.axis) + '...'}
-                               )
-        worker.finished.connect(self._onDensityTaskFinished)
-        worker.start()
+        self.submitJob(self.densityAlongAxisTask.run,
+                       'Calculating Density along axis ' + str(self.densityAlongAxisTask.axis) + '...',
+                       onFinished=self._onDensityTaskFinished)
 
 
     def _onDensityXButtonClicked(self):
+        if self.allCellsCheckbox.isChecked():
+            self.runCentroidProfilesTask()
+            return
         label = int(self.selectedCellInput.text().strip())
         if not label:
             return
@@ -264,16 +335,13 @@ class DistanceFromCentroidWidget(QWidget):
         labels = self.napariUtil.getDataOfLayerWithName(text)
         self.densityAlongAxisTask = DensityAlongAxisTask(label, labels, spots, scale, unit)
         self.densityAlongAxisTask.axis = 2
-        worker = create_worker(self.densityAlongAxisTask.run,
-                               _progress={'desc': 'Calculating Density along axis ' +
-                                                  str(self.densityAlongAxisTask.axis) + '...'}
-                               )
-        worker.finished.connect(self._onDensityTaskFinished)
-        worker.start()
+        self.submitJob(self.densityAlongAxisTask.run,
+                       'Calculating Density along axis ' + str(self.densityAlongAxisTask.axis) + '...',
+                       onFinished=self._onDensityTaskFinished)
 
 
     def _onDensityTaskFinished(self):
-        plotWidget = PlotWidget(self.viewer)
+        plotWidget = self.plotManager.getPlot("Density along axis " + str(self.densityAlongAxisTask.axis))
         plotWidget.addData(self.densityAlongAxisTask.radii,
                            self.densityAlongAxisTask.densities)
         title = "Density along axis=" + str(self.densityAlongAxisTask.axis)+ " label=" + str(self.densityAlongAxisTask.label)
@@ -291,6 +359,9 @@ class DistanceFromCentroidWidget(QWidget):
 
 
 class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
+
+    resultsWriteFailed = Signal(str)
+
     # your QWidget.__init__ can optionally request the napari viewer instance
     # use a type annotation of 'napari.viewer.Viewer' for any parameter
     def __init__(self, viewer: "napari.viewer.Viewer"):
@@ -310,6 +381,7 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         self.segmentation = None
         self.keepLabelsText = ""
         self.keepLabelsInput = None
+        self.labelFilterTask = None
         self.layer = None
         self.cropImageLabelsCombo = None
         self.cropImageCombo = None
@@ -320,20 +392,45 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         self.ccPaddingModeCombo = None
         self.paddingModes = ['constant', 'wrap', 'empty', 'edge']
         self.spotsLayer = None
+        self.detectInCombo = None
+        self.wholeImageText = "(whole image)"
         self.gFunctionInput = None
         self.gFunctionSpotsCombo = None
         self.gFunctionLabelsCombo = None
         self.fFunctionTask = None
         self.gFunctionTask = None
         self.hFunctionTask = None
+        self.ripleyTask = None
+        self.crossTypeTask = None
+        self.crossSpotsCombo = None
+        self.ecdfResults = {}
+        self.plotManager = PlotManager(self.viewer)
+        self.spotsPerCellTask = None
+        self.heterogeneityTask = None
         self.convexHullTask = None
         self.delaunayTask = None
         self.voronoiTask = None
+        self.geometryMetricsTask = None
+        self.showHullsCheckBox = None
         self.measureTask = None
+        self.dirtyLabelsTracker = None
+        self.remeasureTask = None
+        self.remeasureRunning = False
+        self.updateOnEditCheckBox = None
         self.correlator = None
+        self.multiChannelCorrelator = None
+        self.ccShowImagesCheckBox = None
+        self.localCorrelator = None
+        self.ccWindowSize = 16
+        self.ccWindowSizeInput = None
+        self.ccLocalModeCombo = None
+        self.localModes = ['grid', 'labels']
+        self.resultsWriter = None
+        self.correlationsTableDockWidget = None
         self.cropLabelTask = None
         self.measurements = {}
         self.table = TableView(self.measurements)
+        self.scheduler = TaskScheduler.getInstance()
         self.napariUtil = NapariUtil(self.viewer)
         self.pointsLayers = self.napariUtil.getPointsLayers()
         self.labelLayers = self.napariUtil.getLabelLayers()
@@ -349,6 +446,33 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         self.distancesDockWidget = self.viewer.window.add_dock_widget(DistanceFromCentroidWidget(self.viewer),
                                                                       area='right',
                                                                       name="Distances from Centroid", tabify=True)
+        self.jobsDockWidget = self.viewer.window.add_dock_widget(JobQueueWidget(self.scheduler),
+                                                                 area='right', name="Jobs", tabify=True)
+        self.performanceDockWidget = None
+        if self.scheduler.telemetry.enabled:
+            self.performanceDockWidget = self.viewer.window.add_dock_widget(
+                PerformanceWidget(self.scheduler.telemetry), area='right', name="Performance", tabify=True)
+        self.resultsWriteFailed.connect(notifications.show_error)
+        self.destroyed.connect(lambda: self.tearDown())
+
+
+    def tearDown(self):
+        """Write the remaining results and release the figures of the plots
+        when the widget is destroyed together with the viewer.
+        """
+        if self.resultsWriter:
+            self.resultsWriter.close()
+        self.plotManager.closeAll(removeDocks=False)
+
+
+    def submitJob(self, function, description, onFinished=None, total=None, **kwargs):
+        """Submit the function as a job to the scheduler. The input layers and
+        the task of the job are restored before onFinished is called, so that
+        a click on another button in the meantime does not change them.
+        """
+        context = TaskScheduler.getContext(self, function, ['layer', 'spotsLayer'])
+        return self.scheduler.submit(function, description, onFinished=onFinished, total=total, owner=self,
+                                     context=context, **kwargs)
 
 
     @classmethod
@@ -389,12 +513,23 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
                                                                                 self.keepLabelsText,
                                                                                 self.fieldWidth*2,
                                                                                 self.keepLabelsChanged)
+        self.keepLabelsInput.setToolTip("Labels and ranges of labels, for example 1, 5, 10-50")
         keepLabelsButton = QPushButton("Keep Labels")
         keepLabelsButton.clicked.connect(self._onKeepLabelsButtonClicked)
+        removeLabelsButton = QPushButton("Remove Labels")
+        removeLabelsButton.clicked.connect(self._onRemoveLabelsButtonClicked)
+        cleanLabelsButton = QPushButton("Clean Labels")
+        cleanLabelsButton.setToolTip("Remove the labels touching the border and the small labels, "
+                                     "as set in the segmentation options")
+        cleanLabelsButton.clicked.connect(self._onCleanLabelsButtonClicked)
         detectSpotsButton = QPushButton("Detect Spots")
         detectSpotsButton.clicked.connect(self._onDetectSpotsButtonClicked)
         detectSpotsOptionsButton = self.getOptionsButton(self._onDetectSpotsOptionsClicked)
         detectSpotsOptionsButton.setMaximumWidth(50)
+        detectInLabel, self.detectInCombo = WidgetTool.getComboInput(self, "Detect in: ",
+                                                                     [self.wholeImageText] + self.labelLayers)
+        self.detectInCombo.setMaximumWidth(150)
+        self.detectInCombo.setToolTip("Detect the spots in the whole image or only within the cells of a labels layer")
         segmentationLayout = QHBoxLayout()
         keepLabelsLayout = QHBoxLayout()
         detectionLayout = QHBoxLayout()
@@ -404,6 +539,10 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         keepLabelsLayout.addWidget(keepLabelsLabel)
         keepLabelsLayout.addWidget(self.keepLabelsInput)
         keepLabelsLayout.addWidget(keepLabelsButton)
+        keepLabelsLayout.addWidget(removeLabelsButton)
+        keepLabelsLayout.addWidget(cleanLabelsButton)
+        detectionLayout.addWidget(detectInLabel)
+        detectionLayout.addWidget(self.detectInCombo)
         detectionLayout.addWidget(detectSpotsButton)
         detectionLayout.addWidget(detectSpotsOptionsButton)
         mainLayout.addLayout(segmentationLayout)
@@ -488,6 +627,18 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
                                                                                self.paddingModes)
         correlationButton = QPushButton("Correlate")
         correlationButton.clicked.connect(self._onCorrelationButtonPressed)
+        correlationOptionsButton = self.getOptionsButton(self._onCorrelationOptionsClicked)
+        correlationOptionsButton.setMaximumWidth(50)
+        correlateAllButton = QPushButton("Correlate All")
+        correlateAllButton.clicked.connect(self._onCorrelateAllButtonPressed)
+        self.ccShowImagesCheckBox = QCheckBox("Show images", self)
+        ccWindowSizeLabel, self.ccWindowSizeInput = WidgetTool.getLineInput(self, "Window: ", self.ccWindowSize,
+                                                                            self.fieldWidth,
+                                                                            self.ccWindowSizeChanged)
+        ccLocalModeLabel, self.ccLocalModeCombo = WidgetTool.getComboInput(self, "Local mode: ",
+                                                                           self.localModes)
+        localCorrelationButton = QPushButton("Local Correlation")
+        localCorrelationButton.clicked.connect(self._onLocalCorrelationButtonPressed)
         inputALayout = QHBoxLayout()
         inputALayout.addWidget(ccInputALabel)
         inputALayout.addWidget(self.ccInputACombo)
@@ -499,6 +650,9 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         paddingModeLayout.addWidget(self.ccPaddingModeCombo)
         correlationButtonLayout = QHBoxLayout()
         correlationButtonLayout.addWidget(correlationButton)
+        correlationButtonLayout.addWidget(correlateAllButton)
+        correlationButtonLayout.addWidget(self.ccShowImagesCheckBox)
+        correlationButtonLayout.addWidget(correlationOptionsButton)
         ccMainLayout.addLayout(ccCropImageLabelsLayout)
         ccMainLayout.addLayout(ccCropImageLayout)
         ccMainLayout.addLayout(ccCropLabelLayout)
@@ -506,6 +660,13 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         ccMainLayout.addLayout(inputBLayout)
         ccMainLayout.addLayout(paddingModeLayout)
         ccMainLayout.addLayout(correlationButtonLayout)
+        localCorrelationLayout = QHBoxLayout()
+        localCorrelationLayout.addWidget(ccWindowSizeLabel)
+        localCorrelationLayout.addWidget(self.ccWindowSizeInput)
+        localCorrelationLayout.addWidget(ccLocalModeLabel)
+        localCorrelationLayout.addWidget(self.ccLocalModeCombo)
+        localCorrelationLayout.addWidget(localCorrelationButton)
+        ccMainLayout.addLayout(localCorrelationLayout)
         crossCorrelationGroupBox.setLayout(ccMainLayout)
         return crossCorrelationGroupBox
 
@@ -522,6 +683,14 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         fFunctionButton.clicked.connect(self._onFFunctionButtonClicked)
         gFunctionButton.clicked.connect(self._onGFunctionButtonClicked)
         hFunctionButton.clicked.connect(self._onHFunctionButtonClicked)
+        kFunctionButton = QPushButton("K-Function")
+        lFunctionButton = QPushButton("L-Function")
+        pairCorrelationButton = QPushButton("Pair-Correlation")
+        kFunctionButton.clicked.connect(self._onKFunctionButtonClicked)
+        lFunctionButton.clicked.connect(self._onLFunctionButtonClicked)
+        pairCorrelationButton.clicked.connect(self._onPairCorrelationButtonClicked)
+        spatialStatsOptionsButton = self.getOptionsButton(self._onSpatialStatsOptionsClicked)
+        spatialStatsOptionsButton.setMaximumWidth(50)
         gFunctionMainLayout = QVBoxLayout()
         gFunctionGroupBox.setLayout(gFunctionMainLayout)
         gFunctionSpotsLabel, self.gFunctionSpotsCombo = WidgetTool.getComboInput(self, "Spots: ", self.pointsLayers)
@@ -529,6 +698,14 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         gFunctionLabelsLabel, self.gFunctionLabelsCombo = WidgetTool.getComboInput(self, "Cell labels: ",
                                                                                    self.labelLayers)
         self.gFunctionLabelsCombo.setMaximumWidth(150)
+        crossSpotsLabel, self.crossSpotsCombo = WidgetTool.getComboInput(self, "Spots B: ", self.pointsLayers)
+        self.crossSpotsCombo.setMaximumWidth(150)
+        crossTypeButton = QPushButton("Cross G/K")
+        crossTypeButton.clicked.connect(self._onCrossTypeButtonClicked)
+        crossTypeLayout = QHBoxLayout()
+        crossTypeLayout.addWidget(crossSpotsLabel)
+        crossTypeLayout.addWidget(self.crossSpotsCombo)
+        crossTypeLayout.addWidget(crossTypeButton)
         gFunctionLayersLayout = QHBoxLayout()
         gFunctionLayersLayout.addWidget(gFunctionSpotsLabel)
         gFunctionLayersLayout.addWidget(self.gFunctionSpotsCombo)
@@ -544,6 +721,13 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         buttonsLayout.addWidget(gFunctionButton)
         buttonsLayout.addWidget(hFunctionButton)
         FGHLayout.addLayout(buttonsLayout)
+        ripleyButtonsLayout = QHBoxLayout()
+        ripleyButtonsLayout.addWidget(kFunctionButton)
+        ripleyButtonsLayout.addWidget(lFunctionButton)
+        ripleyButtonsLayout.addWidget(pairCorrelationButton)
+        ripleyButtonsLayout.addWidget(spatialStatsOptionsButton)
+        FGHLayout.addLayout(ripleyButtonsLayout)
+        FGHLayout.addLayout(crossTypeLayout)
         gFunctionMainLayout.addLayout(gFunctionLayersLayout)
         gFunctionMainLayout.addLayout(FGHLayout)
         return gFunctionGroupBox
@@ -557,6 +741,12 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         measurementsGroupBox.setLayout(mainLayout)
         buttonLayout = QHBoxLayout()
         buttonLayout.addWidget(measureButton)
+        remeasureButton = QPushButton("Remeasure Changed")
+        remeasureButton.clicked.connect(self._onRemeasureButtonClicked)
+        self.updateOnEditCheckBox = QCheckBox("Update on edit", self)
+        updateLayout = QHBoxLayout()
+        updateLayout.addWidget(remeasureButton)
+        updateLayout.addWidget(self.updateOnEditCheckBox)
         convexHullButton = QPushButton("Convex Hull")
         convexHullButton.clicked.connect(self._onConvexHullButtonClicked)
         delaunayButton = QPushButton("Delaunay")
@@ -569,9 +759,23 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         displayButtonsLayout.addWidget(convexHullButton)
         displayButtonsLayout.addWidget(delaunayButton)
         displayButtonsLayout.addWidget(voronoiButton)
+        geometryButton = QPushButton("Geometry All Cells")
+        geometryButton.clicked.connect(self._onGeometryAllCellsButtonClicked)
+        self.showHullsCheckBox = QCheckBox("Show hulls", self)
+        allCellsLayout = QHBoxLayout()
+        allCellsLayout.addWidget(geometryButton)
+        allCellsLayout.addWidget(self.showHullsCheckBox)
+        spotsPerCellButton = QPushButton("Spots per Cell")
+        spotsPerCellButton.clicked.connect(self._onSpotsPerCellButtonClicked)
+        allCellsLayout.addWidget(spotsPerCellButton)
+        heterogeneityButton = QPushButton("Heterogeneity")
+        heterogeneityButton.clicked.connect(self._onHeterogeneityButtonClicked)
+        allCellsLayout.addWidget(heterogeneityButton)
         buttonLayout.addWidget(exportButton)
         mainLayout.addLayout(buttonLayout)
+        mainLayout.addLayout(updateLayout)
         mainLayout.addLayout(displayButtonsLayout)
+        mainLayout.addLayout(allCellsLayout)
         return measurementsGroupBox
 
 
@@ -581,6 +785,18 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
                                                                       tabify = True)
 
 
+    def _onCorrelationOptionsClicked(self):
+        correlationOptionsWidget = CorrelationOptionsWidget(self.viewer)
+        self.viewer.window.add_dock_widget(correlationOptionsWidget, area='right', name='Options of Correlation',
+                                                                     tabify=True)
+
+
+    def _onSpatialStatsOptionsClicked(self):
+        spatialStatsOptionsWidget = SpatialStatsOptionsWidget(self.viewer)
+        self.viewer.window.add_dock_widget(spatialStatsOptionsWidget, area='right',
+                                           name='Options of Spatial-Statistics', tabify=True)
+
+
     def _onDetectSpotsOptionsClicked(self):
         detectionOptionsWidget = DetectionOptionsWidget(self.viewer)
         self.viewer.window.add_dock_widget(detectionOptionsWidget, area='right', name='Options of Detect Spots',
@@ -593,10 +809,7 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
             return
         self.medianFilterSize = int(self.medianFilterSizeInput.text().strip())
         self.medianFilter = MedianFilter(self.layer.data, radius=self.medianFilterSize, name=self.layer.name)
-        worker = create_worker(self.medianFilter.run,
-                               _progress={'desc': 'Median Filter Running...'})
-        worker.finished.connect(self.onMedianFilterFinished)
-        worker.start()
+        self.submitJob(self.medianFilter.run, 'Median Filter Running...', onFinished=self.onMedianFilterFinished)
 
 
     def _onSubtractBackgroundButtonClicked(self):
@@ -618,10 +831,8 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         self.bigFishApp.setData(self.layer.data)
         self.bigFishApp.setSigmaXY(self.backgroundSigmaXY)
         self.bigFishApp.setSigmaZ(self.backgroundSigmaZ)
-        worker = create_worker(self.bigFishApp.subtractBackground,
-                               _progress={'desc': 'Subtracting Background...'})
-        worker.finished.connect(self.onBackgroundSubtractionFinished)
-        worker.start()
+        self.submitJob(self.bigFishApp.subtractBackground, 'Subtracting Background...',
+                       onFinished=self.onBackgroundSubtractionFinished)
 
 
     def onMedianFilterFinished(self):
@@ -656,11 +867,10 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         units = self.layer.units
         text = self.gFunctionLabelsCombo.currentText()
         labels = self.napariUtil.getDataOfLayerWithName(text)
+        self.trackLabelEdits(self.napariUtil.getLayerWithName(text))
         self.measureTask = MeasureTask(spots, labels, scale, units)
-        worker = create_worker(self.measureTask.run,
-                               _progress={'desc': 'Measuring Features...'})
-        worker.finished.connect(self.onMeasureTaskFinished)
-        worker.start()
+        self.submitJob(self.measureTask.run, 'Measuring Features...', onFinished=self.onMeasureTaskFinished,
+                       kind=TaskScheduler.PROCESS)
 
 
     def onMeasureTaskFinished(self):
@@ -669,23 +879,107 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         dirname = os.path.dirname(path)
         self.measureTask.table['image'] = [filename] * len(self.measureTask.table['label'])
         self.measureTask.table['folder'] = [dirname] * len(self.measureTask.table['label'])
-        self.tableDockWidget.close()
         if self.measurements:
             TableTool.addTableAToB(self.measureTask.table, self.measurements)
         else:
             self.measurements = self.measureTask.table
-        self.table = TableView(self.measurements)
-        self.table.resetAction.triggered.connect(self.resetMeasurements)
-        self.table.deleteAction.triggered.connect(self.deleteMeasurements)
-        self.tableDockWidget = self.viewer.window.add_dock_widget(self.table,
-                                                                  area='right',
-                                                                  name='measurements',
-                                                                  tabify=False)
+        self.showMeasurements()
+
+
+    def trackLabelEdits(self, labelsLayer):
+        """Collect the labels changed by edits of the labels layer from now on,
+        so that only these labels need to be measured again.
+        """
+        if self.dirtyLabelsTracker:
+            self.dirtyLabelsTracker.disconnect()
+        self.dirtyLabelsTracker = DirtyLabelsTracker(labelsLayer)
+        self.dirtyLabelsTracker.callback = self.onLabelsEdited
+
+
+    def onLabelsEdited(self):
+        """Measure the changed labels again, after the edit has been written
+        to the data of the layer, which happens after the paint event.
+        """
+        if self.updateOnEditCheckBox.isChecked() and not self.remeasureRunning:
+            QTimer.singleShot(0, self._onRemeasureButtonClicked)
+
+
+    def _onRemeasureButtonClicked(self):
+        tracker = self.dirtyLabelsTracker
+        if not tracker or not tracker.hasChanges():
+            notifications.show_info("No labels have been changed since the last measurement.")
+            return
+        changedLabels, box = tracker.pop()
+        if changedLabels is None:
+            self._onMeasureButtonClicked()
+            return
+        text = self.gFunctionSpotsCombo.currentText()
+        self.spotsLayer = self.napariUtil.getLayerWithName(text)
+        spots, scale, unit = self.napariUtil.getDataAndScaleOfLayerWithName(text)
+        units = self.spotsLayer.units
+        self.layer = tracker.layer
+        labels, offset = RemeasureTask.getCrop(self.layer.data, changedLabels, box)
+        self.remeasureTask = RemeasureTask(spots, labels, changedLabels, offset)
+        factories = [lambda spots, labels: MeasureTask(spots, labels, scale, units)]
+        if 'spot_density' in self.measurements:
+            factories.append(lambda spots, labels: SpotsPerCellTask(spots, labels, self.layer.scale))
+        if 'morisita_index' in self.measurements:
+            quadratSize = SpatialStatsOptionsWidget(None).options.get('quadrat_size')
+            factories.append(lambda spots, labels: self.getHeterogeneityTask(spots, labels, scale, unit,
+                                                                             quadratSize))
+        if 'hull_volume' in self.measurements:
+            factories.append(lambda spots, labels: self.getGeometryMetricsTask(spots, labels, scale, units))
+        self.remeasureTask.taskFactories = factories
+        self.remeasureRunning = True
+        self.submitJob(self.remeasureTask.run, 'Measuring ' + str(len(changedLabels)) + ' changed labels...',
+                       onFinished=self.onRemeasureTaskFinished, onDone=self.onRemeasureJobDone,
+                       total=len(factories), priority=1)
+
+
+    def getGeometryMetricsTask(self, spots, labels, scale, units):
+        task = GeometryMetricsTask(spots, labels, scale, units)
+        task.nrOfWorkers = self.scheduler.getWorkersPerProcessJob()
+        return task
+
+
+    @staticmethod
+    def getHeterogeneityTask(spots, labels, scale, unit, quadratSize):
+        task = HeterogeneityTask(spots, labels, scale, unit)
+        task.quadratSize = quadratSize
+        return task
+
+
+    def onRemeasureJobDone(self):
+        """Allow the next automatic remeasurement, also after a remeasurement
+        failed or has been cancelled.
+        """
+        self.remeasureRunning = False
+
+
+    def onRemeasureTaskFinished(self):
+        task = self.remeasureTask
+        features = self.spotsLayer.features
+        if 'label' in features:
+            spotLabels = np.array(features['label'])
+            spotLabels[task.spotIndices] = task.spotLabels
+            features['label'] = spotLabels
+        filename, _ = self.getImageAndFolder(self.spotsLayer)
+        TableUtil.deleteRows(self.measurements, [(filename, label) for label in task.removedLabels])
+        if task.table:
+            self.addToMeasurements(task.table, self.spotsLayer)
+        else:
+            self.showMeasurements()
+        if self.dirtyLabelsTracker.hasChanges():
+            self.onLabelsEdited()
 
 
     def resetMeasurements(self):
-        self.tableDockWidget.close()
         self.measurements = {}
+        self.showMeasurements()
+
+
+    def showMeasurements(self):
+        self.tableDockWidget.close()
         self.table = TableView(self.measurements)
         self.table.resetAction.triggered.connect(self.resetMeasurements)
         self.table.deleteAction.triggered.connect(self.deleteMeasurements)
@@ -705,14 +999,7 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
                 rowsToBedeleted.append(row)
         for key, value in self.measurements.items():
             self.measurements[key] = np.delete(np.array(value), rowsToBedeleted)
-        self.tableDockWidget.close()
-        self.table = TableView(self.measurements)
-        self.table.resetAction.triggered.connect(self.resetMeasurements)
-        self.table.deleteAction.triggered.connect(self.deleteMeasurements)
-        self.tableDockWidget = self.viewer.window.add_dock_widget(self.table,
-                                                                  area='right',
-                                                                  name='measurements',
-                                                                  tabify=False)
+        self.showMeasurements()
 
 
     def _onConvexHullButtonClicked(self):
@@ -725,10 +1012,8 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         text = self.gFunctionLabelsCombo.currentText()
         labels = self.napariUtil.getDataOfLayerWithName(text)
         self.convexHullTask = ConvexHullTask(spots, labels, scale, unit, label)
-        worker = create_worker(self.convexHullTask.run,
-                               _progress={'desc': 'Calculating Convex Hull...'})
-        worker.finished.connect(self.onConvexHullTaskFinished)
-        worker.start()
+        self.submitJob(self.convexHullTask.run, 'Calculating Convex Hull...',
+                       onFinished=self.onConvexHullTaskFinished)
 
 
     def onConvexHullTaskFinished(self):
@@ -736,7 +1021,8 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         scale = self.convexHullTask.scale
         units = self.spotsLayer.units
         self.viewer.add_points(hull.points[hull.vertices], scale=scale, units=units)
-        self.viewer.add_shapes(hull.points[hull.simplices], shape_type='polygon', scale=scale, units=units)
+        self.viewer.add_surface((hull.points, hull.simplices), scale=scale, units=units,
+                                name="convex hull", opacity=0.5, blending='additive')
 
 
     def _onDelaunayButtonClicked(self):
@@ -750,20 +1036,19 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         self.layer = self.napariUtil.getLayerWithName(text)
         self.delaunayTask = DelaunayTask(spots, labels, scale, unit, label)
 
-        worker = create_worker(self.delaunayTask.run,
-                               _progress={'desc': 'Calculating Delaunay Tesselation...'})
-
-        worker.finished.connect(self.onDelaunayTaskFinished)
-        worker.start()
+        self.submitJob(self.delaunayTask.run, 'Calculating Delaunay Tesselation...',
+                       onFinished=self.onDelaunayTaskFinished)
 
 
     def onDelaunayTaskFinished(self):
         tess = self.delaunayTask.result
         units = self.layer.units
-        self.viewer.add_shapes(tess.points[tess.simplices],
-                               scale=self.delaunayTask.scale,
-                               shape_type='path',
-                               units=units)
+        self.viewer.add_vectors(TessellationUtil.getEdgeVectors(tess.points, tess.simplices),
+                                scale=self.delaunayTask.scale,
+                                units=units,
+                                name="delaunay",
+                                vector_style='line',
+                                edge_width=0.2)
 
 
     def _onVoronoiButtonClicked(self):
@@ -777,24 +1062,119 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         self.layer = self.napariUtil.getLayerWithName(text)
         self.voronoiTask = VoronoiTask(spots, labels, scale, unit, label)
 
-        worker = create_worker(self.voronoiTask.run,
-                               _progress={'desc': 'Calculating Voronoi Tesselation...'})
-
-        worker.finished.connect(self.onVoronoiTaskFinished)
-        worker.start()
+        self.submitJob(self.voronoiTask.run, 'Calculating Voronoi Tesselation...',
+                       onFinished=self.onVoronoiTaskFinished)
 
 
     def onVoronoiTaskFinished(self):
         regions = self.voronoiTask.result
         units = self.layer.units
-        self.viewer.add_shapes(regions, scale=self.voronoiTask.scale, shape_type='polygon', units=units)
+        self.viewer.add_surface(TessellationUtil.polygonsToSurface(regions),
+                                scale=self.voronoiTask.scale, units=units,
+                                name="voronoi", opacity=0.5, blending='additive')
+
+
+    def _onGeometryAllCellsButtonClicked(self):
+        text = self.gFunctionSpotsCombo.currentText()
+        spots, scale, unit = self.napariUtil.getDataAndScaleOfLayerWithName(text)
+        self.spotsLayer = self.napariUtil.getLayerWithName(text)
+        text = self.gFunctionLabelsCombo.currentText()
+        self.layer = self.napariUtil.getLayerWithName(text)
+        labels = self.napariUtil.getDataOfLayerWithName(text)
+        self.geometryMetricsTask = self.getGeometryMetricsTask(spots, labels, scale, self.spotsLayer.units)
+        self.geometryMetricsTask.mergeHulls = self.showHullsCheckBox.isChecked()
+        self.submitJob(self.geometryMetricsTask.run, 'Calculating Geometry of all Cells...',
+                       onFinished=self.onGeometryMetricsTaskFinished)
+
+
+    def onGeometryMetricsTaskFinished(self):
+        task = self.geometryMetricsTask
+        self.addToMeasurements(task.table, self.spotsLayer)
+        if task.surface:
+            layer = self.viewer.add_surface(task.surface,
+                                            scale=task.scale,
+                                            units=task.units,
+                                            name="convex hulls",
+                                            colormap='turbo',
+                                            opacity=0.5,
+                                            blending='additive')
+            NapariUtil.copyOriginalPath(self.layer, layer)
+
+
+    def _onSpotsPerCellButtonClicked(self):
+        text = self.gFunctionSpotsCombo.currentText()
+        spots, scale, unit = self.napariUtil.getDataAndScaleOfLayerWithName(text)
+        self.spotsLayer = self.napariUtil.getLayerWithName(text)
+        text = self.gFunctionLabelsCombo.currentText()
+        self.layer = self.napariUtil.getLayerWithName(text)
+        labels = self.napariUtil.getDataOfLayerWithName(text)
+        self.spotsPerCellTask = SpotsPerCellTask(spots, labels, self.layer.scale)
+        self.submitJob(self.spotsPerCellTask.run, 'Counting Spots per Cell...',
+                       onFinished=self.onSpotsPerCellTaskFinished)
+
+
+    def onSpotsPerCellTaskFinished(self):
+        task = self.spotsPerCellTask
+        self.addToMeasurements(task.table, self.spotsLayer)
+        colormap = NapariUtil.getValueColormap(task.table['label'], task.table['spot_density'])
+        layer = self.viewer.add_labels(self.layer.data,
+                                       name="spot density: " + self.spotsLayer.name,
+                                       colormap=colormap,
+                                       scale=self.layer.scale,
+                                       units=self.layer.units,
+                                       blending='additive')
+        NapariUtil.copyOriginalPath(self.layer, layer)
+
+
+    def _onHeterogeneityButtonClicked(self):
+        text = self.gFunctionSpotsCombo.currentText()
+        spots, scale, unit = self.napariUtil.getDataAndScaleOfLayerWithName(text)
+        self.spotsLayer = self.napariUtil.getLayerWithName(text)
+        text = self.gFunctionLabelsCombo.currentText()
+        self.layer = self.napariUtil.getLayerWithName(text)
+        labels = self.napariUtil.getDataOfLayerWithName(text)
+        options = SpatialStatsOptionsWidget(None).options
+        self.heterogeneityTask = HeterogeneityTask(spots, labels, scale, unit)
+        self.heterogeneityTask.quadratSize = options.get('quadrat_size')
+        self.submitJob(self.heterogeneityTask.run, 'Calculating Heterogeneity of all Cells...',
+                       onFinished=self.onHeterogeneityTaskFinished,
+                       total=labels.shape[0])
+
+
+    def onHeterogeneityTaskFinished(self):
+        if not self.heterogeneityTask.table:
+            notifications.show_error("No cells found!")
+            return
+        self.addToMeasurements(self.heterogeneityTask.table, self.spotsLayer)
+
+
+    def addToMeasurements(self, table, layer):
+        """Add the columns of a table with one row per label to the rows with
+        the same image and label in the measurements table and append the rows
+        of the other labels.
+        """
+        filename, dirname = self.getImageAndFolder(layer)
+        table = dict(table)
+        table['image'] = [filename] * len(table['label'])
+        table['folder'] = [dirname] * len(table['label'])
+        TableUtil.mergeRows(table, self.measurements, keys=('image', 'label'))
+        self.showMeasurements()
+
+
+    @staticmethod
+    def getImageAndFolder(layer):
+        """Answer the name and the folder of the image of the layer, used to
+        identify the rows of the layer in the measurements table.
+        """
+        path = NapariUtil.getOriginalPath(layer)
+        if path:
+            return os.path.basename(path), os.path.dirname(path)
+        return layer.name, ""
 
 
     def _onExportPointsPerCellButtonClicked(self):
 
-        worker = create_worker(self.spotsPerCellToFeatures,
-                               _progress={'desc': 'Export Spots Per Label...'})
-        worker.start()
+        self.submitJob(self.spotsPerCellToFeatures, 'Export Spots Per Label...', kind=TaskScheduler.IO)
 
 
     def spotsPerCellToFeatures(self):
@@ -805,19 +1185,7 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         self.layer = self.napariUtil.getLayerWithName(text)
         labels = self.napariUtil.getDataOfLayerWithName(text)
         table = {'id': [], 'label': [], 'z': [], 'y': [], 'x': [], 'sz': [], 'sy': [], 'sx': []}
-        i = 0
-        for point in spots:
-            label = labels[int(point[0]), int(point[1]), int(point[2])]
-            table['id'].append(i)
-            table['label'].append(label)
-            table['z'].append(int(point[0]))
-            table['y'].append(int(point[1]))
-            table['x'].append(int(point[2]))
-            table['sz'].append(int(point[0]) * scale[0])
-            table['sy'].append(int(point[1]) * scale[1])
-            table['sx'].append(int(point[2]) * scale[2])
-            i = i + 1
-            yield
+        yield from SpotsUtil.addSpotsToTable(spots, labels, scale, table)
         spotsLayer.features = table
 
 
@@ -826,7 +1194,15 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         if not self.layer or not type(self.layer) is Image:
             return
         options = SegmentationOptionsWidget(None).options
-        self.segmentation = Segmentation(self.layer.data)
+        if options.get('tiled'):
+            self.runTiledSegmentation(options)
+            return
+        if options.get('scale_factor') < 1:
+            self.segmentation = ResampledSegmentation(self.layer.data, self.layer.scale)
+            self.segmentation.scaleFactor = options.get('scale_factor')
+            self.segmentation.upsampling = options.get('upsampling')
+        else:
+            self.segmentation = Segmentation(self.layer.data)
         self.segmentation.clearBorder = options.get('remove_border_objects')
         self.segmentation.minSize = options.get('min_size')
         self.segmentation.flowThreshold = options.get("flow_threshold")
@@ -834,39 +1210,83 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         self.segmentation.diameter = options.get('diameter')
         self.segmentation.resampleDynamics = True
 
-        worker = create_worker(self.segmentation.run,
-                               _progress={'total': 5, 'desc': 'Segmenting cells...'})
+        self.submitJob(self.segmentation.run, 'Segmenting cells...', onFinished=self.onSegmentationFinished, total=5,
+                       group='segmentation')
 
-        worker.finished.connect(self.onSegmentationFinished)
-        worker.start()
+
+    def runTiledSegmentation(self, options):
+        path = NapariUtil.getOriginalPath(self.layer)
+        folder = ResultsWriter.getOutputFolder(path, None, tempfile.gettempdir())
+        os.makedirs(folder, exist_ok=True)
+        outputPath = TiledSegmentation.getNewOutputPath(folder, ResultsWriter.getFilename(self.layer.name))
+        self.segmentation = TiledSegmentation(self.layer.data, outputPath)
+        self.segmentation.tileSize = (options.get('tile_depth'), options.get('tile_size'), options.get('tile_size'))
+        self.segmentation.overlap = (options.get('tile_overlap_z'), options.get('tile_overlap'), options.get('tile_overlap'))
+        self.segmentation.clearBorder = options.get('remove_border_objects')
+        self.segmentation.minSize = options.get('min_size')
+        self.segmentation.flowThreshold = options.get("flow_threshold")
+        self.segmentation.cellProbabilityThreshold = options.get("cellprob_threshold")
+        self.segmentation.diameter = options.get('diameter')
+        self.segmentation.nrOfWorkers = options.get('nr_of_workers')
+        self.submitJob(self.segmentation.run, 'Segmenting cells in tiles...',
+                       onFinished=self.onSegmentationFinished,
+                       total=self.segmentation.getNrOfSteps(), group='segmentation')
 
 
     def remapLabels(self):
-        labels = self.layer.data
-        for index, value in enumerate(np.unique(labels)):
-            labels[labels == value] = index
+        LabelFilterTask.remapLabels(self.layer.data)
 
 
     def _onRemapLabelsButtonClicked(self):
         self.layer = self.getActiveLayer()
         if not self.layer or not type(self.layer) is Labels:
             return
-        worker = create_worker(self.remapLabels,
-                               _progress={'desc': 'Remapping labels...'})
-        worker.start()
+        self.submitJob(self.remapLabels, 'Remapping labels...', group='labels')
 
 
     def _onKeepLabelsButtonClicked(self):
         self.layer = self.getActiveLayer()
         if not self.layer or not type(self.layer) is Labels:
             return
-        text = self.keepLabelsInput.text().strip()
-        labelTextList = text.split(',')
-        if not labelTextList:
+        labelList = LabelFilterTask.parseLabels(self.keepLabelsInput.text())
+        if len(labelList) == 0:
             return
-        labelList = [int(labelText) for labelText in labelTextList]
-        newLabels = Segmentation.keepLabels(self.layer.data, labelList)
-        layer = self.viewer.add_labels(newLabels, scale=self.layer.scale, units=self.layer.units, blending='additive')
+        self.labelFilterTask = LabelFilterTask(self.layer.data)
+        self.labelFilterTask.keep = labelList
+        self.runLabelFilterTask('Keeping Labels...')
+
+
+    def _onRemoveLabelsButtonClicked(self):
+        self.layer = self.getActiveLayer()
+        if not self.layer or not type(self.layer) is Labels:
+            return
+        labelList = LabelFilterTask.parseLabels(self.keepLabelsInput.text())
+        if len(labelList) == 0:
+            return
+        self.labelFilterTask = LabelFilterTask(self.layer.data)
+        self.labelFilterTask.remove = labelList
+        self.runLabelFilterTask('Removing Labels...')
+
+
+    def _onCleanLabelsButtonClicked(self):
+        self.layer = self.getActiveLayer()
+        if not self.layer or not type(self.layer) is Labels:
+            return
+        options = SegmentationOptionsWidget(None).options
+        self.labelFilterTask = LabelFilterTask(self.layer.data)
+        self.labelFilterTask.removeBorder = options.get('remove_border_objects')
+        self.labelFilterTask.minSize = options.get('min_size')
+        self.runLabelFilterTask('Cleaning Labels...')
+
+
+    def runLabelFilterTask(self, description):
+        self.submitJob(self.labelFilterTask.run, description, onFinished=self.onLabelFilterTaskFinished,
+                       group='labels')
+
+
+    def onLabelFilterTaskFinished(self):
+        layer = self.viewer.add_labels(self.labelFilterTask.result, scale=self.layer.scale, units=self.layer.units,
+                                       blending='additive')
         NapariUtil.copyOriginalPath(self.layer, layer)
 
 
@@ -875,6 +1295,10 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         if not self.spotsLayer or not type(self.spotsLayer) is Image:
             return
         options = DetectionOptionsWidget(None).options
+        labelsLayer = self.napariUtil.getLayerWithName(self.detectInCombo.currentText())
+        if labelsLayer is not None and type(labelsLayer) is Labels:
+            self.runRoiSpotDetection(labelsLayer, options)
+            return
         self.detection = SpotDetection(self.spotsLayer.data)
         self.detection.scale = (self.spotsLayer.scale[0].item(),
                                 self.spotsLayer.scale[1].item(),
@@ -894,11 +1318,23 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
                 self.detection.shallFindThreshold,
                 self.spotsLayer.name))
 
-        worker = create_worker(self.detection.run,
-                               _progress={'total': 2, 'desc': 'Detecting spots...'})
+        self.submitJob(self.detection.run, 'Detecting spots...', onFinished=self.onDetectionFinished, total=2,
+                       group='detection')
+
 
-        worker.finished.connect(self.onDetectionFinished)
-        worker.start()
+    def runRoiSpotDetection(self, labelsLayer, options):
+        self.detection = RoiSpotDetectionTask(self.spotsLayer.data, labelsLayer.data,
+                                              tuple(scale.item() for scale in self.spotsLayer.scale))
+        self.detection.threshold = options.get("threshold")
+        self.detection.spotRadius = (options.get("radius_z"), options.get("radius_xy"), options.get("radius_xy"))
+        self.detection.shallRemoveDuplicates = options.get("remove_duplicates")
+        self.detection.nrOfWorkers = self.scheduler.getWorkersPerProcessJob()
+        regions = self.detection.getRegions()
+        notifications.show_info(f"Running spot detection in {len(regions)} cells of {labelsLayer.name} "
+                                f"on {self.spotsLayer.name}.")
+        self.submitJob(self.detection.run, 'Detecting spots in cells...',
+                       onFinished=self.onDetectionFinished,
+                       total=len(regions), group='detection')
 
 
     def _onGFunctionButtonClicked(self):
@@ -913,11 +1349,8 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         labels = self.napariUtil.getDataOfLayerWithName(text)
         self.gFunctionTask = GFunctionTask(spots, labels, scale, unit, label)
         self.gFunctionTask.nrOfSamples = 100
-        worker = create_worker(self.gFunctionTask.run,
-                      _progress={'desc': 'Calculating G-Function...'}
-                      )
-        worker.finished.connect(self.ongFunctionTaskFinished)
-        worker.start()
+        self.submitJob(self.gFunctionTask.run, 'Calculating G-Function...', onFinished=self.ongFunctionTaskFinished,
+                       kind=TaskScheduler.PROCESS)
 
 
     def _onHFunctionButtonClicked(self):
@@ -929,13 +1362,19 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         spots, scale, unit = self.napariUtil.getDataAndScaleOfLayerWithName(text)
         text = self.gFunctionLabelsCombo.currentText()
         labels = self.napariUtil.getDataOfLayerWithName(text)
+        options = SpatialStatsOptionsWidget(None).options
+        if options.get('h_function_mode') == 'histogram':
+            self.hFunctionTask = HistogramHFunctionTask(spots, labels, scale, unit, label)
+            self.hFunctionTask.nrOfSimulations = options.get('nr_of_simulations')
+            self.hFunctionTask.nrOfBins = options.get('nr_of_bins')
+            self.submitJob(self.hFunctionTask.run, 'Calculating H-Function from histograms...',
+                           onFinished=self.onHistogramHFunctionTaskFinished,
+                           total=self.hFunctionTask.nrOfSimulations, kind=TaskScheduler.PROCESS)
+            return
         self.hFunctionTask = HFunctionTask(spots, labels, scale, unit, label)
         self.hFunctionTask.nrOfSamples = 100
-        worker = create_worker(self.hFunctionTask.run,
-                               _progress={'desc': 'Calculating H-Function...'}
-                               )
-        worker.finished.connect(self.onhFunctionTaskFinished)
-        worker.start()
+        self.submitJob(self.hFunctionTask.run, 'Calculating H-Function...', onFinished=self.onhFunctionTaskFinished,
+                       kind=TaskScheduler.PROCESS)
 
 
     def _onFFunctionButtonClicked(self):
@@ -948,73 +1387,190 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         text = self.gFunctionLabelsCombo.currentText()
         self.layer = self.napariUtil.getLayerWithName(text)
         labels = self.napariUtil.getDataOfLayerWithName(text)
+        options = SpatialStatsOptionsWidget(None).options
+        if options.get('f_function_mode') == 'exact':
+            self.fFunctionTask = ExactFFunctionTask(spots, labels, scale, unit, label)
+            self.fFunctionTask.nrOfSimulations = options.get('nr_of_simulations')
+            self.submitJob(self.fFunctionTask.run, 'Calculating exact F-Function...',
+                           onFinished=self.onExactFFunctionTaskFinished,
+                           total=self.fFunctionTask.nrOfSimulations, kind=TaskScheduler.PROCESS)
+            return
         self.fFunctionTask = FFunctionTask(spots, labels, scale, unit, label)
         self.fFunctionTask.nrOfSamples = 100
-        worker = create_worker(self.fFunctionTask.run,
-                      _progress={'desc': 'Calculating F-Function...'}
-                      )
-        worker.finished.connect(self.onfFunctionTaskFinished)
-        worker.start()
+        self.submitJob(self.fFunctionTask.run, 'Calculating F-Function...', onFinished=self.onfFunctionTaskFinished,
+                       kind=TaskScheduler.PROCESS)
 
 
-    def onfFunctionTaskFinished(self):
-        analyzer = self.fFunctionTask.analyzer
-        if len(analyzer.pointsPerCell[self.fFunctionTask.label])>0:
-            plotWidget = PlotWidget(self.viewer)
-            analyzer.esEcdfs[self.fFunctionTask.label].cdf.plot(plotWidget.ax)
-            plotWidget.xLabel = 'distances [' + self.fFunctionTask.unit + ']'
-            plotWidget.yLabel = "Empirical CDF"
-            maxDist = np.max(analyzer.emptySpaceDistances[self.fFunctionTask.label][0])
-            xValues = np.array(list(np.arange(0, math.floor(maxDist + 1), analyzer.scale[1])))
-            envelop = self.fFunctionTask.envelop
-            plotWidget.addData(xValues, envelop[0], "r--")
-            plotWidget.addData(xValues, envelop[1], "g--")
-            plotWidget.addData(xValues, envelop[2], "g--")
-            plotWidget.addData(xValues, envelop[3], "r--")
-            plotWidget.title = "F-Function of " + self.layer.name
-            plotWidget.display()
-        else:
+    def onExactFFunctionTaskFinished(self):
+        task = self.fFunctionTask
+        if task.result is None:
             notifications.show_error("Not enough points to calculate F-Function!")
+            return
+        self.displayEcdfResult(task.result, "F-Function of " + self.layer.name, task.unit, self.layer)
+
+
+    def onfFunctionTaskFinished(self):
+        task = self.fFunctionTask
+        self.displaySphotEcdfResult(task, 'F', task.analyzer.emptySpaceDistances)
 
 
     def ongFunctionTaskFinished(self):
-        analyzer = self.gFunctionTask.analyzer
-        if len(analyzer.pointsPerCell[self.gFunctionTask.label]) > 0:
-            plotWidget = PlotWidget(self.viewer)
-            analyzer.nnEcdfs[self.gFunctionTask.label].cdf.plot(plotWidget.ax)
-            plotWidget.xLabel = 'distances [' + self.gFunctionTask.unit + ']'
-            plotWidget.yLabel = "Empirical CDF"
-            maxDist = np.max(analyzer.nnDistances[self.gFunctionTask.label][0])
-            xValues = np.array(list(np.arange(0, math.floor(maxDist + 1), analyzer.scale[1])))
-            envelop = self.gFunctionTask.envelop
-            plotWidget.addData(xValues, envelop[0], "r--")
-            plotWidget.addData(xValues, envelop[1], "g--")
-            plotWidget.addData(xValues, envelop[2], "g--")
-            plotWidget.addData(xValues, envelop[3], "r--")
-            plotWidget.title = "G-Function of " + self.layer.name
-            plotWidget.display()
-        else:
-            notifications.show_error("Not enough points to calculate G-Function!")
+        task = self.gFunctionTask
+        self.displaySphotEcdfResult(task, 'G', task.analyzer.nnDistances)
 
 
     def onhFunctionTaskFinished(self):
-        analyzer = self.hFunctionTask.analyzer
-        if len(analyzer.pointsPerCell[self.hFunctionTask.label]) > 0:
-            plotWidget = PlotWidget(self.viewer)
-            analyzer.adEcdfs[self.hFunctionTask.label].cdf.plot(plotWidget.ax)
-            plotWidget.xLabel = 'distances [' + self.hFunctionTask.unit + ']'
-            plotWidget.yLabel = "Empirical CDF"
-            maxDist = np.max(analyzer.allDistances[self.hFunctionTask.label][0])
-            xValues = np.array(list(np.arange(0, math.floor(maxDist + 1), analyzer.scale[1])))
-            envelop = self.hFunctionTask.envelop
-            plotWidget.addData(xValues, envelop[0], "r--")
-            plotWidget.addData(xValues, envelop[1], "g--")
-            plotWidget.addData(xValues, envelop[2], "g--")
-            plotWidget.addData(xValues, envelop[3], "r--")
-            plotWidget.title = "H-Function of " + self.layer.name
-            plotWidget.display()
-        else:
+        task = self.hFunctionTask
+        self.displaySphotEcdfResult(task, 'H', task.analyzer.allDistances)
+
+
+    def displaySphotEcdfResult(self, task, name, distances):
+        """Display the result of a G-, F- or H-function task of sphot.
+
+        The tasks of sphot do not expose the simulated samples, only the
+        rows min, low, high and max of their envelope, evaluated on the grid
+        from 0 to the largest observed distance with the pixel size as step.
+        The observed ECDF is therefore evaluated on the same grid and the
+        envelope is taken from the task.
+
+        :param task: The finished task of sphot
+        :param name: The name of the function, F, G or H
+        :param distances: The distances per label of the analyzer of the task
+        """
+        label = task.label
+        analyzer = task.analyzer
+        if len(analyzer.pointsPerCell[label]) == 0:
+            notifications.show_error("Not enough points to calculate " + name + "-Function!")
+            return
+        observed = distances[label][0]
+        xValues = np.arange(0, math.floor(np.max(observed) + 1), analyzer.scale[1])
+        result = EcdfResult.fromSamples(name, label, observed, xValues=xValues)
+        result.envelop = np.asarray(task.envelop)
+        self.displayEcdfResult(result, name + "-Function of " + self.layer.name, task.unit, self.layer)
+
+
+    def _onKFunctionButtonClicked(self):
+        self.runRipleyTask('K')
+
+
+    def _onLFunctionButtonClicked(self):
+        self.runRipleyTask('L')
+
+
+    def _onPairCorrelationButtonClicked(self):
+        self.runRipleyTask('g')
+
+
+    def runRipleyTask(self, function):
+        label = int(self.gFunctionInput.text().strip())
+        if not label:
+            return
+        self.labelOfNucleus = label
+        text = self.gFunctionSpotsCombo.currentText()
+        spots, scale, unit = self.napariUtil.getDataAndScaleOfLayerWithName(text)
+        self.layer = self.napariUtil.getLayerWithName(text)
+        text = self.gFunctionLabelsCombo.currentText()
+        labels = self.napariUtil.getDataOfLayerWithName(text)
+        options = SpatialStatsOptionsWidget(None).options
+        self.ripleyTask = RipleyTask(spots, labels, scale, unit, label)
+        self.ripleyTask.function = function
+        self.ripleyTask.nrOfSimulations = options.get('nr_of_simulations')
+        self.ripleyTask.nrOfRadii = options.get('nr_of_radii')
+        self.ripleyTask.maxRadius = options.get('max_radius')
+        self.submitJob(self.ripleyTask.run, 'Calculating ' + function + '-Function...',
+                       onFinished=self.onRipleyTaskFinished,
+                       total=self.ripleyTask.nrOfSimulations, kind=TaskScheduler.PROCESS)
+
+
+    def onRipleyTaskFinished(self):
+        task = self.ripleyTask
+        if task.radii is None:
+            notifications.show_error("Not enough points to calculate " + task.function + "-Function!")
+            return
+        names = {'K': "K-Function", 'L': "L-Function", 'g': "Pair-Correlation-Function"}
+        plotWidget = self.plotManager.getPlot(names[task.function])
+        plotWidget.xLabel = 'radius [' + task.unit + ']'
+        plotWidget.yLabel = task.function + "(r)"
+        plotWidget.addData(task.radii, task.getResult(), "b-")
+        plotWidget.addData(task.radii, task.envelop[0], "r--")
+        plotWidget.addData(task.radii, task.envelop[1], "g--")
+        plotWidget.addData(task.radii, task.envelop[2], "g--")
+        plotWidget.addData(task.radii, task.envelop[3], "r--")
+        plotWidget.title = names[task.function] + " of " + self.layer.name
+        plotWidget.display()
+
+
+    def onHistogramHFunctionTaskFinished(self):
+        task = self.hFunctionTask
+        if task.result is None:
             notifications.show_error("Not enough points to calculate H-Function!")
+            return
+        spotsLayer = self.napariUtil.getLayerWithName(self.gFunctionSpotsCombo.currentText())
+        self.displayEcdfResult(task.result, "H-Function of " + spotsLayer.name, task.unit, spotsLayer)
+
+
+    def displayEcdfResult(self, result, title, unit, layer):
+        """Plot the observed ECDF and the envelope of the result, keep the
+        result for later comparisons and add its summary to the measurements.
+        """
+        plotWidget = self.plotManager.getPlot(result.name)
+        plotWidget.xLabel = 'distances [' + unit + ']'
+        plotWidget.yLabel = "Empirical CDF"
+        plotWidget.addData(result.xValues, result.observed, "b-")
+        if result.envelop is not None:
+            plotWidget.addData(result.xValues, result.envelop[0], "r--")
+            plotWidget.addData(result.xValues, result.envelop[1], "g--")
+            plotWidget.addData(result.xValues, result.envelop[2], "g--")
+            plotWidget.addData(result.xValues, result.envelop[3], "r--")
+        plotWidget.title = title
+        plotWidget.display()
+        self.ecdfResults[(result.name, result.label)] = result
+        self.addToMeasurements(result.getSummary(), layer)
+
+
+    def _onCrossTypeButtonClicked(self):
+        label = int(self.gFunctionInput.text().strip())
+        if not label:
+            return
+        self.labelOfNucleus = label
+        text = self.gFunctionSpotsCombo.currentText()
+        spotsA, scale, unit = self.napariUtil.getDataAndScaleOfLayerWithName(text)
+        self.spotsLayer = self.napariUtil.getLayerWithName(text)
+        text = self.crossSpotsCombo.currentText()
+        if not text:
+            return
+        spotsB = self.napariUtil.getDataOfLayerWithName(text)
+        text = self.gFunctionLabelsCombo.currentText()
+        labels = self.napariUtil.getDataOfLayerWithName(text)
+        options = SpatialStatsOptionsWidget(None).options
+        self.crossTypeTask = CrossTypeTask(spotsA, spotsB, labels, scale, unit, label)
+        self.crossTypeTask.nrOfPermutations = options.get('nr_of_simulations')
+        self.crossTypeTask.nrOfRadii = options.get('nr_of_radii')
+        self.crossTypeTask.maxRadius = options.get('max_radius')
+        self.submitJob(self.crossTypeTask.run, 'Calculating Cross G- and K-Functions...',
+                       onFinished=self.onCrossTypeTaskFinished,
+                       total=self.crossTypeTask.nrOfPermutations, kind=TaskScheduler.PROCESS)
+
+
+    def onCrossTypeTaskFinished(self):
+        task = self.crossTypeTask
+        if task.result is None:
+            notifications.show_error("Both populations need points in the cell to calculate cross functions!")
+            return
+        names = self.gFunctionSpotsCombo.currentText() + " - " + self.crossSpotsCombo.currentText()
+        self.displayEcdfResult(task.result, "Cross G-Function of " + names, task.unit, self.spotsLayer)
+        plotWidget = self.plotManager.getPlot("cross_K")
+        plotWidget.xLabel = 'radius [' + task.unit + ']'
+        plotWidget.yLabel = "K(r)"
+        plotWidget.addData(task.radii, task.k, "b-")
+        plotWidget.addData(task.radii, task.kEnvelop[0], "r--")
+        plotWidget.addData(task.radii, task.kEnvelop[1], "g--")
+        plotWidget.addData(task.radii, task.kEnvelop[2], "g--")
+        plotWidget.addData(task.radii, task.kEnvelop[3], "r--")
+        plotWidget.title = "Cross K-Function of " + names
+        plotWidget.display()
+        self.addToMeasurements(task.table, self.spotsLayer)
+
 
     def _onCropButtonPressed(self):
         text = self.cropImageLabelsCombo.currentText()
@@ -1028,12 +1584,7 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
             return
         self.cropLabelTask = CropLabelTask(labels, image, self.cropLabel)
 
-        worker = create_worker(self.cropLabelTask.run,
-                               _progress={'desc': 'Cropping image...'}
-                               )
-
-        worker.finished.connect(self.onCropLabelTaskFinished)
-        worker.start()
+        self.submitJob(self.cropLabelTask.run, 'Cropping image...', onFinished=self.onCropLabelTaskFinished)
 
 
     def onCropLabelTaskFinished(self):
@@ -1059,17 +1610,13 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         imageB = self.napariUtil.getDataOfLayerWithName(text2)
         self.correlator = Correlator(imageA, imageB)
         self.correlator.paddingMode = paddingMode
-        worker = create_worker(self.correlator.calculateCrossCorrelationProfile,
-                               _progress={'desc': 'Calculating Cross-Correlation...'}
-                               )
-        worker.finished.connect(self.onCrossCorrelationFinished)
-        worker.start()
+        self.submitJob(self.correlator.calculateCrossCorrelationProfile, 'Calculating Cross-Correlation...',
+                       onFinished=self.onCrossCorrelationFinished)
 
 
     def onCrossCorrelationFinished(self):
         text1 = self.ccInputACombo.currentText()
         text2 = self.ccInputBCombo.currentText()
-        self.correlator.calculateCrossCorrelationProfile()
         layer1 = self.napariUtil.getLayerWithName(text1)
         layer2 = self.napariUtil.getLayerWithName(text2)
         shape = layer1.data.shape
@@ -1088,16 +1635,137 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         title = "Cross-correlation: " + layer1.name + " - " + layer2.name
         if text1==text2:
             title = "Auto-correlation " + layer1.name
-        plotWidget = PlotWidget(self.viewer)
+        plotWidget = self.plotManager.getPlot("Correlation")
         plotWidget.addData(np.asarray(self.correlator.correlationProfile[0]) * layer1.scale[0], self.correlator.correlationProfile[1])
         plotWidget.title = title
         plotWidget.xLabel = "radius [" + str(layer1.units[0]) +"]"
         plotWidget.yLabel = "NCC"
-        data = np.asarray([np.asarray(self.correlator.correlationProfile[0]) * layer1.scale[0], self.correlator.correlationProfile[1]])
-        np.savetxt("corr.: " + text1 + "-" + text2 + ".csv", data, delimiter=",")
+        table = {'radius': np.asarray(self.correlator.correlationProfile[0]) * layer1.scale[0],
+                 'ncc': np.asarray(self.correlator.correlationProfile[1])}
+        self.writeCorrelationResults({"corr.: " + text1 + "-" + text2: table}, "corr.: " + text1 + "-" + text2)
         plotWidget.display()
 
 
+    def _onCorrelateAllButtonPressed(self):
+        text = self.ccInputACombo.currentText()
+        if not text:
+            return
+        self.layer = self.napariUtil.getLayerWithName(text)
+        shape = self.layer.data.shape
+        layers = [self.napariUtil.getLayerWithName(name) for name in self.napariUtil.getImageLayers()]
+        layers = [layer for layer in layers if layer.data.shape == shape]
+        self.multiChannelCorrelator = MultiChannelCorrelator([layer.data for layer in layers],
+                                                             [layer.name for layer in layers])
+        self.multiChannelCorrelator.paddingMode = self.ccPaddingModeCombo.currentText()
+        self.multiChannelCorrelator.keepCorrelationImages = self.ccShowImagesCheckBox.isChecked()
+        nrOfChannels = len(layers)
+        self.submitJob(self.multiChannelCorrelator.run, 'Calculating Cross-Correlations of all pairs...',
+                       onFinished=self.onMultiChannelCorrelationFinished,
+                       total=nrOfChannels + (nrOfChannels * (nrOfChannels + 1)) // 2)
+
+
+    def onMultiChannelCorrelationFinished(self):
+        correlator = self.multiChannelCorrelator
+        radii = np.asarray(correlator.table['radius']) * self.layer.scale[0]
+        table = dict(correlator.table)
+        table['radius'] = radii
+        plotWidget = self.plotManager.getPlot("Correlation of all pairs")
+        plotWidget.addCurves(radii, [profile[1] for profile in correlator.profiles.values()])
+        plotWidget.title = "Cross-correlation of all pairs"
+        plotWidget.xLabel = "radius [" + str(self.layer.units[0]) + "]"
+        plotWidget.yLabel = "NCC"
+        for (nameA, nameB), correlationImage in correlator.correlationImages.items():
+            layer = self.viewer.add_image(correlationImage,
+                                          name="corr.: " + nameA + "-" + nameB,
+                                          colormap='inferno',
+                                          blending='additive',
+                                          scale=self.layer.scale,
+                                          units=self.layer.units,
+                                          )
+            NapariUtil.copyOriginalPath(self.layer, layer)
+        if self.correlationsTableDockWidget:
+            self.correlationsTableDockWidget.close()
+        self.correlationsTableDockWidget = self.viewer.window.add_dock_widget(TableView(table),
+                                                                              area='right',
+                                                                              name='Cross-correlations',
+                                                                              tabify=True)
+        tables = {}
+        for (nameA, nameB), profile in correlator.profiles.items():
+            tables["corr.: " + nameA + "-" + nameB] = {'radius': radii, 'ncc': profile[1]}
+        self.writeCorrelationResults(tables, "corr.: all-pairs")
+        plotWidget.display()
+
+
+    def writeCorrelationResults(self, tables, batchName):
+        """Write the correlation profiles in a background thread into the
+        output folder configured in the correlation options or next to the
+        source image of self.layer.
+        """
+        options = CorrelationOptionsWidget(None).options
+        fileFormat = options.get('format')
+        if not self.resultsWriter or self.resultsWriter.format != fileFormat:
+            if self.resultsWriter:
+                self.resultsWriter.close()
+            self.resultsWriter = ResultsWriter(fileFormat)
+            self.resultsWriter.errorCallback = lambda error: self.resultsWriteFailed.emit(str(error))
+        folder = ResultsWriter.getOutputFolder(NapariUtil.getOriginalPath(self.layer),
+                                               options.get('output_folder'),
+                                               options.dataFolder)
+        for name, table in tables.items():
+            self.resultsWriter.add(name, table)
+        self.resultsWriter.flush(folder, batchName)
+
+
+    def _onLocalCorrelationButtonPressed(self):
+        text1 = self.ccInputACombo.currentText()
+        text2 = self.ccInputBCombo.currentText()
+        if not text1 or not text2:
+            return
+        self.layer = self.napariUtil.getLayerWithName(text1)
+        imageA = self.napariUtil.getDataOfLayerWithName(text1)
+        imageB = self.napariUtil.getDataOfLayerWithName(text2)
+        labels = None
+        mode = self.ccLocalModeCombo.currentText()
+        if mode == 'labels':
+            text = self.cropImageLabelsCombo.currentText()
+            if not text:
+                notifications.show_error("Local correlation per cell needs a labels layer!")
+                return
+            labels = self.napariUtil.getDataOfLayerWithName(text)
+        self.ccWindowSize = int(self.ccWindowSizeInput.text().strip())
+        self.localCorrelator = LocalCorrelator(imageA, imageB, labels)
+        self.localCorrelator.mode = mode
+        self.localCorrelator.windowSize = self.ccWindowSize
+        self.submitJob(self.localCorrelator.run, 'Calculating Local Cross-Correlation...',
+                       onFinished=self.onLocalCorrelationFinished)
+
+
+    def onLocalCorrelationFinished(self):
+        text1 = self.ccInputACombo.currentText()
+        text2 = self.ccInputBCombo.currentText()
+        correlator = self.localCorrelator
+        scale = np.asarray(self.layer.scale)
+        mapScale = scale
+        if correlator.mode == 'grid':
+            mapScale = scale * correlator.getStep()
+        layer = self.viewer.add_image(correlator.correlationMap,
+                                      name="local corr.: " + text1 + "-" + text2,
+                                      colormap='inferno',
+                                      blending='additive',
+                                      scale=mapScale,
+                                      translate=np.asarray(correlator.offset) * scale,
+                                      units=self.layer.units,
+                                      )
+        NapariUtil.copyOriginalPath(self.layer, layer)
+        if correlator.mode == 'labels':
+            if self.correlationsTableDockWidget:
+                self.correlationsTableDockWidget.close()
+            self.correlationsTableDockWidget = self.viewer.window.add_dock_widget(TableView(correlator.table),
+                                                                                  area='right',
+                                                                                  name='Local cross-correlations',
+                                                                                  tabify=True)
+
+
     def getActiveLayer(self):
         if len(self.viewer.layers) == 0:
             return None
@@ -1125,28 +1793,36 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
                                            scale=self.spotsLayer.scale,
                                            units=self.spotsLayer.units,
                                            blending='additive', size=2)
+            if isinstance(self.detection, RoiSpotDetectionTask):
+                layer.features = {'label': self.detection.spotLabels}
             NapariUtil.copyOriginalPath(self.spotsLayer, layer)
             return
-        self.decomposeDense = DecomposeDenseRegions(self.spotsLayer.data, self.detection.spots)
+        self.decomposeDense = ParallelDecomposeDenseRegions(self.spotsLayer.data, self.detection.spots)
         self.decomposeDense.voxelSize = tuple(self.spotsLayer.scale)
         self.decomposeDense.spotRadius = (options.get("radius_z"), options.get("radius_xy"), options.get("radius_xy"))
         self.decomposeDense.alpha = options.get("alpha")
         self.decomposeDense.beta = options.get("beta")
         self.decomposeDense.gamma = options.get("gamma")
-        worker = create_worker(self.decomposeDense.run,
-                               _progress={'total': 2, 'desc': 'Decomposing dense regions...'})
-        worker.finished.connect(self.onDecomposeFinished)
-        worker.start()
+        self.decomposeDense.nrOfWorkers = self.scheduler.getWorkersPerProcessJob()
+        self.submitJob(self.decomposeDense.run, 'Decomposing dense regions...', onFinished=self.onDecomposeFinished,
+                       group='detection', kind=TaskScheduler.PROCESS)
 
 
     def onDecomposeFinished(self):
         options = DetectionOptionsWidget(None).options
+        areas = self.decomposeDense.denseRegions['area']
+        notifications.show_info("Decomposed {} dense regions of {} to {} voxels into {} spots.".format(
+            self.decomposeDense.nrOfDenseRegions, min(areas, default=0), max(areas, default=0),
+            sum(self.decomposeDense.denseRegions['nr_of_spots'])))
         layer = self.viewer.add_points(self.decomposeDense.decomposedSpots,
                                        scale=tuple(self.spotsLayer.scale),
                                        units=self.spotsLayer.units,
                                        blending='additive', size=2)
+        if isinstance(self.detection, RoiSpotDetectionTask):
+            layer.features = {'label': SpotsUtil.getLabelsOfSpots(self.decomposeDense.decomposedSpots,
+                                                                  self.detection.labels)}
         NapariUtil.copyOriginalPath(self.spotsLayer, layer)
-        if options.get('display_avg_spot') and not self.decomposeDense.referenceSpot is None:
+        if options.get('display_avg_spot') and self.decomposeDense.referenceSpot is not None:
             layer = self.viewer.add_image(self.decomposeDense.referenceSpot,
                                   scale=tuple(self.spotsLayer.scale),
                                   units=self.spotsLayer.units,
@@ -1181,13 +1857,17 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
         pass
 
 
+    def ccWindowSizeChanged(self):
+        pass
+
+
     def onLayerAddedOrRemoved(self, event: Event):
         self.updateLayerSelectionComboBoxes()
 
 
     def updateLayerSelectionComboBoxes(self):
         labelComboBoxes = [self.gFunctionLabelsCombo, self.cropImageLabelsCombo]
-        spotComboBoxes = [self.gFunctionSpotsCombo]
+        spotComboBoxes = [self.gFunctionSpotsCombo, self.crossSpotsCombo]
         imageComboBoxes = [self.cropImageCombo, self.ccInputACombo, self.ccInputBCombo]
         labelLayers = self.napariUtil.getLabelLayers()
         spotLayers = self.napariUtil.getPointsLayers()
@@ -1198,6 +1878,7 @@ class SpatialHeterogeneityOfTranscriptionWidget(QWidget):
             WidgetTool.replaceItemsInComboBox(comboBox, spotLayers)
         for comboBox in imageComboBoxes:
             WidgetTool.replaceItemsInComboBox(comboBox, imageLayers)
+        WidgetTool.replaceItemsInComboBox(self.detectInCombo, [self.wholeImageText] + labelLayers)
 
 
 
@@ -1337,6 +2018,144 @@ class DetectionOptionsWidget(OptionsWidget):
         self.options.set('display_avg_spot', (self.displayMeanSpotCheckBox.isChecked()))
 
 
+class CorrelationOptionsWidget(OptionsWidget):
+
+
+    def __init__(self, viewer):
+        super().__init__(viewer, "napari-sphot", "correlation")
+        self.options.setDefaultValues(
+            {
+                'output_folder': '',
+                'format': 'csv'
+            }
+        )
+        self.options.load()
+        self.outputFolderInput = None
+        self.formatCombo = None
+        self.createLayout()
+
+
+    def createLayout(self):
+        mainLayout = QVBoxLayout()
+        formLayout = QFormLayout()
+        buttonsLayout = QHBoxLayout()
+        mainLayout.addLayout(formLayout)
+        mainLayout.addLayout(buttonsLayout)
+        outputFolderLabel, self.outputFolderInput = WidgetTool.getLineInput(self, "Output folder: ",
+                                                                            self.options.get('output_folder'),
+                                                                            self.fieldWidth * 4,
+                                                                            self.ignoreChange)
+        self.outputFolderInput.setToolTip("Leave empty to write into a folder next to the source image")
+        formatLabel, self.formatCombo = WidgetTool.getComboInput(self, "Format: ", ResultsWriter.formats)
+        self.formatCombo.setCurrentText(self.options.get('format'))
+        okButton = QPushButton("&OK")
+        okButton.clicked.connect(self._onOKButtonClicked)
+        cancelButton = QPushButton("&Cancel")
+        cancelButton.clicked.connect(self._onCancelButtonClicked)
+        buttonsLayout.addWidget(okButton)
+        buttonsLayout.addWidget(cancelButton)
+        formLayout.addRow(outputFolderLabel, self.outputFolderInput)
+        formLayout.addRow(formatLabel, self.formatCombo)
+        self.setLayout(mainLayout)
+
+
+    def transferValues(self):
+        self.options.set('output_folder', self.outputFolderInput.text().strip())
+        self.options.set('format', self.formatCombo.currentText())
+
+
+
+class SpatialStatsOptionsWidget(OptionsWidget):
+
+    fFunctionModes = ['sampled', 'exact']
+    hFunctionModes = ['exact', 'histogram']
+
+
+    def __init__(self, viewer):
+        super().__init__(viewer, "napari-sphot", "spatial_stats")
+        self.options.setDefaultValues(
+            {
+                'nr_of_simulations': 100,
+                'nr_of_radii': 50,
+                'max_radius': 0.0,
+                'f_function_mode': 'sampled',
+                'h_function_mode': 'exact',
+                'nr_of_bins': 1000,
+                'quadrat_size': 0.0
+            }
+        )
+        self.options.load()
+        self.nrOfSimulationsInput = None
+        self.nrOfRadiiInput = None
+        self.maxRadiusInput = None
+        self.fFunctionModeCombo = None
+        self.hFunctionModeCombo = None
+        self.nrOfBinsInput = None
+        self.quadratSizeInput = None
+        self.createLayout()
+
+
+    def createLayout(self):
+        mainLayout = QVBoxLayout()
+        formLayout = QFormLayout()
+        buttonsLayout = QHBoxLayout()
+        mainLayout.addLayout(formLayout)
+        mainLayout.addLayout(buttonsLayout)
+        nrOfSimulationsLabel, self.nrOfSimulationsInput = WidgetTool.getLineInput(self, "Simulations: ",
+                                                                      self.options.get('nr_of_simulations'),
+                                                                      self.fieldWidth,
+                                                                      self.ignoreChange)
+        nrOfRadiiLabel, self.nrOfRadiiInput = WidgetTool.getLineInput(self, "Nr. of radii: ",
+                                                                      self.options.get('nr_of_radii'),
+                                                                      self.fieldWidth,
+                                                                      self.ignoreChange)
+        maxRadiusLabel, self.maxRadiusInput = WidgetTool.getLineInput(self, "Max. radius: ",
+                                                                      self.options.get('max_radius'),
+                                                                      self.fieldWidth,
+                                                                      self.ignoreChange)
+        self.maxRadiusInput.setToolTip("0 for a quarter of the smallest extent of the cell")
+        fFunctionModeLabel, self.fFunctionModeCombo = WidgetTool.getComboInput(self, "F-Function: ",
+                                                                               self.fFunctionModes)
+        self.fFunctionModeCombo.setCurrentText(self.options.get('f_function_mode'))
+        hFunctionModeLabel, self.hFunctionModeCombo = WidgetTool.getComboInput(self, "H-Function: ",
+                                                                               self.hFunctionModes)
+        self.hFunctionModeCombo.setCurrentText(self.options.get('h_function_mode'))
+        nrOfBinsLabel, self.nrOfBinsInput = WidgetTool.getLineInput(self, "Nr. of bins: ",
+                                                                    self.options.get('nr_of_bins'),
+                                                                    self.fieldWidth,
+                                                                    self.ignoreChange)
+        quadratSizeLabel, self.quadratSizeInput = WidgetTool.getLineInput(self, "Quadrat size: ",
+                                                                          self.options.get('quadrat_size'),
+                                                                          self.fieldWidth,
+                                                                          self.ignoreChange)
+        self.quadratSizeInput.setToolTip("0 for 8 times the largest voxel size")
+        okButton = QPushButton("&OK")
+        okButton.clicked.connect(self._onOKButtonClicked)
+        cancelButton = QPushButton("&Cancel")
+        cancelButton.clicked.connect(self._onCancelButtonClicked)
+        buttonsLayout.addWidget(okButton)
+        buttonsLayout.addWidget(cancelButton)
+        formLayout.addRow(nrOfSimulationsLabel, self.nrOfSimulationsInput)
+        formLayout.addRow(nrOfRadiiLabel, self.nrOfRadiiInput)
+        formLayout.addRow(maxRadiusLabel, self.maxRadiusInput)
+        formLayout.addRow(fFunctionModeLabel, self.fFunctionModeCombo)
+        formLayout.addRow(hFunctionModeLabel, self.hFunctionModeCombo)
+        formLayout.addRow(nrOfBinsLabel, self.nrOfBinsInput)
+        formLayout.addRow(quadratSizeLabel, self.quadratSizeInput)
+        self.setLayout(mainLayout)
+
+
+    def transferValues(self):
+        self.options.set('nr_of_simulations', int(self.nrOfSimulationsInput.text().strip()))
+        self.options.set('nr_of_radii', int(self.nrOfRadiiInput.text().strip()))
+        self.options.set('max_radius', float(self.maxRadiusInput.text().strip()))
+        self.options.set('f_function_mode', self.fFunctionModeCombo.currentText())
+        self.options.set('h_function_mode', self.hFunctionModeCombo.currentText())
+        self.options.set('nr_of_bins', int(self.nrOfBinsInput.text().strip()))
+        self.options.set('quadrat_size', float(self.quadratSizeInput.text().strip()))
+
+
+
 class SegmentationOptionsWidget(OptionsWidget):
 
 
@@ -1348,7 +2167,15 @@ class SegmentationOptionsWidget(OptionsWidget):
                 'cellprob_threshold': 0.0,
                 'flow_threshold': 0.4,
                 'min_size': 0.0,
-                'remove_border_objects': True
+                'remove_border_objects': True,
+                'tiled': False,
+                'tile_depth': 64,
+                'tile_size': 512,
+                'tile_overlap_z': 16,
+                'tile_overlap': 64,
+                'nr_of_workers': 2,
+                'scale_factor': 1.0,
+                'upsampling': 'nearest'
             }
         )
         self.options.load()
@@ -1357,6 +2184,14 @@ class SegmentationOptionsWidget(OptionsWidget):
         self.flowThresholdInput = None
         self.minSizeInput = None
         self.removeCheckbox = None
+        self.tiledCheckbox = None
+        self.tileDepthInput = None
+        self.tileSizeInput = None
+        self.tileOverlapZInput = None
+        self.tileOverlapInput = None
+        self.nrOfWorkersInput = None
+        self.scaleFactorInput = None
+        self.upsamplingCombo = None
         self.createLayout()
 
 
@@ -1384,6 +2219,37 @@ class SegmentationOptionsWidget(OptionsWidget):
                                                                                self.minSizeChanged)
         self.removeCheckbox = QCheckBox("Remove Edge", self)
         self.removeCheckbox.setChecked(self.options.get('remove_border_objects'))
+        self.tiledCheckbox = QCheckBox("Tiled", self)
+        self.tiledCheckbox.setChecked(self.options.get('tiled'))
+        tileDepthLabel, self.tileDepthInput = WidgetTool.getLineInput(self, "Tile depth: ",
+                                                                      self.options.get('tile_depth'),
+                                                                      self.fieldWidth,
+                                                                      self.ignoreChange)
+        tileSizeLabel, self.tileSizeInput = WidgetTool.getLineInput(self, "Tile size xy: ",
+                                                                    self.options.get('tile_size'),
+                                                                    self.fieldWidth,
+                                                                    self.ignoreChange)
+        tileOverlapZLabel, self.tileOverlapZInput = WidgetTool.getLineInput(self, "Tile overlap z: ",
+                                                                            self.options.get('tile_overlap_z'),
+                                                                            self.fieldWidth,
+                                                                            self.ignoreChange)
+        tileOverlapLabel, self.tileOverlapInput = WidgetTool.getLineInput(self, "Tile overlap xy: ",
+                                                                          self.options.get('tile_overlap'),
+                                                                          self.fieldWidth,
+                                                                          self.ignoreChange)
+        nrOfWorkersLabel, self.nrOfWorkersInput = WidgetTool.getLineInput(self, "Tile workers: ",
+                                                                          self.options.get('nr_of_workers'),
+                                                                          self.fieldWidth,
+                                                                          self.ignoreChange)
+        self.nrOfWorkersInput.setToolTip("The number of tiles segmented at the same time, each worker loads its own model")
+        scaleFactorLabel, self.scaleFactorInput = WidgetTool.getLineInput(self, "Scale factor: ",
+                                                                          self.options.get('scale_factor'),
+                                                                          self.fieldWidth,
+                                                                          self.ignoreChange)
+        self.scaleFactorInput.setToolTip("Segment at the smallest voxel size divided by the factor, 1 for the original resolution")
+        upsamplingLabel, self.upsamplingCombo = WidgetTool.getComboInput(self, "Upsampling: ",
+                                                                         ResampledSegmentation.upsamplingModes)
+        self.upsamplingCombo.setCurrentText(self.options.get('upsampling'))
         okButton = QPushButton("&OK")
         okButton.clicked.connect(self._onOKButtonClicked)
         cancelButton = QPushButton("&Cancel")
@@ -1395,6 +2261,14 @@ class SegmentationOptionsWidget(OptionsWidget):
         formLayout.addRow(flowLabel, self.flowThresholdInput)
         formLayout.addRow(minSizeLabel, self.minSizeInput)
         formLayout.addWidget(self.removeCheckbox)
+        formLayout.addWidget(self.tiledCheckbox)
+        formLayout.addRow(tileDepthLabel, self.tileDepthInput)
+        formLayout.addRow(tileSizeLabel, self.tileSizeInput)
+        formLayout.addRow(tileOverlapZLabel, self.tileOverlapZInput)
+        formLayout.addRow(tileOverlapLabel, self.tileOverlapInput)
+        formLayout.addRow(nrOfWorkersLabel, self.nrOfWorkersInput)
+        formLayout.addRow(scaleFactorLabel, self.scaleFactorInput)
+        formLayout.addRow(upsamplingLabel, self.upsamplingCombo)
         self.setLayout(mainLayout)
 
 
@@ -1421,5 +2295,13 @@ class SegmentationOptionsWidget(OptionsWidget):
         self.options.set('flow_threshold', float(self.flowThresholdInput.text().strip()))
         self.options.set('min_size', float(self.minSizeInput.text().strip()))
         self.options.set('remove_border_objects', (self.removeCheckbox.isChecked()))
+        self.options.set('tiled', self.tiledCheckbox.isChecked())
+        self.options.set('tile_depth', int(self.tileDepthInput.text().strip()))
+        self.options.set('tile_size', int(self.tileSizeInput.text().strip()))
+        self.options.set('tile_overlap_z', int(self.tileOverlapZInput.text().strip()))
+        self.options.set('tile_overlap', int(self.tileOverlapInput.text().strip()))
+        self.options.set('nr_of_workers', max(1, int(self.nrOfWorkersInput.text().strip())))
+        self.options.set('scale_factor', float(self.scaleFactorInput.text().strip()))
+        self.options.set('upsampling', self.upsamplingCombo.currentText())
 
 
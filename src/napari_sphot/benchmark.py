@@ -0,0 +1,316 @@
+import argparse
+import inspect
+
+import numpy as np
+from qtpy.QtWidgets import QApplication
+from sphot.image import (
+    ConvexHullTask,
+    DelaunayTask,
+    FFunctionTask,
+    GFunctionTask,
+    HFunctionTask,
+    MeasureTask,
+    VoronoiTask,
+)
+
+from napari_sphot.correlation import LocalCorrelator, MultiChannelCorrelator
+from napari_sphot.label_filter import LabelFilterTask
+from napari_sphot.qtutil import TableView
+from napari_sphot.spatial_stats import (
+    ExactFFunctionTask,
+    HistogramHFunctionTask,
+)
+from napari_sphot.spots_util import SpotsUtil
+from napari_sphot.synthetic import SyntheticEmbryo
+from napari_sphot.telemetry import Measurement, Telemetry
+
+
+class Benchmark:
+    """Time the analysis tasks of the plugin on synthetic embryos of
+    increasing size, so that changes of the scaling of a task can be seen
+    without real data.
+
+    For each size one embryo is created and each case is run on it. The
+    preparation of the input of a case is not timed. As in the telemetry, the
+    cpu time is the time of the thread running the case. The records have the
+    fields of the records of the telemetry, plus the case and the size.
+    """
+
+    def __init__(self, sizes=("small", "medium"), cases=None, telemetry=None):
+        """Create a benchmark of the given cases on embryos of the given sizes.
+
+        :param sizes: The sizes of the embryos, see SyntheticEmbryo.sizes
+        :param cases: The names of the cases run or None for all cases
+        :param telemetry: If given, the records are also added to the telemetry
+        :type telemetry: napari_sphot.telemetry.Telemetry
+        """
+        self.sizes = list(sizes)
+        self.cases = list(cases) if cases else list(self.getCases())
+        self.telemetry = telemetry
+        self.seed = 0
+        self.nrOfSamples = 100
+        self.nrOfSimulations = 19
+        self.records = []
+        self.application = None
+
+    def getCases(self):
+        """Answer the cases by name. Each case prepares its input from an
+        embryo and answers the function that is timed.
+        """
+        return {
+            "relabel": self.prepareRelabel,
+            "spot export": self.prepareSpotExport,
+            "measure": self.prepareMeasure,
+            "g-function": self.prepareGFunction,
+            "f-function": self.prepareFFunction,
+            "h-function": self.prepareHFunction,
+            "exact f-function": self.prepareExactFFunction,
+            "histogram h-function": self.prepareHistogramHFunction,
+            "convex hull": self.prepareConvexHull,
+            "delaunay": self.prepareDelaunay,
+            "voronoi": self.prepareVoronoi,
+            "correlation": self.prepareCorrelation,
+            "local correlation": self.prepareLocalCorrelation,
+            "table rendering": self.prepareTableRendering,
+        }
+
+    def run(self):
+        """Run the cases on the embryos, yields once per case and size."""
+        unknown = set(self.cases) - set(self.getCases())
+        if unknown:
+            raise ValueError(
+                "Unknown cases "
+                + str(sorted(unknown))
+                + ", use some of "
+                + str(list(self.getCases()))
+            )
+        self.records = []
+        cases = self.getCases()
+        for size in self.sizes:
+            embryo = SyntheticEmbryo.ofSize(size, seed=self.seed)
+            embryo.run()
+            for case in self.cases:
+                function = cases[case](embryo)
+                self.addRecord(
+                    self.measure(function, embryo).getRecord(
+                        case=case, size=size
+                    )
+                )
+                yield
+
+    @staticmethod
+    def measure(function, embryo):
+        """Run the function, and the generator it answers if any, to its end
+        and answer the measurement, with the input sizes of the embryo.
+        """
+
+        def runToEnd():
+            result = function()
+            if inspect.isgenerator(result):
+                for _ in result:
+                    pass
+
+        measurement = Measurement(embryo)
+        task = getattr(function, "__self__", None)
+        measurement.taskName = (
+            type(task).__name__ if task is not None else None
+        )
+        measurement.wrap(runToEnd)()
+        return measurement
+
+    def addRecord(self, record):
+        self.records.append(record)
+        if self.telemetry is not None:
+            self.telemetry.add(record)
+
+    def getTable(self):
+        """Answer the records as a table with one column per field."""
+        if not self.records:
+            return {}
+        return {
+            key: [record.get(key) for record in self.records]
+            for key in self.records[0]
+        }
+
+    @staticmethod
+    def getLabelWithMostSpots(embryo):
+        spotLabels = SpotsUtil.getLabelsOfSpots(embryo.spots, embryo.labels)
+        return int(
+            np.argmax(np.bincount(spotLabels[spotLabels > 0], minlength=2))
+        )
+
+    @staticmethod
+    def getSpotsTable(embryo):
+        table = {
+            "id": [],
+            "label": [],
+            "z": [],
+            "y": [],
+            "x": [],
+            "sz": [],
+            "sy": [],
+            "sx": [],
+        }
+        for _ in SpotsUtil.addSpotsToTable(
+            embryo.spots, embryo.labels, embryo.scale, table
+        ):
+            pass
+        return table
+
+    def prepareRelabel(self, embryo):
+        labels = embryo.labels * 3
+        return lambda: LabelFilterTask.remapLabels(labels)
+
+    def prepareSpotExport(self, embryo):
+        return lambda: self.getSpotsTable(embryo)
+
+    def prepareMeasure(self, embryo):
+        return MeasureTask(
+            embryo.spots, embryo.labels, embryo.scale, embryo.units
+        ).run
+
+    def prepareGFunction(self, embryo):
+        task = GFunctionTask(
+            embryo.spots,
+            embryo.labels,
+            embryo.scale,
+            embryo.units[0],
+            self.getLabelWithMostSpots(embryo),
+        )
+        task.nrOfSamples = self.nrOfSamples
+        return task.run
+
+    def prepareFFunction(self, embryo):
+        task = FFunctionTask(
+            embryo.spots,
+            embryo.labels,
+            embryo.scale,
+            embryo.units[0],
+            self.getLabelWithMostSpots(embryo),
+        )
+        task.nrOfSamples = self.nrOfSamples
+        return task.run
+
+    def prepareHFunction(self, embryo):
+        task = HFunctionTask(
+            embryo.spots,
+            embryo.labels,
+            embryo.scale,
+            embryo.units[0],
+            self.getLabelWithMostSpots(embryo),
+        )
+        task.nrOfSamples = self.nrOfSamples
+        return task.run
+
+    def prepareExactFFunction(self, embryo):
+        task = ExactFFunctionTask(
+            embryo.spots,
+            embryo.labels,
+            embryo.scale,
+            embryo.units[0],
+            self.getLabelWithMostSpots(embryo),
+        )
+        task.nrOfSimulations = self.nrOfSimulations
+        task.seed = self.seed
+        return task.run
+
+    def prepareHistogramHFunction(self, embryo):
+        task = HistogramHFunctionTask(
+            embryo.spots,
+            embryo.labels,
+            embryo.scale,
+            embryo.units[0],
+            self.getLabelWithMostSpots(embryo),
+        )
+        task.nrOfSimulations = self.nrOfSimulations
+        task.seed = self.seed
+        return task.run
+
+    def prepareConvexHull(self, embryo):
+        return ConvexHullTask(
+            embryo.spots,
+            embryo.labels,
+            embryo.scale,
+            embryo.units[0],
+            self.getLabelWithMostSpots(embryo),
+        ).run
+
+    def prepareDelaunay(self, embryo):
+        return DelaunayTask(
+            embryo.spots,
+            embryo.labels,
+            embryo.scale,
+            embryo.units[0],
+            self.getLabelWithMostSpots(embryo),
+        ).run
+
+    def prepareVoronoi(self, embryo):
+        return VoronoiTask(
+            embryo.spots,
+            embryo.labels,
+            embryo.scale,
+            embryo.units[0],
+            self.getLabelWithMostSpots(embryo),
+        ).run
+
+    def prepareCorrelation(self, embryo):
+        return MultiChannelCorrelator(
+            [embryo.image, embryo.nucleiImage], names=["spots", "nuclei"]
+        ).run
+
+    def prepareLocalCorrelation(self, embryo):
+        correlator = LocalCorrelator(
+            embryo.image, embryo.nucleiImage, labels=embryo.labels
+        )
+        correlator.mode = "labels"
+        return correlator.run
+
+    def prepareTableRendering(self, embryo):
+        if QApplication.instance() is None:
+            self.application = QApplication([])
+        table = self.getSpotsTable(embryo)
+        return lambda: TableView(table)
+
+
+def main(arguments=None):
+    """Run the benchmark from the command line and print the records, for
+    example: python -m napari_sphot.benchmark --sizes small medium --output benchmark.jsonl
+    """
+    parser = argparse.ArgumentParser(
+        description="Time the analysis tasks of napari-sphot on synthetic embryos."
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        default=["small", "medium"],
+        choices=list(SyntheticEmbryo.sizes),
+    )
+    parser.add_argument("--cases", nargs="+", default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="The json-lines file to which the records are appended",
+    )
+    options = parser.parse_args(arguments)
+    telemetry = Telemetry(path=options.output) if options.output else None
+    benchmark = Benchmark(
+        sizes=options.sizes, cases=options.cases, telemetry=telemetry
+    )
+    benchmark.seed = options.seed
+    for _ in benchmark.run():
+        record = benchmark.records[-1]
+        print(
+            record["size"],
+            record["case"],
+            record["wall_time_s"],
+            record["cpu_time_s"],
+            record["peak_rss_increase_mb"],
+            sep="\t",
+            flush=True,
+        )
+    return benchmark
+
+
+if __name__ == "__main__":
+    main()
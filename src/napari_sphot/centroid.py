@@ -0,0 +1,168 @@
+import numpy as np
+from scipy import ndimage
+
+from napari_sphot.spots_util import SpotsUtil
+
+
+class CentroidProfilesTask:
+    """Calculate the distances of the spots from the centroids of their cells
+    and the radial and axial density profiles of all cells in one pass.
+
+    The centroids of all labels are calculated with one call of
+    ndimage.center_of_mass and the spots are assigned to the labels in one
+    lookup. The spot counts and the volumes per bin are accumulated for all
+    cells at once with grouped bincounts, the volumes plane by plane, so that
+    the memory needed does not grow with the size of the label image.
+    """
+
+    profiles = ["radius", "z", "y", "x"]
+
+    def __init__(self, labels, spots, scale, units):
+        """Create a task for the given cell labels and spots.
+
+        :param labels: The label image of the cells
+        :type labels: numpy.ndarray
+        :param spots: The coordinates of the spots in pixels
+        :type spots: numpy.ndarray
+        :param scale: The voxel size
+        :param units: The units of the voxel size
+        """
+        self.labels = labels
+        self.spots = np.asarray(spots)
+        self.scale = np.asarray(scale, dtype=float)
+        self.units = units
+        self.binWidth = None
+        self.labelValues = None
+        self.centroids = None
+        self.distancesTable = {}
+        self.table = {}
+
+    def getBinWidth(self):
+        if self.binWidth is None:
+            return float(np.max(self.scale))
+        return float(self.binWidth)
+
+    def run(self):
+        """Calculate the centroids, the distances of the spots and the density
+        profiles of all cells, yields once per plane of the label image.
+        """
+        labels = np.asarray(self.labels)
+        self.labelValues = np.unique(labels)
+        self.labelValues = self.labelValues[self.labelValues > 0]
+        centroids = np.array(
+            ndimage.center_of_mass(labels, labels, self.labelValues)
+        ).reshape(-1, labels.ndim)
+        self.centroids = centroids * self.scale
+        lookup = np.zeros((int(labels.max()) + 1, labels.ndim))
+        lookup[self.labelValues] = self.centroids
+        rowOfLabel = np.zeros(len(lookup), dtype=np.int64)
+        rowOfLabel[self.labelValues] = np.arange(len(self.labelValues))
+        binWidth = self.getBinWidth()
+        extent = np.array(labels.shape) * self.scale
+        nrOfRadialBins = int(np.ceil(np.linalg.norm(extent) / binWidth)) + 1
+        halfAxialBins = np.ceil(extent / binWidth).astype(np.int64) + 1
+        nrOfBins = [nrOfRadialBins] + list(2 * halfAxialBins)
+        nrOfCells = len(self.labelValues)
+        volumes = [np.zeros(nrOfCells * bins) for bins in nrOfBins]
+        for z in range(labels.shape[0]):
+            plane = labels[z]
+            coordinates = np.nonzero(plane)
+            if len(coordinates[0]) > 0:
+                voxelLabels = plane[coordinates]
+                points = np.column_stack(
+                    (np.full(len(voxelLabels), z),) + coordinates
+                )
+                self.addToHistograms(
+                    volumes,
+                    points * self.scale - lookup[voxelLabels],
+                    rowOfLabel[voxelLabels],
+                    nrOfBins,
+                    halfAxialBins,
+                    binWidth,
+                )
+            yield
+        voxelVolume = np.prod(self.scale)
+        volumes = [volume * voxelVolume for volume in volumes]
+        spotLabels = SpotsUtil.getLabelsOfSpots(self.spots, labels)
+        inCell = spotLabels > 0
+        spotLabels = spotLabels[inCell]
+        offsets = self.spots[inCell] * self.scale - lookup[spotLabels]
+        counts = [np.zeros(nrOfCells * bins) for bins in nrOfBins]
+        self.addToHistograms(
+            counts,
+            offsets,
+            rowOfLabel[spotLabels],
+            nrOfBins,
+            halfAxialBins,
+            binWidth,
+        )
+        self.distancesTable = {
+            "label": spotLabels,
+            "spot": np.nonzero(inCell)[0],
+            "distance": np.linalg.norm(offsets, axis=1),
+        }
+        self.table = self.getTable(
+            counts, volumes, nrOfBins, halfAxialBins, binWidth
+        )
+
+    @staticmethod
+    def addToHistograms(
+        histograms, offsets, rows, nrOfBins, halfAxialBins, binWidth
+    ):
+        """Add the offsets from the centroids to the radial and axial histograms
+        of the cells in the given rows, with one bincount per histogram.
+        """
+        radii = np.linalg.norm(offsets, axis=1)
+        bins = [
+            np.minimum((radii / binWidth).astype(np.int64), nrOfBins[0] - 1)
+        ]
+        for axis, half in enumerate(halfAxialBins):
+            axialBins = (
+                np.floor(offsets[:, axis] / binWidth).astype(np.int64) + half
+            )
+            bins.append(np.clip(axialBins, 0, 2 * half - 1))
+        for histogram, binIndex, size in zip(
+            histograms, bins, nrOfBins, strict=False
+        ):
+            histogram += np.bincount(
+                rows * size + binIndex, minlength=len(histogram)
+            )
+
+    def getTable(self, counts, volumes, nrOfBins, halfAxialBins, binWidth):
+        """Answer a long table with one row per cell, profile and bin that
+        contains a part of the cell or a spot. The density of bins containing
+        spots but no voxel center of the cell is not defined.
+        """
+        table = {
+            "label": [],
+            "profile": [],
+            "position": [],
+            "nr_of_spots": [],
+            "volume": [],
+            "density": [],
+        }
+        shifts = [0] + list(halfAxialBins)
+        for profile, count, volume, size, shift in zip(
+            self.profiles, counts, volumes, nrOfBins, shifts, strict=False
+        ):
+            count = count.reshape(-1, size)
+            volume = volume.reshape(-1, size)
+            rows, binIndex = np.nonzero(volume + count)
+            table["label"].extend(self.labelValues[rows].tolist())
+            table["profile"].extend([profile] * len(rows))
+            table["position"].extend(
+                ((binIndex - shift + 0.5) * binWidth).tolist()
+            )
+            table["nr_of_spots"].extend(
+                count[rows, binIndex].astype(np.int64).tolist()
+            )
+            table["volume"].extend(volume[rows, binIndex].tolist())
+            density = np.full(len(rows), np.nan)
+            np.divide(
+                count[rows, binIndex],
+                volume[rows, binIndex],
+                out=density,
+                where=volume[rows, binIndex] > 0,
+            )
+            table["density"].extend(density.tolist())
+        return table
@@ -0,0 +1,337 @@
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import fft
+
+
+class MultiChannelCorrelator:
+    """Calculate the normalized cross-correlations of all pairs of a list of
+    channels.
+
+    The spectrum of each channel is calculated only once and cached. The
+    correlation of a pair and its radial profile are derived from the cached
+    spectra, the pairs are processed in parallel.
+    """
+
+    def __init__(self, images, names=None):
+        """Create a correlator for the given channels.
+
+        :param images: The channels, all with the same shape
+        :type images: [numpy.ndarray]
+        :param names: The names of the channels, used as column names of the
+                      result table
+        :type names: [str]
+        """
+        self.images = images
+        self.names = names
+        if not self.names:
+            self.names = [str(index) for index in range(len(images))]
+        self.paddingMode = "constant"
+        self.keepCorrelationImages = False
+        self.nrOfWorkers = None
+        self.shape = None
+        self.paddedShape = None
+        self.spectra = []
+        self.radiusIndex = None
+        self.radiusCounts = None
+        self.maxRadius = 0
+        self.profiles = {}
+        self.correlationImages = {}
+        self.matrix = None
+        self.table = {}
+
+    def getPairs(self):
+        """Answer the index pairs (i, j) with i <= j of the channels.
+
+        :return: The pairs of channel indices, including the auto-correlations
+        :rtype: [(int, int)]
+        """
+        return list(
+            itertools.combinations_with_replacement(range(len(self.images)), 2)
+        )
+
+    def run(self):
+        """Calculate the spectra, the correlations and the profiles of all pairs.
+        Yields once per processed channel and once per processed pair.
+        """
+        self.shape = self.images[0].shape
+        for image in self.images:
+            if not image.shape == self.shape:
+                raise ValueError(
+                    "All channels must have the same shape, got "
+                    + str(image.shape)
+                    + " and "
+                    + str(self.shape)
+                )
+        self.spectra = []
+        for image in self.images:
+            self.spectra.append(self.getSpectrum(image))
+            yield
+        self.calculateRadiusIndex()
+        pairs = self.getPairs()
+        self.profiles = {}
+        self.correlationImages = {}
+        self.matrix = np.zeros((len(self.images), len(self.images)))
+        with ThreadPoolExecutor(max_workers=self.nrOfWorkers) as executor:
+            for (i, j), (profile, correlationImage) in zip(
+                pairs, executor.map(self.correlatePair, pairs), strict=False
+            ):
+                key = (self.names[i], self.names[j])
+                self.profiles[key] = profile
+                self.matrix[i, j] = profile[1][0]
+                self.matrix[j, i] = profile[1][0]
+                if self.keepCorrelationImages:
+                    self.correlationImages[key] = correlationImage
+                yield
+        self.table = self.getTable()
+
+    def getSpectrum(self, image):
+        """Answer the spectrum of the normalized and padded image.
+
+        The image is normalized to zero mean and unit variance and divided
+        by the square root of its size, so that the correlation of two
+        spectra is the normalized cross correlation.
+        """
+        data = np.asarray(image, dtype=np.float32)
+        std = data.std()
+        if std == 0:
+            std = 1
+        data = (data - data.mean()) / (std * np.sqrt(data.size))
+        padding = [(size // 2, size - size // 2) for size in data.shape]
+        padded = np.pad(data, padding, mode=self.paddingMode)
+        self.paddedShape = padded.shape
+        return fft.rfftn(padded, workers=self.nrOfWorkers)
+
+    def calculateRadiusIndex(self):
+        """Calculate the integer distance of each voxel of the (shifted)
+        correlation image to its center and the number of voxels per distance.
+        """
+        center = [size // 2 for size in self.paddedShape]
+        grids = np.ogrid[tuple(slice(0, size) for size in self.paddedShape)]
+        squared = sum(
+            (grid - c) ** 2 for grid, c in zip(grids, center, strict=False)
+        )
+        self.radiusIndex = np.sqrt(squared).astype(np.int32).ravel()
+        self.maxRadius = min(self.shape) // 2
+        self.radiusCounts = np.bincount(self.radiusIndex)[: self.maxRadius + 1]
+
+    def correlatePair(self, pair):
+        """Answer the radial profile and the correlation image of the pair
+        of channels with the indices in pair.
+
+        :param pair: The indices of the two channels
+        :type pair: (int, int)
+        :return: The profile as (radii, ncc) and the correlation image cropped
+                 to the shape of the input or None if the images are not kept.
+        """
+        i, j = pair
+        product = self.spectra[i] * np.conj(self.spectra[j])
+        correlation = fft.irfftn(product, s=self.paddedShape, workers=1)
+        correlation = fft.fftshift(correlation)
+        sums = np.bincount(self.radiusIndex, weights=correlation.ravel())[
+            : self.maxRadius + 1
+        ]
+        radii = np.arange(self.maxRadius + 1)
+        profile = (radii, sums / self.radiusCounts)
+        correlationImage = None
+        if self.keepCorrelationImages:
+            correlationImage = correlation[
+                tuple(
+                    slice(size // 2, size // 2 + size) for size in self.shape
+                )
+            ]
+        return profile, correlationImage
+
+    def getTable(self):
+        """Answer the profiles of all pairs as a table, with the radius in the
+        first column and one column per pair.
+        """
+        table = {"radius": np.arange(self.maxRadius + 1)}
+        for (nameA, nameB), profile in self.profiles.items():
+            table[nameA + "-" + nameB] = profile[1]
+        return table
+
+
+class LocalCorrelator:
+    """Calculate the local normalized cross-correlation (at zero shift) of two
+    images, either in windows on a regular grid or within each cell label.
+
+    The window sums are read from integral images (cumulative sums), so that
+    the cost does not depend on the size of the windows. The sums per label
+    are calculated with one bincount per moment.
+    """
+
+    def __init__(self, imageA, imageB, labels=None):
+        """Create a local correlator for the two images.
+
+        :param imageA: The first image
+        :type imageA: numpy.ndarray
+        :param imageB: The second image, with the same shape as the first
+        :type imageB: numpy.ndarray
+        :param labels: A label image with the same shape as the images, used
+                       in the labels mode
+        :type labels: numpy.ndarray
+        """
+        self.imageA = imageA
+        self.imageB = imageB
+        self.labels = labels
+        self.mode = "grid"
+        self.windowSize = 16
+        self.step = None
+        self.correlationMap = None
+        self.windowCounts = None
+        self.offset = None
+        self.table = {}
+
+    def run(self):
+        """Calculate the local correlations in the selected mode. In the grid
+        mode the result is a map with one value per window, in the labels mode
+        a table with one row per label and a map in which each label is
+        painted with its correlation.
+        """
+        if not self.imageA.shape == self.imageB.shape:
+            raise ValueError(
+                "The images must have the same shape, got "
+                + str(self.imageA.shape)
+                + " and "
+                + str(self.imageB.shape)
+            )
+        if self.mode == "labels":
+            self.correlateLabels()
+        else:
+            self.correlateGrid()
+
+    def getWindowSize(self):
+        windowSize = np.broadcast_to(
+            np.asarray(self.windowSize, dtype=int), (self.imageA.ndim,)
+        )
+        return np.minimum(windowSize, self.imageA.shape)
+
+    def getStep(self):
+        if self.step is None:
+            return self.getWindowSize()
+        return np.broadcast_to(
+            np.asarray(self.step, dtype=int), (self.imageA.ndim,)
+        )
+
+    def correlateGrid(self):
+        """Calculate the normalized cross-correlation in each window of the grid.
+
+        The images are centered on their global means first, so that the
+        variances are not lost by cancellation for images with a large offset.
+        Only one integral image exists at a time.
+        """
+        windowSize = self.getWindowSize()
+        step = self.getStep()
+        starts = [
+            np.arange(0, size - window + 1, delta)
+            for size, window, delta in zip(
+                self.imageA.shape, windowSize, step, strict=False
+            )
+        ]
+        a = self.getCentered(self.imageA)
+        b = self.getCentered(self.imageB)
+        sumA = self.getWindowSums(self.getIntegralImage(a), starts, windowSize)
+        sumB = self.getWindowSums(self.getIntegralImage(b), starts, windowSize)
+        sumAA = self.getWindowSums(
+            self.getIntegralImage(a * a), starts, windowSize
+        )
+        sumBB = self.getWindowSums(
+            self.getIntegralImage(b * b), starts, windowSize
+        )
+        sumAB = self.getWindowSums(
+            self.getIntegralImage(a * b), starts, windowSize
+        )
+        count = np.prod(windowSize)
+        self.correlationMap = self.getCorrelation(
+            sumA, sumB, sumAA, sumBB, sumAB, count
+        ).astype(np.float32)
+        self.windowCounts = self.correlationMap.shape
+        self.offset = (windowSize - 1) / 2
+
+    @staticmethod
+    def getCentered(image):
+        """Answer the image minus its mean as float32. The correlations do not
+        depend on the offset of the intensities.
+        """
+        data = np.asarray(image, dtype=np.float32)
+        return data - np.float32(data.mean(dtype=np.float64))
+
+    @staticmethod
+    def getIntegralImage(data):
+        """Answer the cumulative sums of data along all axes, with a leading
+        zero plane in each dimension.
+        """
+        integral = np.zeros(
+            [size + 1 for size in data.shape], dtype=np.float64
+        )
+        integral[tuple(slice(1, None) for _ in data.shape)] = data
+        for axis in range(data.ndim):
+            np.cumsum(integral, axis=axis, out=integral)
+        return integral
+
+    @staticmethod
+    def getWindowSums(integral, starts, windowSize):
+        """Answer the sums of the windows of size windowSize starting at all
+        combinations of the given start coordinates, by inclusion-exclusion of
+        the corners of the windows in the integral image.
+        """
+        ndim = len(starts)
+        sums = np.zeros([len(start) for start in starts], dtype=np.float64)
+        for corner in itertools.product((0, 1), repeat=ndim):
+            indices = np.ix_(
+                *[
+                    start + window * high
+                    for start, window, high in zip(
+                        starts, windowSize, corner, strict=False
+                    )
+                ]
+            )
+            sign = (-1) ** (ndim - sum(corner))
+            sums += sign * integral[indices]
+        return sums
+
+    @staticmethod
+    def getCorrelation(sumA, sumB, sumAA, sumBB, sumAB, count):
+        """Answer the normalized cross-correlation from the sums of the
+        intensities, their squares and their products over count voxels.
+        Regions in which one of the images is constant get the value 0.
+        """
+        covariance = sumAB - sumA * sumB / count
+        varianceA = sumAA - sumA * sumA / count
+        varianceB = sumBB - sumB * sumB / count
+        denominator = np.sqrt(
+            np.clip(varianceA, 0, None) * np.clip(varianceB, 0, None)
+        )
+        correlation = np.zeros_like(covariance)
+        np.divide(
+            covariance, denominator, out=correlation, where=denominator > 0
+        )
+        return correlation
+
+    def correlateLabels(self):
+        """Calculate the normalized cross-correlation within each label."""
+        labels = np.asarray(self.labels).ravel()
+        a = self.getCentered(self.imageA).ravel().astype(np.float64)
+        b = self.getCentered(self.imageB).ravel().astype(np.float64)
+        length = labels.max() + 1
+        count = np.bincount(labels, minlength=length)
+        sumA = np.bincount(labels, weights=a, minlength=length)
+        sumB = np.bincount(labels, weights=b, minlength=length)
+        sumAA = np.bincount(labels, weights=a * a, minlength=length)
+        sumBB = np.bincount(labels, weights=b * b, minlength=length)
+        sumAB = np.bincount(labels, weights=a * b, minlength=length)
+        correlation = self.getCorrelation(
+            sumA, sumB, sumAA, sumBB, sumAB, np.maximum(count, 1)
+        )
+        correlation[0] = 0
+        presentLabels = np.nonzero(count)[0]
+        presentLabels = presentLabels[presentLabels > 0]
+        self.table = {
+            "label": presentLabels,
+            "volume": count[presentLabels],
+            "ncc": correlation[presentLabels],
+        }
+        self.correlationMap = correlation.astype(np.float32)[self.labels]
+        self.offset = np.zeros(self.imageA.ndim)
@@ -0,0 +1,205 @@
+import numpy as np
+
+from napari_sphot.spots_util import SpotsUtil
+from napari_sphot.table_util import TableUtil
+
+
+class DirtyLabelsTracker:
+    """Collect the labels changed by edits of a labels layer.
+
+    The labels are read from the history items of the paint events of the
+    layer, the old and the new values of the edited voxels, together with the
+    bounding box of the edited voxels. If the data of the layer is replaced,
+    all labels are considered changed.
+    """
+
+    def __init__(self, layer):
+        """Start to track the edits of the given labels layer.
+
+        :param layer: The labels layer
+        :type layer: napari.layers.Labels
+        """
+        self.layer = layer
+        self.labels = set()
+        self.box = None
+        self.allChanged = False
+        self.callback = None
+        self.layer.events.paint.connect(self.onPaint)
+        self.layer.events.data.connect(self.onData)
+
+    def onPaint(self, event):
+        for atom in event.value:
+            if hasattr(atom, "old_values"):
+                oldValues, newValues = atom.old_values, atom.new_value
+                start = [region.start for region in atom.slice_key]
+                stop = [region.stop for region in atom.slice_key]
+            else:
+                indices, oldValues, newValues = atom
+                start = [int(np.min(index)) for index in indices]
+                stop = [int(np.max(index)) + 1 for index in indices]
+            self.labels.update(np.unique(oldValues).tolist())
+            self.labels.update(np.unique(newValues).tolist())
+            self.addToBox(start, stop)
+        self.labels.discard(0)
+        if self.callback:
+            self.callback()
+
+    def onData(self, event):
+        self.allChanged = True
+        if self.callback:
+            self.callback()
+
+    def addToBox(self, start, stop):
+        if self.box is None:
+            self.box = (list(start), list(stop))
+            return
+        self.box = (
+            [min(a, b) for a, b in zip(self.box[0], start, strict=False)],
+            [max(a, b) for a, b in zip(self.box[1], stop, strict=False)],
+        )
+
+    def hasChanges(self):
+        return self.allChanged or bool(self.labels)
+
+    def pop(self):
+        """Answer the changed labels, or None if all labels may have changed,
+        and the bounding box (start, stop) of the edited voxels and start to
+        collect the next changes.
+        """
+        labels = None if self.allChanged else sorted(self.labels)
+        box = self.box
+        self.labels = set()
+        self.box = None
+        self.allChanged = False
+        return labels, box
+
+    def disconnect(self):
+        self.layer.events.paint.disconnect(self.onPaint)
+        self.layer.events.data.disconnect(self.onData)
+
+
+class RemeasureTask:
+    """Recalculate the measurements of the changed labels only.
+
+    The task works on a copy of the part of the label image, that contains
+    the changed labels, made with getCrop when the task is created, so that
+    further edits do not change its input. The measurement tasks are created
+    by factories, that are called with the spots in the crop, in the
+    coordinates of the crop, and with the crop, in which all labels, that
+    have not been changed, are set to the background, so that each task only
+    measures these cells. The tables of the tasks are merged into one table
+    with one row per changed label.
+    """
+
+    margin = 8
+
+    def __init__(self, spots, labels, changedLabels, offset=None):
+        """Create a task for the changed labels of the label image.
+
+        :param spots: The coordinates of the spots in pixels
+        :type spots: numpy.ndarray
+        :param labels: The crop of the label image of the cells after the edits
+        :type labels: numpy.ndarray
+        :param changedLabels: The labels, that have been changed
+        :type changedLabels: [int]
+        :param offset: The start of the crop in the label image
+        """
+        self.spots = np.asarray(spots)
+        self.labels = labels
+        self.changedLabels = changedLabels
+        self.offset = (
+            np.zeros(np.ndim(labels), dtype=np.int64)
+            if offset is None
+            else np.asarray(offset)
+        )
+        self.taskFactories = []
+        self.spotIndices = None
+        self.spotLabels = None
+        self.removedLabels = []
+        self.table = {}
+
+    @classmethod
+    def getCrop(cls, labels, changedLabels, box=None):
+        """Answer a copy of the smallest part of the label image, grown from
+        the box of the edited voxels, on whose faces there are no voxels of
+        the changed labels, and the start of the part. Only the part is read.
+
+        :param labels: The label image
+        :param changedLabels: The labels, that have been changed
+        :param box: The start and the stop of the edited voxels or None for
+                    the whole image
+        :return: The copy of the part and its start
+        """
+        shape = np.array(labels.shape)
+        if box is None:
+            return np.array(labels), np.zeros(len(shape), dtype=np.int64)
+        start = np.maximum(np.asarray(box[0]) - cls.margin, 0)
+        stop = np.minimum(np.asarray(box[1]) + cls.margin, shape)
+        changed = np.asarray(changedLabels)
+        grown = True
+        while grown:
+            grown = False
+            crop = np.asarray(
+                labels[
+                    tuple(
+                        slice(a, b) for a, b in zip(start, stop, strict=False)
+                    )
+                ]
+            )
+            for axis in range(len(shape)):
+                size = max(stop[axis] - start[axis], cls.margin)
+                if (
+                    start[axis] > 0
+                    and np.isin(np.take(crop, 0, axis=axis), changed).any()
+                ):
+                    start[axis] = max(start[axis] - size, 0)
+                    grown = True
+                if (
+                    stop[axis] < shape[axis]
+                    and np.isin(np.take(crop, -1, axis=axis), changed).any()
+                ):
+                    stop[axis] = min(stop[axis] + size, shape[axis])
+                    grown = True
+        return np.array(crop), start
+
+    def getChangedLabelsImage(self):
+        """Answer a label image, in which all labels, that have not been
+        changed, are set to the background.
+        """
+        labels = np.asarray(self.labels)
+        lookup = np.zeros(int(labels.max()) + 1, dtype=labels.dtype)
+        changed = np.asarray(
+            [label for label in self.changedLabels if label < len(lookup)],
+            dtype=np.int64,
+        )
+        lookup[changed] = changed
+        return lookup[labels]
+
+    def run(self):
+        """Run the measurement tasks on the changed labels, yields once per task."""
+        changedLabelsImage = self.getChangedLabelsImage()
+        presentLabels = set(np.unique(changedLabelsImage).tolist()) - {0}
+        self.removedLabels = [
+            label for label in self.changedLabels if label not in presentLabels
+        ]
+        coordinates = self.spots.astype(np.int64) - self.offset
+        inCrop = np.all(
+            (coordinates >= 0)
+            & (coordinates < np.array(np.shape(self.labels))),
+            axis=1,
+        )
+        self.spotIndices = np.flatnonzero(inCrop)
+        spots = self.spots[inCrop] - self.offset
+        self.spotLabels = SpotsUtil.getLabelsOfSpots(spots, self.labels)
+        self.table = {}
+        if not presentLabels:
+            return
+        for factory in self.taskFactories:
+            task = factory(spots, changedLabelsImage)
+            result = task.run()
+            if result is not None:
+                for _ in result:
+                    pass
+            table = {key: list(value) for key, value in task.table.items()}
+            TableUtil.mergeRows(table, self.table, keys=("label",))
+            yield
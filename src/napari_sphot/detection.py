@@ -0,0 +1,317 @@
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import bigfish.detection
+import bigfish.stack
+import numpy as np
+from scipy import ndimage
+from skimage.measure import regionprops
+from sphot.image import SpotDetection
+
+from napari_sphot.progress import Total
+
+
+class RoiSpotDetectionTask:
+    """Detect spots only within the cells of a label image.
+
+    The detection runs on the bounding box of each cell, enlarged by a margin
+    of a few spot radii, in a small pool of spawned processes. Only the spots that lie in the
+    cell of the bounding box are kept, so that each spot is assigned to its
+    cell at detection time and spots in the overlap of the bounding boxes of
+    neighbouring cells are not counted twice.
+    """
+
+    def __init__(self, image, labels, scale):
+        """Create a detection task for the image restricted to the labels.
+
+        :param image: The image in which the spots are detected
+        :type image: numpy.ndarray
+        :param labels: The label image of the cells, with the shape of the image
+        :type labels: numpy.ndarray
+        :param scale: The voxel size
+        """
+        self.image = image
+        self.labels = labels
+        self.scale = tuple(scale)
+        self.threshold = None
+        self.spotRadius = (2.5, 2.5, 2.5)
+        self.shallRemoveDuplicates = True
+        self.marginFactor = 3
+        self.nrOfWorkers = 2
+        self.spots = None
+        self.spotLabels = None
+        self.table = {}
+
+    def getMargin(self):
+        """Answer the margin added to the bounding boxes in voxels."""
+        return np.ceil(
+            self.marginFactor
+            * np.asarray(self.spotRadius)
+            / np.asarray(self.scale)
+        ).astype(np.int64)
+
+    def getRegions(self):
+        """Answer the labels and the enlarged bounding boxes of the cells."""
+        labels = np.asarray(self.labels)
+        margin = self.getMargin()
+        regions = []
+        for index, box in enumerate(ndimage.find_objects(labels)):
+            if box is None:
+                continue
+            region = tuple(
+                slice(
+                    max(axisSlice.start - axisMargin, 0),
+                    min(axisSlice.stop + axisMargin, size),
+                )
+                for axisSlice, axisMargin, size in zip(
+                    box, margin, labels.shape, strict=False
+                )
+            )
+            regions.append((index + 1, region))
+        return regions
+
+    def getParameters(self):
+        return {
+            "scale": self.scale,
+            "threshold": self.threshold,
+            "spotRadius": self.spotRadius,
+            "shallRemoveDuplicates": self.shallRemoveDuplicates,
+        }
+
+    def run(self):
+        """Detect the spots in all cells, yields once per cell."""
+        labels = np.asarray(self.labels)
+        parameters = self.getParameters()
+        spots = []
+        spotLabels = []
+        maxPending = 2 * self.nrOfWorkers
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=self.nrOfWorkers, mp_context=context
+        ) as executor:
+            pending = collections.deque()
+            for label, region in self.getRegions():
+                mask = labels[region] == label
+                future = executor.submit(
+                    detectSpotsInRoi,
+                    np.asarray(self.image[region]),
+                    mask,
+                    parameters,
+                )
+                pending.append((label, region, future))
+                if len(pending) >= maxPending:
+                    self.addSpots(pending.popleft(), spots, spotLabels)
+                    yield
+            while pending:
+                self.addSpots(pending.popleft(), spots, spotLabels)
+                yield
+        if spots:
+            self.spots = np.concatenate(spots)
+            self.spotLabels = np.concatenate(spotLabels)
+        else:
+            self.spots = np.zeros((0, labels.ndim))
+            self.spotLabels = np.zeros(0, dtype=np.int64)
+        cellLabels, counts = np.unique(self.spotLabels, return_counts=True)
+        self.table = {"label": cellLabels, "nr_of_spots": counts}
+
+    @staticmethod
+    def addSpots(item, spots, spotLabels):
+        label, region, future = item
+        cellSpots = future.result()
+        offset = np.array([axisSlice.start for axisSlice in region])
+        spots.append(cellSpots + offset)
+        spotLabels.append(np.full(len(cellSpots), label, dtype=np.int64))
+
+
+def detectSpotsInRoi(image, mask, parameters):
+    """Answer the spots detected in the image, that lie within the mask, in
+    the coordinates of the image. The function is defined at module level, so
+    that it can be run in a process pool.
+    """
+    detection = SpotDetection(image)
+    for key, value in parameters.items():
+        setattr(detection, key, value)
+    result = detection.run()
+    if result is not None:
+        for _ in result:
+            pass
+    spots = np.asarray(detection.spots).reshape(-1, image.ndim)
+    if len(spots) == 0:
+        return spots
+    voxels = np.clip(spots.astype(np.int64), 0, np.array(image.shape) - 1)
+    return spots[mask[tuple(voxels.T)]]
+
+
+class ParallelDecomposeDenseRegions:
+    """Decompose the dense regions of the detected spots with the functions of
+    big-fish, fitting the regions in parallel.
+
+    As in bigfish.detection.decompose_dense, the background is removed, the
+    reference spot is built and modelled and the dense regions are found
+    once for the whole image. The gaussian mixture of each dense region is
+    then simulated in a small pool of spawned processes on the bounding box
+    of the region only, reusing the parameters of the reference spot and the
+    precomputed erf tables.
+    """
+
+    def __init__(self, image, spots):
+        """Create a decomposition of the dense regions of the spots.
+
+        :param image: The image in which the spots have been detected
+        :type image: numpy.ndarray
+        :param spots: The coordinates of the detected spots in pixels
+        :type spots: numpy.ndarray
+        """
+        self.image = image
+        self.spots = spots
+        self.voxelSize = (1, 1, 1)
+        self.spotRadius = (2.5, 2.5, 2.5)
+        self.alpha = 0.5
+        self.beta = 1
+        self.gamma = 5
+        self.nrOfWorkers = 2
+        self.decomposedSpots = None
+        self.referenceSpot = None
+        self.nrOfDenseRegions = 0
+        self.denseRegions = {}
+
+    def getDenoisedImage(self):
+        if self.gamma <= 0:
+            return self.image
+        spotRadiusInPixels = bigfish.detection.get_object_radius_pixel(
+            voxel_size_nm=self.voxelSize,
+            object_radius_nm=self.spotRadius,
+            ndim=self.image.ndim,
+        )
+        kernelSize = tuple(
+            radius * self.gamma for radius in spotRadiusInPixels
+        )
+        return bigfish.stack.remove_background_gaussian(
+            image=self.image, sigma=kernelSize
+        )
+
+    def run(self):
+        """Decompose the dense regions. Yields the number of dense regions as a
+        Total after the preparation and then once per dense region.
+        """
+        spots = np.asarray(self.spots)
+        voxelSize = tuple(float(size) for size in self.voxelSize)
+        spotRadius = tuple(float(radius) for radius in self.spotRadius)
+        self.decomposedSpots = spots
+        self.nrOfDenseRegions = 0
+        self.denseRegions = {
+            "region": [],
+            "nr_of_spots": [],
+            "area": [],
+            "mean_intensity": [],
+        }
+        if len(spots) == 0:
+            self.referenceSpot = np.zeros(
+                (5,) * self.image.ndim, dtype=self.image.dtype
+            )
+            return
+        image = self.getDenoisedImage()
+        self.referenceSpot = bigfish.detection.build_reference_spot(
+            image=image,
+            spots=spots,
+            voxel_size=voxelSize,
+            spot_radius=spotRadius,
+            alpha=self.alpha,
+        )
+        if self.referenceSpot.sum() == 0:
+            return
+        parameters = bigfish.detection.modelize_spot(
+            reference_spot=self.referenceSpot,
+            voxel_size=voxelSize,
+            spot_radius=spotRadius,
+        )
+        sigma = (parameters[0],) + (parameters[-3],) * (self.image.ndim - 1)
+        regions, spotsOutOfRegions, maxRegionSize = (
+            bigfish.detection.get_dense_region(
+                image=image,
+                spots=spots,
+                voxel_size=voxelSize,
+                spot_radius=spotRadius,
+                beta=self.beta,
+            )
+        )
+        self.nrOfDenseRegions = len(regions)
+        yield Total(self.nrOfDenseRegions)
+        if self.nrOfDenseRegions == 0:
+            return
+        model = {
+            "voxel_size": voxelSize,
+            "sigma": sigma,
+            "amplitude": float(parameters[-2]),
+            "background": float(parameters[-1]),
+            "precomputed_gaussian": bigfish.detection.precompute_erf(
+                ndim=self.image.ndim,
+                voxel_size=voxelSize,
+                sigma=sigma,
+                max_grid=maxRegionSize + 1,
+            ),
+        }
+        spotsInRegions = []
+        maxPending = 2 * self.nrOfWorkers
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=self.nrOfWorkers, mp_context=context
+        ) as executor:
+            pending = collections.deque()
+            for index, region in enumerate(regions):
+                box = tuple(
+                    slice(start, stop)
+                    for start, stop in zip(
+                        region.bbox[: image.ndim],
+                        region.bbox[image.ndim :],
+                        strict=False,
+                    )
+                )
+                future = executor.submit(
+                    decomposeRegion,
+                    np.asarray(image[box]),
+                    region.image,
+                    model,
+                )
+                pending.append((index, region, box, future))
+                if len(pending) >= maxPending:
+                    spotsInRegions.append(self.addRegion(pending.popleft()))
+                    yield
+            while pending:
+                spotsInRegions.append(self.addRegion(pending.popleft()))
+                yield
+        self.decomposedSpots = np.concatenate(
+            [spotsOutOfRegions] + spotsInRegions
+        ).astype(spots.dtype)
+
+    def addRegion(self, item):
+        index, region, box, future = item
+        regionSpots = future.result() + np.array(
+            [axisSlice.start for axisSlice in box]
+        )
+        self.denseRegions["region"].append(index)
+        self.denseRegions["nr_of_spots"].append(len(regionSpots))
+        self.denseRegions["area"].append(int(region.area))
+        self.denseRegions["mean_intensity"].append(
+            float(region.intensity_mean)
+        )
+        return regionSpots
+
+
+def decomposeRegion(image, mask, model):
+    """Answer the spots of the gaussian mixture simulated in one dense region,
+    in the coordinates of the bounding box of the region. The function is
+    defined at module level, so that it can be run in a process pool.
+
+    :param image: The image within the bounding box of the region
+    :param mask: The mask of the region within its bounding box
+    :param model: The parameters of the reference spot and the precomputed
+                  erf tables
+    """
+    regions = np.empty(1, dtype=object)
+    regions[0] = regionprops(mask.astype(np.uint8), intensity_image=image)[0]
+    spots, _ = bigfish.detection.simulate_gaussian_mixture(
+        image=image, candidate_regions=regions, **model
+    )
+    return spots[:, : image.ndim]
@@ -0,0 +1,240 @@
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from scipy.spatial import ConvexHull, Delaunay, QhullError, Voronoi
+
+from napari_sphot.progress import Total
+from napari_sphot.spots_util import SpotsUtil
+
+
+class TessellationUtil:
+    """Convert tessellations into the data of a single napari Vectors or
+    Surface layer.
+
+    All conversions use index arithmetic on whole arrays, so that their cost
+    grows only linearly with the number of simplices and the viewer has to
+    create one layer instead of one shape per simplex.
+    """
+
+    @staticmethod
+    def getUniqueEdges(simplices):
+        """Answer the edges of the simplices, each edge only once.
+
+        :param simplices: The indices of the vertices of the simplices, one
+                          simplex per row
+        :type simplices: numpy.ndarray
+        :return: The unique edges as pairs of vertex indices, the smaller
+                 index first
+        :rtype: numpy.ndarray
+        """
+        simplices = np.asarray(simplices, dtype=np.int64)
+        pairs = np.array(
+            list(itertools.combinations(range(simplices.shape[1]), 2))
+        )
+        edges = simplices[:, pairs].reshape(-1, 2)
+        edges.sort(axis=1)
+        nrOfVertices = edges.max() + 1 if len(edges) > 0 else 1
+        codes = np.unique(edges[:, 0] * nrOfVertices + edges[:, 1])
+        return np.column_stack((codes // nrOfVertices, codes % nrOfVertices))
+
+    @staticmethod
+    def getVectors(points, edges):
+        """Answer the data of a napari Vectors layer displaying the edges.
+
+        :param points: The coordinates of the vertices
+        :type points: numpy.ndarray
+        :param edges: The edges as pairs of vertex indices
+        :type edges: numpy.ndarray
+        :return: An array of shape (nrOfEdges, 2, ndim) with the start point and
+                 the projection of each edge
+        :rtype: numpy.ndarray
+        """
+        points = np.asarray(points)
+        start = points[edges[:, 0]]
+        return np.stack((start, points[edges[:, 1]] - start), axis=1)
+
+    @staticmethod
+    def getEdgeVectors(points, simplices):
+        """Answer the data of a napari Vectors layer displaying the unique edges
+        of the simplices of a tessellation, for example a Delaunay tessellation.
+        """
+        return TessellationUtil.getVectors(
+            points, TessellationUtil.getUniqueEdges(simplices)
+        )
+
+    @staticmethod
+    def polygonsToSurface(polygons):
+        """Answer the data of a napari Surface layer displaying the polygons.
+
+        Each polygon is triangulated as a fan around its first vertex, which is
+        correct for convex polygons, like the faces of Voronoi cells.
+
+        :param polygons: The polygons, each an array of the coordinates of its
+                         vertices in order
+        :type polygons: [numpy.ndarray]
+        :return: The vertices and the triangular faces of the surface
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+        polygons = [
+            np.asarray(polygon) for polygon in polygons if len(polygon) > 2
+        ]
+        if not polygons:
+            return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+        vertices = np.concatenate(polygons)
+        lengths = np.array([len(polygon) for polygon in polygons])
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        nrOfTriangles = lengths - 2
+        first = np.repeat(starts, nrOfTriangles)
+        triangleStarts = np.concatenate(([0], np.cumsum(nrOfTriangles)[:-1]))
+        index = (
+            np.arange(nrOfTriangles.sum())
+            - np.repeat(triangleStarts, nrOfTriangles)
+            + 1
+        )
+        faces = np.column_stack((first, first + index, first + index + 1))
+        return vertices, faces
+
+
+class GeometryMetricsTask:
+    """Calculate the convex hull, the Delaunay tessellation and the Voronoi
+    tessellation of the spots of every cell and measure them.
+
+    The cells are processed in parallel in a small pool of spawned processes. The result is a
+    table with one row per cell and, optionally, the convex hulls of all cells
+    merged into the data of one Surface layer.
+    """
+
+    minNrOfSpots = 5
+    metricKeys = [
+        "hull_volume",
+        "hull_area",
+        "mean_edge_length",
+        "voronoi_cells",
+        "voronoi_volume_mean",
+        "voronoi_volume_std",
+        "voronoi_volume_median",
+    ]
+
+    def __init__(self, spots, labels, scale, units):
+        """Create a task for the given spots and cell labels.
+
+        :param spots: The coordinates of the spots in pixels
+        :type spots: numpy.ndarray
+        :param labels: The label image of the cells
+        :type labels: numpy.ndarray
+        :param scale: The voxel size
+        :param units: The units of the voxel size
+        """
+        self.spots = np.asarray(spots)
+        self.labels = labels
+        self.scale = np.asarray(scale)
+        self.units = units
+        self.mergeHulls = False
+        self.nrOfWorkers = 2
+        self.table = {}
+        self.surface = None
+
+    def run(self):
+        """Calculate the metrics of all cells. Yields the number of cells with
+        enough spots as a Total and then once per measured cell.
+        """
+        spotLabels = SpotsUtil.getLabelsOfSpots(self.spots, self.labels)
+        cells = SpotsUtil.getSpotsPerLabel(self.spots, spotLabels)
+        measuredCells = {
+            label: points
+            for label, points in cells.items()
+            if len(points) >= self.minNrOfSpots
+        }
+        yield Total(len(measuredCells))
+        results = {}
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=self.nrOfWorkers, mp_context=context
+        ) as executor:
+            futures = {
+                executor.submit(getCellGeometry, points * self.scale): label
+                for label, points in measuredCells.items()
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                yield
+        labels = sorted(results.keys())
+        self.table = {
+            "label": labels,
+            "nr_of_spots": [len(cells[label]) for label in labels],
+        }
+        for key in self.metricKeys:
+            self.table[key] = [results[label][key] for label in labels]
+        if self.mergeHulls:
+            self.surface = self.getMergedHulls(cells, results, labels)
+
+    @staticmethod
+    def getMergedHulls(cells, results, labels):
+        """Answer the vertices, faces and values (the labels) of one surface
+        containing the convex hulls of all cells.
+        """
+        vertices = []
+        faces = []
+        values = []
+        offset = 0
+        for label in labels:
+            simplices = results[label]["simplices"]
+            if simplices is None:
+                continue
+            points = cells[label]
+            vertices.append(points)
+            faces.append(simplices + offset)
+            values.append(np.full(len(points), label, dtype=np.float32))
+            offset = offset + len(points)
+        if not vertices:
+            return None
+        return (
+            np.concatenate(vertices),
+            np.concatenate(faces),
+            np.concatenate(values),
+        )
+
+
+def getCellGeometry(points):
+    """Answer the convex hull volume and area, the mean edge length of the
+    Delaunay tessellation and the distribution of the volumes of the bounded
+    Voronoi cells inside the convex hull of the points.
+
+    The function is defined at module level, so that it can be run in a
+    process pool.
+    """
+    result = dict.fromkeys(GeometryMetricsTask.metricKeys, np.nan)
+    result["simplices"] = None
+    try:
+        hull = ConvexHull(points)
+        tess = Delaunay(points)
+        voronoi = Voronoi(points)
+    except QhullError:
+        return result
+    result["hull_volume"] = hull.volume
+    result["hull_area"] = hull.area
+    result["simplices"] = hull.simplices
+    edges = TessellationUtil.getUniqueEdges(tess.simplices)
+    result["mean_edge_length"] = np.linalg.norm(
+        points[edges[:, 0]] - points[edges[:, 1]], axis=1
+    ).mean()
+    volumes = []
+    for regionIndex in voronoi.point_region:
+        region = voronoi.regions[regionIndex]
+        if not region or -1 in region:
+            continue
+        vertices = voronoi.vertices[region]
+        if np.any(tess.find_simplex(vertices) < 0):
+            continue
+        try:
+            volumes.append(ConvexHull(vertices).volume)
+        except QhullError:
+            continue
+    result["voronoi_cells"] = len(volumes)
+    if volumes:
+        result["voronoi_volume_mean"] = np.mean(volumes)
+        result["voronoi_volume_std"] = np.std(volumes)
+        result["voronoi_volume_median"] = np.median(volumes)
+    return result
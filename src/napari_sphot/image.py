@@ -1,3 +1,6 @@
+import os
+import json
+import tifffile
 from tifffile import TiffFile
 from napari.qt.threading import create_worker
 
@@ -7,33 +10,57 @@ class TiffFileTags:
     """Get the pixel size and the unit from the metadata of a tiff-file."""
 
 
-    def __init__(self, path):
-        """Create an instance for the tiff-file under the given path."""
+    def __init__(self, path, index=None):
+        """Create an instance for the tiff-file under the given path.
+
+        :param path: The path of the tiff-file
+        :param index: The metadata index of the folder of the file. If given,
+                      the file is only opened when it is not in the index or
+                      has changed since it was indexed.
+        :type index: TiffMetadataIndex
+        """
 
         self.pixelSize = 1
         self.unit = "pixel"
         self.path = path
+        self.index = index
 
 
     def getPixelSizeAndUnit(self):
         """Get the ppixel size from the XResolution tag and the unit from the ImageDescription tag."""
 
+        if self.index is not None:
+            entry = self.index.get(self.path)
+            self.pixelSize = entry['pixelSize']
+            self.unit = entry['unit']
+            return
         with TiffFile(self.path) as tif:
             tags = tif.pages[0].tags
+            self.pixelSize, self.unit, _ = self.readPixelSizeAndUnit(tags, self.pixelSize, self.unit)
+
+
+    @staticmethod
+    def readPixelSizeAndUnit(tags, pixelSize=1, unit="pixel"):
+        """Answer the pixel size from the XResolution tag, the unit and the
+        spacing of the z-slices from the ImageDescription tag. The spacing is
+        None if the description does not contain it.
+        """
+        spacing = None
         if not 282 in tags.keys():
-            return
+            return pixelSize, unit, spacing
         else:
-            self.pixelSize = tags['XResolution'].value[1] / tags['XResolution'].value[0]
+            pixelSize = tags['XResolution'].value[1] / tags['XResolution'].value[0]
         if not 270 in tags.keys():
-            return
+            return pixelSize, unit, spacing
         else:
             tag = tags['ImageDescription'].value
-            parts = tag.split("\n")
-            if len(parts) <2 :
-                return
-            self.unit = parts[1].split("=")[1]
-            if self.unit=='mkm':
-                self.unit = "µm"
+            entries = dict(line.split("=", 1) for line in tag.split("\n") if "=" in line)
+            unit = entries.get('unit', unit)
+            if unit in ('mkm', 'micron'):
+                unit = "µm"
+            if 'spacing' in entries:
+                spacing = float(entries['spacing'])
+        return pixelSize, unit, spacing
 
 
     def getPixelSizeAndUnitWorker(self):
@@ -41,3 +68,128 @@ class TiffFileTags:
 
         worker = create_worker(self.getPixelSizeAndUnit)
         return worker
+
+
+
+class TiffMetadataIndex:
+    """A persistent index of the metadata of the tiff-files in a folder.
+
+    For each file the index keeps the pixel size, the unit, the spacing of the
+    z-slices, the shape, the axes, the data type and whether the image data can be
+    memory mapped, together with the modification time and the size of the
+    file. A file is only opened again when its modification time or its size
+    have changed. The index is saved as a json-file in the folder.
+    """
+
+    fileName = ".sphot_index.json"
+    extensions = ('.tif', '.tiff')
+
+
+    def __init__(self, folder):
+        """Create the index of the given folder and load it, if it has been
+        saved before.
+
+        :param folder: The folder containing the tiff-files
+        :type folder: str
+        """
+        self.folder = folder
+        self.path = os.path.join(folder, self.fileName)
+        self.entries = {}
+        self.changed = False
+        self.load()
+
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+
+    def save(self):
+        """Save the index if it has changed. A folder, that can not be written,
+        is not an error, the index is then only kept in memory.
+        """
+        if not self.changed:
+            return
+        try:
+            with open(self.path, 'w') as f:
+                json.dump(self.entries, f)
+            self.changed = False
+        except OSError:
+            pass
+
+
+    def get(self, path):
+        """Answer the metadata of the file under the path, from the index if
+        the file did not change since it was indexed.
+
+        :param path: The path of a tiff-file in the folder of the index
+        :return: A dictionary with the keys pixelSize, unit, spacing, shape,
+                 axes, dtype, memoryMappable, mtime and size
+        """
+        name = os.path.basename(path)
+        stat = os.stat(os.path.join(self.folder, name))
+        entry = self.entries.get(name)
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size and 'axes' in entry:
+            return entry
+        entry = self.readEntry(os.path.join(self.folder, name))
+        entry['mtime'] = stat.st_mtime
+        entry['size'] = stat.st_size
+        self.entries[name] = entry
+        self.changed = True
+        return entry
+
+
+    def update(self):
+        """Index the new and changed tiff-files of the folder, remove the
+        files that no longer exist from the index and save it.
+        """
+        names = sorted(name for name in os.listdir(self.folder) if name.lower().endswith(self.extensions))
+        for name in names:
+            self.get(name)
+        for name in set(self.entries) - set(names):
+            del self.entries[name]
+            self.changed = True
+        self.save()
+        return names
+
+
+    @staticmethod
+    def readEntry(path):
+        with TiffFile(path) as tif:
+            pixelSize, unit, spacing = TiffFileTags.readPixelSizeAndUnit(tif.pages[0].tags)
+            series = tif.series[0]
+            return {'pixelSize': pixelSize,
+                    'unit': unit,
+                    'spacing': spacing,
+                    'shape': list(series.shape),
+                    'axes': series.axes,
+                    'dtype': str(series.dtype),
+                    'memoryMappable': series.dataoffset is not None}
+
+
+
+def readTiff(path, index=None):
+    """Answer the image data of the tiff-file and its metadata. Uncompressed
+    images are opened as read-only memory maps, so that only the planes that
+    are accessed are read from the disk, other images are read into memory.
+
+    :param path: The path of the tiff-file
+    :param index: The metadata index of the folder of the file. If None, the
+                  index of the folder is loaded.
+    :type index: TiffMetadataIndex
+    :return: The data and the metadata entry of the file
+    """
+    if index is None:
+        index = TiffMetadataIndex(os.path.dirname(os.path.abspath(path)))
+    entry = index.get(path)
+    index.save()
+    if entry['memoryMappable']:
+        data = tifffile.memmap(path, mode='r')
+    else:
+        data = tifffile.imread(path)
+    return data, entry
@@ -0,0 +1,88 @@
+import re
+
+import numpy as np
+
+
+class LabelFilterTask:
+    """Keep or remove labels of a label image.
+
+    All criteria are combined into one lookup table, that maps each label
+    either to itself or to the background, so that the label image is read
+    only once, by one gather, whatever the number of selected labels. The
+    sizes of the labels come from one bincount.
+    """
+
+    def __init__(self, labels):
+        """Create a filter for the given label image.
+
+        :param labels: The label image
+        :type labels: numpy.ndarray
+        """
+        self.labels = labels
+        self.keep = None
+        self.remove = []
+        self.removeBorder = False
+        self.minSize = 0
+        self.result = None
+
+    @staticmethod
+    def parseLabels(text):
+        """Answer the labels in a text of comma separated labels and ranges of
+        labels, like "1, 5, 10-50".
+
+        :param text: The labels and ranges of labels
+        :type text: str
+        :rtype: numpy.ndarray
+        """
+        labels = []
+        for part in text.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            match = re.fullmatch(r"(\d+)\s*-\s*(\d+)", part)
+            if match:
+                start, end = int(match.group(1)), int(match.group(2))
+                labels.append(np.arange(min(start, end), max(start, end) + 1))
+            else:
+                labels.append(np.array([int(part)]))
+        if not labels:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(labels)
+
+    @staticmethod
+    def remapLabels(labels):
+        """Replace the labels, in place, by consecutive labels, keeping their
+        order, so that the background stays 0 if it is present.
+
+        :param labels: The label image
+        :type labels: numpy.ndarray
+        """
+        for index, value in enumerate(np.unique(labels)):
+            labels[labels == value] = index
+
+    def getLookupTable(self, labels):
+        """Answer the table that maps each label to itself, if it is kept,
+        or to 0, if it is removed.
+        """
+        length = int(labels.max()) + 1
+        keep = np.ones(length, dtype=bool)
+        if self.keep is not None:
+            keep[:] = False
+            selected = np.asarray(self.keep, dtype=np.int64)
+            keep[selected[selected < length]] = True
+        removed = np.asarray(self.remove, dtype=np.int64)
+        keep[removed[removed < length]] = False
+        if self.removeBorder:
+            for axis in range(labels.ndim):
+                for index in (0, labels.shape[axis] - 1):
+                    keep[np.unique(np.take(labels, index, axis=axis))] = False
+        if self.minSize:
+            keep[
+                np.bincount(labels.ravel(), minlength=length) < self.minSize
+            ] = False
+        keep[0] = False
+        return np.where(keep, np.arange(length), 0).astype(labels.dtype)
+
+    def run(self):
+        labels = np.asarray(self.labels)
+        self.result = self.getLookupTable(labels)[labels]
@@ -1,6 +1,8 @@
+import numpy as np
 from napari.layers.labels.labels import Labels
 from napari.layers.points.points import Points
 from napari.layers.image.image import Image
+from napari.utils.colormaps import DirectLabelColormap, ensure_colormap
 
 class NapariUtil:
     """ Utility methods for the napari image viewer.
@@ -91,3 +93,26 @@ class NapariUtil:
     def copyOriginalPath(srcLayer, destLayer):
         path = NapariUtil.getOriginalPath(srcLayer)
         destLayer.metadata['original_path'] = path
+
+
+    @staticmethod
+    def getValueColormap(labels, values, colormap='viridis'):
+        """Answer a colormap for a labels layer, that colors each label by its
+        value, so that values per label can be displayed on the label image
+        itself, without creating an image of the values.
+
+        :param labels: The labels
+        :param values: The value of each label
+        :param colormap: The name of the colormap used for the values
+        :rtype: DirectLabelColormap
+        """
+        colorDict = {None: np.zeros(4), 0: np.zeros(4)}
+        values = np.asarray(values, dtype=float)
+        if values.size == 0:
+            return DirectLabelColormap(color_dict=colorDict)
+        low, high = np.nanmin(values), np.nanmax(values)
+        normalized = (values - low) / (high - low) if high > low else np.zeros_like(values)
+        colors = ensure_colormap(colormap).map(np.nan_to_num(normalized))
+        for label, color in zip(labels, colors, strict=True):
+            colorDict[int(label)] = color
+        return DirectLabelColormap(color_dict=colorDict)
@@ -38,6 +38,9 @@ class Options:
             self.save()
         with open(self.optionsPath) as f:
             self.items = json.load(f)
+        if self.defaultItems:
+            for name, value in self.defaultItems.items():
+                self.items.setdefault(name, value)
 
 
     def get(self, name):
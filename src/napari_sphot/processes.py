@@ -0,0 +1,354 @@
+import contextlib
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from napari_sphot.telemetry import getIncrease, getPeakRSS, resetPeakRSS
+
+
+class SharedArray:
+    """The name, shape and data type of an array in shared memory, that can
+    be sent to another process instead of the data of the array.
+    """
+
+    minSize = 1024 * 1024
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype).str
+
+    @classmethod
+    def share(cls, array):
+        """Copy the array into a new block of shared memory.
+
+        :return: The description of the shared array and the block, which must
+                 be unlinked by the caller when it is no longer needed
+        """
+        array = np.asarray(array)
+        block = shared_memory.SharedMemory(
+            create=True, size=max(array.nbytes, 1)
+        )
+        sharedArray = SharedArray(block.name, array.shape, array.dtype)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = (
+            array
+        )
+        return sharedArray, block
+
+    def attach(self):
+        """Answer the shared array, without copying its data, and the block of
+        shared memory, which must stay open while the array is used.
+        """
+        block = shared_memory.SharedMemory(name=self.name)
+        return (
+            np.ndarray(
+                self.shape, dtype=np.dtype(self.dtype), buffer=block.buf
+            ),
+            block,
+        )
+
+    def copy(self):
+        """Answer a copy of the shared array and unlink its block of shared
+        memory.
+        """
+        array, block = self.attach()
+        result = np.array(array)
+        del array
+        block.close()
+        block.unlink()
+        return result
+
+    def unlink(self):
+        """Unlink the block of shared memory of the array without using it."""
+        block = shared_memory.SharedMemory(name=self.name)
+        block.close()
+        block.unlink()
+
+    @classmethod
+    def isLarge(cls, value):
+        return (
+            isinstance(value, np.ndarray)
+            and value.dtype != object
+            and value.nbytes >= cls.minSize
+        )
+
+
+class ProcessBackend:
+    """Run tasks in a pool of worker processes.
+
+    The state of a task is sent to the worker process with the large numpy
+    arrays, for example the image and label volumes, replaced by arrays in
+    shared memory, which the worker process uses without copying them. The
+    large arrays of the state after the run are returned in the same way, the
+    other attributes are pickled. The steps yielded by the task in the worker
+    process are reported through a queue, together with their values if they
+    are integers, for example the total number of steps. A run is cancelled
+    with a flag in shared memory, which the worker process checks at each step
+    of the task. Tasks, whose state can
+    not be pickled, are run in the calling thread.
+    """
+
+    instance = None
+    stepsQueue = None
+    cancelled = 1
+
+    @classmethod
+    def getInstance(cls):
+        if cls.instance is None:
+            cls.instance = ProcessBackend()
+        return cls.instance
+
+    def __init__(self, nrOfWorkers=None):
+        self.nrOfWorkers = nrOfWorkers or max(1, (os.cpu_count() or 2) // 2)
+        self.context = multiprocessing.get_context("spawn")
+        self.steps = self.context.Queue()
+        self.executor = None
+        self.ids = itertools.count(1)
+        self.stepsOfRun = {}
+        self.runs = {}
+        self.lock = threading.Lock()
+
+    def getExecutor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.nrOfWorkers,
+                mp_context=self.context,
+                initializer=initializeWorker,
+                initargs=(self.steps,),
+            )
+        return self.executor
+
+    def shutdown(self):
+        """Stop the worker processes. They are started again by the next run."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def newRunId(self):
+        """Answer the id of a new run, which can be passed to run, so that the
+        caller can cancel and release the run later.
+        """
+        return next(self.ids)
+
+    def run(self, task, methodName="run", usage=None, runId=None):
+        """Run the method of the task in a worker process and update the
+        state of the task with the state after the run. Yields once for each
+        step of the task. Closing the generator cancels the run.
+
+        :param task: The task, an object with a method without parameters, that
+                     returns a result or yields the steps of its progress
+        :param methodName: The name of the method run
+        :param usage: If given, the cpu time and the increase of the peak
+                      memory of the worker process are stored in the
+                      dictionary under the keys cpuTime and peakRSS
+        :param runId: The id of the run, used to cancel and to release it,
+                      by default a new id
+        :return: The result of the method
+        """
+        blocks = []
+        try:
+            state, blocks = self.shareState(task.__dict__)
+            pickle.dumps(state)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            self.unlink(blocks)
+            result = getattr(task, methodName)()
+            if result is not None and hasattr(result, "__next__"):
+                result = yield from result
+            return result
+        flag = shared_memory.SharedMemory(create=True, size=1)
+        flag.buf[0] = 0
+        if runId is None:
+            runId = self.newRunId()
+        run = {"flag": flag, "blocks": blocks, "future": None, "done": False}
+        with self.lock:
+            self.runs[runId] = run
+            self.stepsOfRun[runId] = []
+        try:
+            future = self.getExecutor().submit(
+                runTask, type(task), state, methodName, runId, flag.name
+            )
+            run["future"] = future
+            while not future.done():
+                self.receiveSteps(0.05)
+                yield from self.takeSteps(runId)
+            self.receiveSteps(0)
+            yield from self.takeSteps(runId)
+            newState, result, processUsage = future.result()
+            run["done"] = True
+        finally:
+            self.release(runId)
+        task.__dict__.update(self.restoreState(newState))
+        if usage is not None:
+            usage.update(processUsage)
+        return result
+
+    def cancel(self, runId):
+        """Ask the task of the run to stop at its next step. The worker process
+        checks the flag of the run, so that the run stops even if nobody
+        iterates over its generator anymore.
+        """
+        with self.lock:
+            run = self.runs.get(runId)
+            if run is not None:
+                run["flag"].buf[0] = self.cancelled
+
+    def release(self, runId):
+        """Cancel the run, unless it is done, and unlink its blocks of shared
+        memory. The blocks of the state returned by a cancelled run are
+        unlinked when the worker process has stopped. Releasing a run that is
+        unknown or already released does nothing.
+        """
+        with self.lock:
+            run = self.runs.pop(runId, None)
+            self.stepsOfRun.pop(runId, None)
+            if run is None:
+                return
+            if not run["done"]:
+                run["flag"].buf[0] = self.cancelled
+        future = run["future"]
+        if future is not None and not run["done"] and not future.cancel():
+            future.add_done_callback(self.discardResult)
+        self.unlink(run["blocks"] + [run["flag"]])
+
+    @staticmethod
+    def shareState(state):
+        sharedState = {}
+        blocks = []
+        for name, value in state.items():
+            if SharedArray.isLarge(value):
+                sharedState[name], block = SharedArray.share(value)
+                blocks.append(block)
+            else:
+                sharedState[name] = value
+        return sharedState, blocks
+
+    @staticmethod
+    def restoreState(state):
+        return {
+            name: value.copy() if isinstance(value, SharedArray) else value
+            for name, value in state.items()
+        }
+
+    @staticmethod
+    def unlink(blocks):
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    @staticmethod
+    def discardResult(future):
+        """Unlink the blocks of the state returned by the future of a cancelled
+        run.
+        """
+        if future.cancelled() or future.exception() is not None:
+            return
+        newState, _, _ = future.result()
+        for value in newState.values():
+            if isinstance(value, SharedArray):
+                value.unlink()
+
+    def receiveSteps(self, timeout):
+        """Move the steps reported by the worker processes to the steps of
+        their runs, waiting at most timeout seconds for the first step.
+        """
+        try:
+            runId, value = (
+                self.steps.get(timeout=timeout)
+                if timeout
+                else self.steps.get_nowait()
+            )
+            while True:
+                with self.lock:
+                    if runId in self.stepsOfRun:
+                        self.stepsOfRun[runId].append(value)
+                runId, value = self.steps.get_nowait()
+        except queue.Empty:
+            pass
+
+    def takeSteps(self, runId):
+        with self.lock:
+            steps = self.stepsOfRun.get(runId, [])
+            self.stepsOfRun[runId] = []
+        yield from steps
+
+
+def initializeWorker(steps):
+    ProcessBackend.stepsQueue = steps
+
+
+def runTask(taskClass, state, methodName, runId, flagName):
+    """Run the method of a task in a worker process. The function is defined
+    at module level, so that it can be run in a process pool.
+
+    :return: The state of the task after the run, with its large new arrays
+             in shared memory, the result of the method and the cpu time and
+             the increase of the peak memory of the worker process
+    """
+    flag = shared_memory.SharedMemory(name=flagName)
+    blocks = []
+    startCpuTime = time.process_time()
+    startPeakRSS = resetPeakRSS()
+    try:
+        newState, result = runTaskWithState(
+            taskClass, state, methodName, runId, flag, blocks
+        )
+        usage = {
+            "cpuTime": time.process_time() - startCpuTime,
+            "peakRSS": getIncrease(startPeakRSS, getPeakRSS()),
+        }
+        return newState, result, usage
+    finally:
+        for block in blocks:
+            closeBlock(block)
+        flag.close()
+
+
+def runTaskWithState(taskClass, state, methodName, runId, flag, blocks):
+    task = taskClass.__new__(taskClass)
+    inputs = {}
+    for name, value in state.items():
+        if isinstance(value, SharedArray):
+            value, block = value.attach()
+            blocks.append(block)
+            inputs[name] = value
+        task.__dict__[name] = value
+    result = getattr(task, methodName)()
+    if result is not None and hasattr(result, "__next__"):
+        steps = result
+        result = None
+        try:
+            while True:
+                value = next(steps)
+                ProcessBackend.stepsQueue.put(
+                    (runId, value if isinstance(value, int) else None)
+                )
+                if flag.buf[0] == ProcessBackend.cancelled:
+                    steps.close()
+                    break
+        except StopIteration as stop:
+            result = stop.value
+    newState = {
+        name: value
+        for name, value in task.__dict__.items()
+        if not (name in inputs and value is inputs[name])
+    }
+    newState, newBlocks = ProcessBackend.shareState(newState)
+    for block in newBlocks:
+        block.close()
+    return newState, result
+
+
+def closeBlock(block):
+    """Close the block of shared memory, unless arrays of the state of the
+    task still use it, in which case it is closed when they are freed.
+    """
+    with contextlib.suppress(BufferError):
+        block.close()
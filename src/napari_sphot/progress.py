@@ -0,0 +1,7 @@
+class Total(int):
+    """The number of steps of a task, that is only known once the task runs.
+
+    A task yields a Total before its first step. The task scheduler sets the
+    total of the job and of its progress bar from it, instead of counting it
+    as a step.
+    """
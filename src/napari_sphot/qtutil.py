@@ -1,10 +1,12 @@
 from typing import TYPE_CHECKING
 import pyperclip
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
 from qtpy.QtCore import Qt
 from qtpy.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout
 from qtpy.QtWidgets import QLabel, QLineEdit, QComboBox, QTableWidget, QTableWidgetItem, QAction
+from qtpy.QtWidgets import QPushButton, QAbstractItemView, QCheckBox
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from napari.utils import notifications
 from napari_sphot.array_util import ArrayUtil
@@ -174,11 +176,19 @@ class TableView(QTableWidget):
 
 
 class PlotWidget(QWidget):
+    """A matplotlib plot in a dock widget of the viewer.
+
+    The figure is not registered with pyplot, so that it is released together
+    with the widget. When the plot is displayed again, the existing lines are
+    updated in place and the widget stays in its dock. The dock widget is
+    tracked explicitly, when it is destroyed, for example by its close button,
+    the dockRemovedCallback is called with the plot.
+    """
 
 
     def __init__(self, viewer: "napari.viewer.Viewer"):
         super().__init__()
-        self.figure = plt.figure()
+        self.figure = Figure()
         self.ax = self.figure.add_subplot(111)
         self.canvas = FigureCanvas(self.figure)
         self.viewer = viewer
@@ -187,6 +197,11 @@ class PlotWidget(QWidget):
         self.title = "Plot"
         self.X = []
         self.Y = []
+        self.curves = []
+        self.lines = []
+        self.collection = None
+        self.dockWidget = None
+        self.dockRemovedCallback = None
         self.area = 'left'
         self.tabify = True
         self.xLabel = "x"
@@ -204,23 +219,301 @@ class PlotWidget(QWidget):
     def addData(self, X, Y, formatString=None):
         self.X.append(X)
         self.Y.append(Y)
-        if formatString:
-            self.formatStrings.append(formatString)
+        self.formatStrings.append(formatString)
+
+
+    def addCurves(self, X, Ys):
+        """Add many curves, for example one per label, that are drawn as one
+        LineCollection instead of one line per curve.
+
+        :param X: The x-values shared by all curves
+        :param Ys: The y-values of the curves, one curve per row
+        """
+        X = np.asarray(X)
+        for Y in Ys:
+            self.curves.append(np.column_stack((X, np.asarray(Y))))
+
+
+    def clearData(self):
+        """Remove the data, but keep the lines, so that the next call of
+        display can update them in place.
+        """
+        self.X = []
+        self.Y = []
+        self.formatStrings = []
+        self.curves = []
 
 
     def clear(self):
         self.figure.clear()
+        self.ax = self.figure.add_subplot(111)
+        self.lines = []
+        self.collection = None
+
+
+    def isDocked(self):
+        """Answer whether the plot is displayed in a dock widget, that has not
+        been closed.
+        """
+        return self.dockWidget is not None
 
 
     def display(self):
         self.ax.set_xlabel(self.xLabel)
         self.ax.set_ylabel(self.yLabel)
-        if self.formatStrings:
-            for x, y, plotFormat in zip(self.X, self.Y, self.formatStrings):
-                self.ax.plot(x, y, plotFormat)
+        self.ax.set_title(self.title)
+        self.updateLines()
+        self.updateCollection()
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.canvas.draw_idle()
+        if not self.isDocked():
+            self.dockWidget = self.viewer.window.add_dock_widget(self, area=self.area, name=self.title, tabify=self.tabify)
+            self.dockWidget.destroyed.connect(lambda: self.onDockWidgetDestroyed())
+
+
+    def onDockWidgetDestroyed(self):
+        self.dockWidget = None
+        if self.dockRemovedCallback:
+            self.dockRemovedCallback(self)
+
+
+    def updateLines(self):
+        """Set the data of the existing lines and create or remove lines, so
+        that there is one line per data set.
+        """
+        for index, (x, y, plotFormat) in enumerate(zip(self.X, self.Y, self.formatStrings, strict=True)):
+            if index < len(self.lines) and self.lines[index][1] == plotFormat:
+                self.lines[index][0].set_data(x, y)
+                continue
+            if index < len(self.lines):
+                self.lines[index][0].remove()
+            line, = self.ax.plot(x, y, plotFormat) if plotFormat else self.ax.plot(x, y)
+            if index < len(self.lines):
+                self.lines[index] = (line, plotFormat)
+            else:
+                self.lines.append((line, plotFormat))
+        for line, _ in self.lines[len(self.X):]:
+            line.remove()
+        self.lines = self.lines[:len(self.X)]
+
+
+    def updateCollection(self):
+        if not self.curves:
+            if self.collection is not None:
+                self.collection.remove()
+                self.collection = None
+            return
+        if self.collection is None:
+            self.collection = LineCollection(self.curves, linewidths=0.5, alpha=0.5)
+            self.ax.add_collection(self.collection)
         else:
-            for x, y in zip(self.X, self.Y):
-                self.ax.plot(x, y)
-        self.canvas.draw()
-        self.viewer.window.add_dock_widget(self, area=self.area, name=self.title, tabify=self.tabify)
+            self.collection.set_segments(self.curves)
+
+
+    def close(self):
+        """Close the dock widget and release the figure."""
+        dockWidget = self.dockWidget
+        self.dockWidget = None
+        if dockWidget is not None:
+            self.viewer.window.remove_dock_widget(dockWidget)
+        self.release()
+        return super().close()
+
+
+    def release(self):
+        """Release the figure without touching the widget, for example when
+        its dock widget has already been destroyed.
+        """
+        self.figure.clear()
+        self.lines = []
+        self.collection = None
+
+
+
+class PlotManager:
+    """Keep one plot per kind of statistic and reuse it for each new result,
+    instead of creating a new figure and a new dock widget for every run.
+
+    A plot, whose dock widget is removed, is forgotten and its figure is
+    released. The owner of the manager closes all plots when it is torn down.
+    """
+
+
+    def __init__(self, viewer: "napari.viewer.Viewer"):
+        self.viewer = viewer
+        self.plots = {}
+
+
+    def getPlot(self, key):
+        """Answer the plot for the given kind of statistic, with its data
+        removed. A new plot is created if there is none or if its dock widget
+        has been closed.
+
+        :param key: The kind of statistic, for example "G-Function"
+        :type key: str
+        :rtype: PlotWidget
+        """
+        plot = self.plots.get(key, None)
+        if plot is not None and plot.isDocked():
+            plot.clearData()
+            return plot
+        if plot is not None:
+            plot.close()
+        plot = PlotWidget(self.viewer)
+        plot.dockRemovedCallback = lambda removedPlot, key=key: self.onDockRemoved(key, removedPlot)
+        self.plots[key] = plot
+        return plot
+
+
+    def onDockRemoved(self, key, plot):
+        if self.plots.get(key) is plot:
+            del self.plots[key]
+            plot.release()
+
 
+    def closePlot(self, key):
+        plot = self.plots.pop(key, None)
+        if plot is not None:
+            plot.close()
+
+
+    def closeAll(self, removeDocks=True):
+        """Close all plots.
+
+        :param removeDocks: If False, only the figures are released, for
+                            example when the dock widgets are destroyed
+                            together with the viewer
+        """
+        for key in list(self.plots.keys()):
+            if removeDocks:
+                self.closePlot(key)
+            else:
+                self.plots.pop(key).release()
+
+
+
+class JobQueueWidget(QWidget):
+    """Display the jobs of a task scheduler with their state and progress and
+    allow to cancel them and to switch the telemetry of the scheduler on and
+    off.
+    """
+
+    columns = ['job', 'kind', 'priority', 'state', 'progress']
+
+
+    def __init__(self, scheduler, *args):
+        """Create a view of the jobs of the scheduler.
+
+        :param scheduler: The scheduler whose jobs are displayed
+        :type scheduler: napari_sphot.scheduler.TaskScheduler
+        """
+        super().__init__(*args)
+        self.scheduler = scheduler
+        self.jobs = []
+        self.table = QTableWidget(0, len(self.columns), self)
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        cancelButton = QPushButton("Cancel")
+        cancelButton.clicked.connect(self._onCancelButtonClicked)
+        cancelAllButton = QPushButton("Cancel All")
+        cancelAllButton.clicked.connect(self.scheduler.cancelAll)
+        clearButton = QPushButton("Clear Finished")
+        clearButton.clicked.connect(self.scheduler.clearDoneJobs)
+        buttonsLayout = QHBoxLayout()
+        buttonsLayout.addWidget(cancelButton)
+        buttonsLayout.addWidget(cancelAllButton)
+        buttonsLayout.addWidget(clearButton)
+        self.telemetryCheckBox = QCheckBox("Record performance", self)
+        self.telemetryCheckBox.setChecked(self.scheduler.telemetry.enabled)
+        self.telemetryCheckBox.setToolTip("Write the measurements of the jobs to the performance log. "
+                                          "The Performance dock is shown when napari-sphot is opened "
+                                          "with the recording switched on.")
+        self.telemetryCheckBox.toggled.connect(self.scheduler.telemetry.setEnabled)
+        mainLayout = QVBoxLayout()
+        mainLayout.addWidget(self.table)
+        mainLayout.addLayout(buttonsLayout)
+        mainLayout.addWidget(self.telemetryCheckBox)
+        self.setLayout(mainLayout)
+        self.scheduler.listeners.append(self.refresh)
+        self.destroyed.connect(lambda: self.scheduler.listeners.remove(self.refresh))
+        self.refresh()
+
+
+    def refresh(self):
+        """Display the current jobs, the running and queued jobs first."""
+        self.jobs = [job for job in self.scheduler.jobs if job.state == job.RUNNING] + \
+                    self.scheduler.getQueuedJobs() + \
+                    [job for job in reversed(self.scheduler.jobs) if job.isDone()]
+        self.table.setRowCount(len(self.jobs))
+        for row, job in enumerate(self.jobs):
+            state = job.state
+            if job.cancelRequested and state == job.RUNNING:
+                state = 'cancelling'
+            progress = str(job.progress)
+            if job.total:
+                progress = progress + " / " + str(job.total)
+            values = [job.description, job.kind, str(job.priority), state, progress]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if job.error is not None:
+                    item.setToolTip(str(job.error))
+                self.table.setItem(row, column, item)
+
+
+    def getSelectedJobs(self):
+        rows = sorted({index.row() for index in self.table.selectedIndexes()})
+        return [self.jobs[row] for row in rows if row < len(self.jobs)]
+
+
+    def _onCancelButtonClicked(self):
+        for job in self.getSelectedJobs():
+            self.scheduler.cancel(job)
+
+
+
+class PerformanceWidget(QWidget):
+    """Display the measurements of the jobs collected by the telemetry, the
+    most recent job first.
+    """
+
+    columns = ['job', 'task', 'state', 'wall_time_s', 'cpu_time_s', 'peak_rss_increase_mb', 'voxels', 'spots', 'labels']
+
+
+    def __init__(self, telemetry, *args):
+        """Create a view of the records of the telemetry.
+
+        :param telemetry: The telemetry whose records are displayed
+        :type telemetry: napari_sphot.telemetry.Telemetry
+        """
+        super().__init__(*args)
+        self.telemetry = telemetry
+        self.table = QTableWidget(0, len(self.columns), self)
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setToolTip("The log is written to " + str(self.telemetry.path))
+        clearButton = QPushButton("Clear")
+        clearButton.clicked.connect(self.telemetry.clear)
+        buttonsLayout = QHBoxLayout()
+        buttonsLayout.addWidget(clearButton)
+        mainLayout = QVBoxLayout()
+        mainLayout.addWidget(self.table)
+        mainLayout.addLayout(buttonsLayout)
+        self.setLayout(mainLayout)
+        self.telemetry.listeners.append(self.refresh)
+        self.destroyed.connect(lambda: self.telemetry.listeners.remove(self.refresh))
+        self.refresh()
+
+
+    def refresh(self, record=None):
+        """Display the records of the telemetry."""
+        records = list(reversed(self.telemetry.records))
+        self.table.setRowCount(len(records))
+        for row, aRecord in enumerate(records):
+            for column, key in enumerate(self.columns):
+                value = aRecord.get(key)
+                item = QTableWidgetItem("" if value is None else str(value))
+                if column > 2:
+                    item.setTextAlignment(Qt.AlignRight)
+                self.table.setItem(row, column, item)
@@ -0,0 +1,155 @@
+import os
+import queue
+import re
+import threading
+
+import numpy as np
+
+
+class ResultsWriter:
+    """Write result tables to disk in a background thread.
+
+    Tables are collected with add and handed to the writer thread as one
+    batch with flush, so that the caller, usually the GUI thread, never waits
+    for the file system. The writer must be closed, so that the remaining
+    batches are written before the thread stops. In the csv format each table is written to its own
+    file, in the npz format all tables of a batch are written as columns into
+    one binary archive.
+    """
+
+    formats = ["csv", "npz"]
+
+    def __init__(self, fileFormat="csv"):
+        """Create a writer, that writes tables in the given format.
+
+        :param fileFormat: The format of the written files, csv or npz
+        :type fileFormat: str
+        """
+        if fileFormat not in self.formats:
+            raise ValueError(
+                "Unknown format "
+                + str(fileFormat)
+                + ", use one of "
+                + str(self.formats)
+            )
+        self.format = fileFormat
+        self.tables = {}
+        self.errorCallback = None
+        self.writtenPaths = []
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.writeBatches, daemon=True)
+        self.thread.start()
+
+    def add(self, name, table):
+        """Add a table to the current batch.
+
+        :param name: The name of the table, used as the name of the file in the
+                     csv format and as the prefix of the columns in the npz
+                     format
+        :type name: str
+        :param table: A dictionary with the column names as keys and the data
+                      of the columns as values
+        :type table: dict
+        """
+        self.tables[name] = {
+            key: np.asarray(value) for key, value in table.items()
+        }
+
+    def flush(self, folder, batchName):
+        """Hand the current batch to the writer thread and start a new batch.
+
+        :param folder: The folder into which the files are written. It is
+                       created if it does not exist.
+        :type folder: str
+        :param batchName: The name of the archive in the npz format
+        :type batchName: str
+        """
+        if not self.tables:
+            return
+        self.queue.put((folder, batchName, self.tables))
+        self.tables = {}
+
+    def join(self):
+        """Wait until all batches handed to the writer thread are written."""
+        self.queue.join()
+
+    def close(self):
+        """Write the remaining batches and stop the writer thread. Tables
+        added after the last flush are discarded.
+        """
+        if not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join()
+
+    def writeBatches(self):
+        """Write the batches of the queue until the end-marker None is read.
+        An error while writing a batch is passed to the error callback, which
+        is called in the writer thread, and the writer goes on with the next
+        batch.
+        """
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                self.queue.task_done()
+                return
+            folder, batchName, tables = batch
+            try:
+                os.makedirs(folder, exist_ok=True)
+                if self.format == "npz":
+                    self.writeNPZ(folder, batchName, tables)
+                else:
+                    self.writeCSV(folder, tables)
+            except Exception as error:  # noqa: BLE001
+                if self.errorCallback:
+                    self.errorCallback(error)
+            finally:
+                self.queue.task_done()
+
+    def writeCSV(self, folder, tables):
+        for name, table in tables.items():
+            path = os.path.join(folder, self.getFilename(name) + ".csv")
+            data = np.column_stack(list(table.values()))
+            np.savetxt(
+                path,
+                data,
+                delimiter=",",
+                header=",".join(table.keys()),
+                comments="",
+            )
+            self.writtenPaths.append(path)
+
+    def writeNPZ(self, folder, batchName, tables):
+        path = os.path.join(folder, self.getFilename(batchName) + ".npz")
+        columns = {}
+        for name, table in tables.items():
+            for key, value in table.items():
+                columns[name + "/" + key] = value
+        np.savez(path, **columns)
+        self.writtenPaths.append(path)
+
+    @staticmethod
+    def getFilename(name):
+        """Answer the name with all characters, that are not allowed in
+        filenames on all platforms, replaced by underscores.
+        """
+        return re.sub(r'[<>:"/\\|?*\s]+', "_", name).strip("_")
+
+    @staticmethod
+    def getOutputFolder(originalPath, outputFolder=None, fallbackFolder=None):
+        """Answer the folder into which the results for the image under
+        originalPath are written.
+
+        :param originalPath: The path of the source image or None
+        :param outputFolder: A configured output folder, used if not empty
+        :param fallbackFolder: The folder used if there is neither an output
+                               folder nor an original path
+        :return: The configured output folder or the folder "<name>_results"
+                 next to the source image
+        """
+        if outputFolder:
+            return outputFolder
+        if not originalPath:
+            return fallbackFolder
+        name = os.path.splitext(os.path.basename(originalPath))[0]
+        return os.path.join(os.path.dirname(originalPath), name + "_results")
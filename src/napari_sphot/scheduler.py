@@ -0,0 +1,361 @@
+import functools
+import heapq
+import itertools
+import os
+
+from napari.qt.threading import create_worker
+
+from napari_sphot.processes import ProcessBackend
+from napari_sphot.progress import Total
+from napari_sphot.telemetry import Measurement, Telemetry
+
+
+class Job:
+    """A function submitted to the task scheduler, together with its state,
+    its progress and its result.
+
+    The context of a job holds the values of the attributes of the owner, for
+    example the input layers and the task of a widget, at the time the job is
+    submitted. They are restored on the owner before the finished-callback is
+    called, so that the callback sees the objects of its own job, even if
+    another job has been submitted in the meantime.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+    ids = itertools.count(1)
+
+    def __init__(
+        self,
+        function,
+        description,
+        kind="cpu",
+        priority=0,
+        group=None,
+        total=None,
+    ):
+        """Create a job running the given function.
+
+        :param function: The function or generator function run by the job
+        :param description: The description displayed in the queue and in the
+                            progress bar
+        :param kind: The pool of the scheduler in which the job runs
+        :param priority: Jobs with a higher priority are started first
+        :param group: At most one job of a group runs at the same time
+        :param total: The number of steps yielded by the function, if known
+        """
+        self.id = next(self.ids)
+        self.function = function
+        self.description = description
+        self.kind = kind
+        self.priority = priority
+        self.group = group
+        self.total = total
+        self.progress = 0
+        self.state = self.QUEUED
+        self.cancelRequested = False
+        self.task = getattr(function, "__self__", None)
+        self.result = None
+        self.error = None
+        self.worker = None
+        self.runId = None
+        self.measurement = None
+        self.owner = None
+        self.context = {}
+        self.onFinished = None
+        self.onDone = None
+
+    def isDone(self):
+        return self.state in (self.FINISHED, self.CANCELLED, self.FAILED)
+
+    def restoreContext(self):
+        for name, value in self.context.items():
+            setattr(self.owner, name, value)
+
+
+class TaskScheduler:
+    """Run the jobs of the plugin in napari workers, with a bounded number of
+    jobs running at the same time.
+
+    Each job runs in one of the pools cpu, process and io, which limit the
+    number of running jobs independently, so that exports are not held back
+    by long computations and computations do not compete for the cores. The
+    jobs of the process pool are methods of tasks, that are run by the process
+    backend in worker processes, so that tasks holding the GIL do not slow
+    down the viewer. Queued jobs are started by priority and in the order of
+    submission. A job, whose number of steps is not known when it is
+    submitted, yields a Total before its first step. The listeners are called without arguments whenever a job is
+    queued, started, makes progress or ends. The wall time, the cpu time, the
+    peak memory and the input sizes of each job, that has been started, are
+    added to the telemetry when the job ends.
+    """
+
+    CPU = "cpu"
+    PROCESS = "process"
+    IO = "io"
+
+    instance = None
+
+    @classmethod
+    def getInstance(cls):
+        """Answer the scheduler shared by all widgets of the plugin."""
+        if cls.instance is None:
+            cls.instance = TaskScheduler()
+        return cls.instance
+
+    def __init__(self, maxCpuJobs=None, maxIoJobs=4, telemetry=None):
+        """Create a scheduler with the given limits of running jobs.
+
+        :param maxCpuJobs: The maximum number of running cpu jobs and of
+                           running process jobs, by default half the number
+                           of cores
+        :param maxIoJobs: The maximum number of running io jobs
+        :param telemetry: The telemetry receiving the measurements of the
+                          jobs, by default the telemetry of the plugin
+        :type telemetry: napari_sphot.telemetry.Telemetry
+        """
+        maxCpuJobs = maxCpuJobs or max(1, (os.cpu_count() or 2) // 2)
+        self.limits = {
+            self.CPU: maxCpuJobs,
+            self.PROCESS: maxCpuJobs,
+            self.IO: maxIoJobs,
+        }
+        self.queue = []
+        self.running = []
+        self.jobs = []
+        self.maxDoneJobs = 50
+        self.listeners = []
+        self.telemetry = telemetry or Telemetry.getInstance()
+
+    def submit(
+        self,
+        function,
+        description,
+        onFinished=None,
+        total=None,
+        kind=CPU,
+        priority=0,
+        group=None,
+        owner=None,
+        context=None,
+        onDone=None,
+    ):
+        """Queue a job running the function and start it as soon as its pool
+        and its group allow it.
+
+        :param function: The function or generator function to run
+        :param description: The description of the job
+        :param onFinished: Called without arguments when the job finished
+                           successfully, after the context has been restored
+        :param total: The number of steps yielded by the function, if known
+        :param kind: The pool in which the job runs, cpu, process or io. The
+                     function of a process job must be a method of a task
+        :param priority: Jobs with a higher priority are started first
+        :param group: At most one job of a group runs at the same time
+        :param owner: The object on which the context is restored
+        :param context: The attribute values restored on the owner
+        :param onDone: Called without arguments when the job has ended,
+                       whether it finished, failed or has been cancelled,
+                       before onFinished
+        :return: The job
+        :rtype: Job
+        """
+        if kind not in self.limits:
+            raise ValueError(
+                "Unknown kind of job "
+                + str(kind)
+                + ", use one of "
+                + str(list(self.limits))
+            )
+        job = Job(
+            function,
+            description,
+            kind=kind,
+            priority=priority,
+            group=group,
+            total=total,
+        )
+        job.onFinished = onFinished
+        job.onDone = onDone
+        job.owner = owner
+        job.context = context or {}
+        heapq.heappush(self.queue, (-priority, job.id, job))
+        self.jobs.append(job)
+        self.removeDoneJobs()
+        self.startJobs()
+        self.notify()
+        return job
+
+    @staticmethod
+    def getContext(owner, function, names):
+        """Answer the values of the attributes with the given names of the
+        owner and the attributes of the owner that hold the object of the
+        function, if it is a method of another object than the owner.
+        """
+        context = {name: getattr(owner, name, None) for name in names}
+        task = getattr(function, "__self__", None)
+        if task is not None and task is not owner:
+            context.update(
+                {
+                    name: value
+                    for name, value in vars(owner).items()
+                    if value is task
+                }
+            )
+        return context
+
+    def getWorkersPerProcessJob(self):
+        """Answer the number of cores left to each of the process jobs running
+        at the same time, for tasks that use a pool of their own.
+        """
+        return max(1, (os.cpu_count() or 2) // self.limits[self.PROCESS])
+
+    def cancel(self, job):
+        """Cancel a queued job or ask a running job to stop. A generator
+        function stops at its next yield, the task of a process job at its
+        next step in the worker process. The result of a cancelled job is
+        discarded.
+        """
+        if job.state == Job.QUEUED:
+            job.state = Job.CANCELLED
+            self.notify()
+            if job.onDone:
+                job.onDone()
+        elif job.state == Job.RUNNING and not job.cancelRequested:
+            job.cancelRequested = True
+            if job.runId is not None:
+                ProcessBackend.getInstance().cancel(job.runId)
+            job.worker.quit()
+            self.notify()
+
+    def cancelAll(self):
+        for job in list(self.jobs):
+            self.cancel(job)
+
+    def clearDoneJobs(self):
+        self.jobs = [job for job in self.jobs if not job.isDone()]
+        self.notify()
+
+    def removeDoneJobs(self):
+        done = [job for job in self.jobs if job.isDone()]
+        for job in done[: max(len(done) - self.maxDoneJobs, 0)]:
+            self.jobs.remove(job)
+
+    def getQueuedJobs(self):
+        return [
+            job for _, _, job in sorted(self.queue) if job.state == Job.QUEUED
+        ]
+
+    def canStart(self, job):
+        runningOfKind = sum(
+            1 for running in self.running if running.kind == job.kind
+        )
+        if runningOfKind >= self.limits[job.kind]:
+            return False
+        return job.group is None or all(
+            running.group != job.group for running in self.running
+        )
+
+    def startJobs(self):
+        waiting = []
+        while self.queue:
+            entry = heapq.heappop(self.queue)
+            job = entry[-1]
+            if job.state != Job.QUEUED:
+                continue
+            if self.canStart(job):
+                self.start(job)
+            else:
+                waiting.append(entry)
+        for entry in waiting:
+            heapq.heappush(self.queue, entry)
+
+    def start(self, job):
+        progress = {"desc": job.description}
+        if job.total:
+            progress["total"] = job.total
+        job.state = Job.RUNNING
+        job.measurement = Measurement(job.task)
+        function = job.function
+        if job.kind == self.PROCESS and job.task is not None:
+            backend = ProcessBackend.getInstance()
+            backend.nrOfWorkers = self.limits[self.PROCESS]
+            job.runId = backend.newRunId()
+            function = functools.partial(
+                backend.run,
+                job.task,
+                job.function.__name__,
+                job.measurement.processUsage,
+                job.runId,
+            )
+        function = job.measurement.wrap(function)
+        job.worker = create_worker(function, _progress=progress)
+        if hasattr(job.worker, "yielded"):
+            job.worker.yielded.connect(
+                lambda value, job=job: self.onJobProgress(job, value)
+            )
+        job.worker.returned.connect(
+            lambda result, job=job: setattr(job, "result", result)
+        )
+        job.worker.errored.connect(
+            lambda error, job=job: setattr(job, "error", error)
+        )
+        job.worker.finished.connect(lambda job=job: self.onJobFinished(job))
+        self.running.append(job)
+        job.worker.start()
+
+    def onJobProgress(self, job, value=None):
+        if isinstance(value, Total):
+            self.setTotal(job, int(value))
+        else:
+            job.progress = job.progress + 1
+        self.notify()
+
+    @staticmethod
+    def setTotal(job, total):
+        """Set the total of the job and of the progress bar of its worker,
+        which has counted the yielded total as a step.
+        """
+        job.total = total
+        progressBar = getattr(job.worker, "pbar", None)
+        if progressBar is not None:
+            progressBar.n = job.progress
+            progressBar.total = total
+            progressBar.update(0)
+
+    def onJobFinished(self, job):
+        if job not in self.running:
+            return
+        self.running.remove(job)
+        if job.runId is not None:
+            ProcessBackend.getInstance().release(job.runId)
+        if job.error is not None:
+            job.state = Job.FAILED
+        elif job.cancelRequested:
+            job.state = Job.CANCELLED
+        else:
+            job.state = Job.FINISHED
+        job.measurement.stop()
+        self.telemetry.add(
+            job.measurement.getRecord(
+                job=job.description,
+                kind=job.kind,
+                state=job.state,
+                steps=job.progress,
+            )
+        )
+        self.startJobs()
+        self.notify()
+        if job.onDone:
+            job.onDone()
+        if job.state == Job.FINISHED and job.onFinished:
+            job.restoreContext()
+            job.onFinished()
+
+    def notify(self):
+        for listener in list(self.listeners):
+            listener()
@@ -0,0 +1,333 @@
+import collections
+import itertools
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import ndimage
+from sphot.image import Segmentation
+
+
+class TiledSegmentation:
+    """Segment a volume, that is too large to be segmented as a whole, in
+    overlapping 3D tiles.
+
+    The tiles are segmented in parallel in a small pool of spawned processes,
+    since each worker loads its own model, with at most two tiles per worker
+    in memory at the same time. Each segmented tile
+    is stitched into a label volume on disk: a label of the tile that mainly
+    covers a label already written in the overlap with the previous tiles
+    gets the same global label, the other labels get new global labels. Only
+    voxels that are still background are written, so that the labels of the
+    earlier tiles are kept in the overlaps. The removal of border objects and
+    of small objects is done on the stitched volume, one chunk of planes at a
+    time, since it can not be decided within a tile.
+    """
+
+    def __init__(self, image, outputPath):
+        """Create a tiled segmentation of the image.
+
+        :param image: The 3D image to segment
+        :type image: numpy.ndarray
+        :param outputPath: The path of the npy-file into which the labels are
+                           written
+        :type outputPath: str
+        """
+        self.image = image
+        self.outputPath = outputPath
+        self.tileSize = (64, 512, 512)
+        self.overlap = (16, 64, 64)
+        self.nrOfWorkers = 2
+        self.matchFraction = 0.5
+        self.chunkSize = 16
+        self.clearBorder = True
+        self.minSize = 0
+        self.flowThreshold = 0.4
+        self.cellProbabilityThreshold = 0.0
+        self.diameter = 90.0
+        self.resampleDynamics = True
+        self.nrOfLabels = 0
+        self.labels = None
+
+    @staticmethod
+    def getNewOutputPath(folder, name):
+        """Answer the path of a new, empty npy-file in the folder, whose name
+        starts with the given name. Each run writes into a file of its own,
+        so that it does not overwrite the labels of an earlier run, which may
+        still be memory-mapped by a layer.
+        """
+        handle, path = tempfile.mkstemp(
+            suffix=".npy", prefix=name + "_labels_", dir=folder
+        )
+        os.close(handle)
+        return path
+
+    def getTiles(self):
+        """Answer the slices of the overlapping tiles, that cover the image."""
+        shape = self.image.shape
+        tileSize = np.minimum(self.tileSize, shape)
+        step = np.maximum(tileSize - np.minimum(self.overlap, tileSize - 1), 1)
+        starts = []
+        for size, tile, delta in zip(shape, tileSize, step, strict=False):
+            axisStarts = list(range(0, max(size - tile, 0) + 1, delta))
+            if axisStarts[-1] + tile < size:
+                axisStarts.append(size - tile)
+            starts.append(axisStarts)
+        return [
+            tuple(
+                slice(start, start + tile)
+                for start, tile in zip(corner, tileSize, strict=False)
+            )
+            for corner in itertools.product(*starts)
+        ]
+
+    def getNrOfSteps(self):
+        """Answer the number of steps yielded by run, one per tile and one per
+        chunk of each pass of the post-processing.
+        """
+        nrOfChunks = -(-self.image.shape[0] // self.chunkSize)
+        nrOfPasses = 0
+        if self.minSize:
+            nrOfPasses = 2
+        elif self.clearBorder:
+            nrOfPasses = 1
+        return len(self.getTiles()) + nrOfPasses * nrOfChunks
+
+    def getParameters(self):
+        return {
+            "flowThreshold": self.flowThreshold,
+            "cellProbabilityThreshold": self.cellProbabilityThreshold,
+            "diameter": self.diameter,
+            "resampleDynamics": self.resampleDynamics,
+        }
+
+    def run(self):
+        """Segment and stitch the tiles, yields once per tile and once per
+        chunk of the post-processing.
+        """
+        self.labels = np.lib.format.open_memmap(
+            self.outputPath, mode="w+", dtype=np.uint32, shape=self.image.shape
+        )
+        self.nrOfLabels = 0
+        tiles = self.getTiles()
+        parameters = self.getParameters()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=self.nrOfWorkers, mp_context=context
+        ) as executor:
+            maxPending = 2 * self.nrOfWorkers
+            pending = collections.deque()
+            for tile in tiles:
+                pending.append(
+                    (
+                        tile,
+                        executor.submit(
+                            segmentTile,
+                            np.asarray(self.image[tile]),
+                            parameters,
+                        ),
+                    )
+                )
+                if len(pending) >= maxPending:
+                    self.stitch(*self.getResult(pending.popleft()))
+                    yield
+            while pending:
+                self.stitch(*self.getResult(pending.popleft()))
+                yield
+        self.labels.flush()
+        yield from self.postProcess()
+
+    @staticmethod
+    def getResult(item):
+        tile, future = item
+        return tile, future.result()
+
+    def stitch(self, tile, tileLabels):
+        """Write the labels of a segmented tile into the label volume.
+
+        :param tile: The slices of the tile in the volume
+        :param tileLabels: The labels of the tile, numbered from 1 in the tile
+        """
+        tileLabels = np.asarray(tileLabels).astype(np.int64)
+        written = np.asarray(self.labels[tile]).astype(np.int64)
+        length = int(tileLabels.max()) + 1
+        lookup = np.zeros(length, dtype=np.int64)
+        overlap = (tileLabels > 0) & (written > 0)
+        if np.any(overlap):
+            local = tileLabels[overlap]
+            existing = written[overlap]
+            base = int(existing.max()) + 1
+            pairs, counts = np.unique(
+                local * base + existing, return_counts=True
+            )
+            pairLocal = pairs // base
+            pairExisting = pairs % base
+            order = np.lexsort((-counts, pairLocal))
+            isFirst = np.concatenate(
+                ([True], pairLocal[order][1:] != pairLocal[order][:-1])
+            )
+            best = order[isFirst]
+            inOverlapRegion = tileLabels[written > 0]
+            totals = np.bincount(
+                inOverlapRegion[inOverlapRegion > 0], minlength=length
+            )
+            matched = (
+                counts[best] >= self.matchFraction * totals[pairLocal[best]]
+            )
+            lookup[pairLocal[best][matched]] = pairExisting[best][matched]
+        newLabels = np.unique(tileLabels)
+        newLabels = newLabels[(newLabels > 0) & (lookup[newLabels] == 0)]
+        lookup[newLabels] = np.arange(
+            self.nrOfLabels + 1, self.nrOfLabels + 1 + len(newLabels)
+        )
+        self.nrOfLabels = self.nrOfLabels + len(newLabels)
+        globalLabels = lookup[tileLabels]
+        self.labels[tile] = np.where(
+            written > 0, written, globalLabels
+        ).astype(np.uint32)
+
+    def postProcess(self):
+        """Remove the objects touching the border of the volume and the objects
+        smaller than the minimum size, one chunk of planes at a time. Yields
+        once per chunk of each pass, also if no object is removed.
+        """
+        if not self.clearBorder and not self.minSize:
+            return
+        remove = np.zeros(self.nrOfLabels + 1, dtype=bool)
+        if self.clearBorder:
+            for axis in range(self.labels.ndim):
+                for index in (0, self.labels.shape[axis] - 1):
+                    remove[
+                        np.unique(np.take(self.labels, index, axis=axis))
+                    ] = True
+        if self.minSize:
+            sizes = np.zeros(self.nrOfLabels + 1, dtype=np.int64)
+            for start in range(0, self.labels.shape[0], self.chunkSize):
+                chunk = np.asarray(self.labels[start : start + self.chunkSize])
+                sizes += np.bincount(chunk.ravel(), minlength=len(sizes))
+                yield
+            remove |= sizes < self.minSize
+        remove[0] = False
+        lookup = np.arange(self.nrOfLabels + 1, dtype=np.uint32)
+        lookup[remove] = 0
+        for start in range(0, self.labels.shape[0], self.chunkSize):
+            if np.any(remove):
+                self.labels[start : start + self.chunkSize] = lookup[
+                    self.labels[start : start + self.chunkSize]
+                ]
+            yield
+        self.labels.flush()
+
+
+def segmentTile(tile, parameters):
+    """Answer the labels of the segmentation of one tile. The function is
+    defined at module level, so that it can be run in a process pool.
+    """
+    segmentation = Segmentation(tile)
+    segmentation.clearBorder = False
+    segmentation.minSize = 0
+    for key, value in parameters.items():
+        setattr(segmentation, key, value)
+    result = segmentation.run()
+    if result is not None:
+        for _ in result:
+            pass
+    return segmentation.labels
+
+
+class ResampledSegmentation:
+    """Segment an anisotropic image at a lower, isotropic resolution and bring
+    the labels back to the grid of the image.
+
+    The image is smoothed and downsampled to voxels of the size of the
+    smallest voxel size divided by the scale factor, without upsampling the
+    axes that are already coarser. The labels are upsampled with
+    nearest-neighbour interpolation. With the refine upsampling the boundary
+    between the cells and the background is taken from the linear
+    interpolation of the foreground mask instead, which removes the blocky
+    steps of the nearest-neighbour upsampling.
+    """
+
+    upsamplingModes = ["nearest", "refine"]
+
+    def __init__(self, image, scale):
+        """Create a resampled segmentation of the image.
+
+        :param image: The image to segment
+        :type image: numpy.ndarray
+        :param scale: The voxel size of the image
+        """
+        self.image = image
+        self.scale = np.asarray(scale, dtype=float)
+        self.scaleFactor = 0.5
+        self.upsampling = "nearest"
+        self.clearBorder = True
+        self.minSize = 0
+        self.flowThreshold = 0.4
+        self.cellProbabilityThreshold = 0.0
+        self.diameter = 90.0
+        self.resampleDynamics = True
+        self.labels = None
+
+    def getZoom(self):
+        """Answer the zoom factor of each axis of the downsampled image."""
+        targetVoxelSize = np.min(self.scale) / self.scaleFactor
+        return np.minimum(self.scale / targetVoxelSize, 1)
+
+    def run(self):
+        """Downsample, segment and upsample, yields after each step."""
+        zoom = self.getZoom()
+        image = np.asarray(self.image, dtype=np.float32)
+        sigma = np.where(zoom < 1, (1 / zoom - 1) / 2, 0)
+        if np.any(sigma > 0):
+            image = ndimage.gaussian_filter(image, sigma)
+        small = ndimage.zoom(
+            image, zoom, order=1, grid_mode=True, mode="nearest"
+        )
+        yield
+        segmentation = Segmentation(small)
+        segmentation.clearBorder = self.clearBorder
+        segmentation.minSize = self.minSize * np.prod(zoom)
+        segmentation.flowThreshold = self.flowThreshold
+        segmentation.cellProbabilityThreshold = self.cellProbabilityThreshold
+        segmentation.diameter = self.diameter * zoom[-1]
+        segmentation.resampleDynamics = self.resampleDynamics
+        result = segmentation.run()
+        if result is not None:
+            for _ in result:
+                yield
+        self.labels = self.upsample(
+            np.asarray(segmentation.labels), self.image.shape
+        )
+        yield
+
+    def upsample(self, labels, shape):
+        """Answer the labels upsampled to the given shape."""
+        indices = [
+            np.minimum(
+                ((np.arange(size) + 0.5) * small / size).astype(np.int64),
+                small - 1,
+            )
+            for size, small in zip(shape, labels.shape, strict=False)
+        ]
+        upsampled = labels[np.ix_(*indices)]
+        if self.upsampling != "refine":
+            return upsampled
+        zoom = np.array(shape) / np.array(labels.shape)
+        foreground = (
+            ndimage.zoom(
+                (labels > 0).astype(np.float32),
+                zoom,
+                order=1,
+                grid_mode=True,
+                mode="nearest",
+            )
+            > 0.5
+        )
+        size = np.ceil(zoom).astype(np.int64) * 2 + 1
+        grown = ndimage.grey_dilation(upsampled, size=tuple(size))
+        return np.where(
+            foreground, np.where(upsampled > 0, upsampled, grown), 0
+        ).astype(labels.dtype)
@@ -0,0 +1,783 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import fft, ndimage, special
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+
+from napari_sphot.spots_util import SpotsUtil
+
+
+class EcdfResult:
+    """The observed and the simulated empirical CDFs of a statistic of one
+    cell, evaluated on one shared grid of x-values.
+
+    The values are stored as a 2D array with the observed ECDF in the first
+    row and one row per simulation, so that results can be exported and
+    compared across labels without evaluating the ECDFs again.
+    """
+
+    def __init__(self, name, label, xValues, values, envelop=None):
+        """Create a result from ECDFs that are already evaluated.
+
+        :param name: The name of the statistic, for example G, F or H
+        :type name: str
+        :param label: The label of the cell
+        :type label: int
+        :param xValues: The shared grid
+        :type xValues: numpy.ndarray
+        :param values: The observed ECDF in the first row and the simulated
+                       ECDFs in the other rows
+        :type values: numpy.ndarray
+        :param envelop: The rows min, low, high and max of the envelope, if
+                        they are not calculated from the simulations
+        """
+        self.name = name
+        self.label = label
+        self.xValues = np.asarray(xValues)
+        self.values = np.atleast_2d(values)
+        self.envelop = envelop
+        if self.envelop is None and len(self.values) > 1:
+            self.envelop = self.getEnvelop(self.values[1:])
+        if self.envelop is not None:
+            self.envelop = np.asarray(self.envelop)
+
+    @classmethod
+    def fromSamples(
+        cls, name, label, observed, simulated=(), xValues=None, step=1.0
+    ):
+        """Evaluate the ECDFs of the observed and the simulated samples on a
+        shared grid.
+
+        All samples are located on the grid with one call of searchsorted and
+        counted per sample with one bincount.
+
+        :param observed: The observed values
+        :param simulated: A list of simulated samples, each with its own length
+        :param xValues: The grid, if None a grid from 0 to the maximum of all
+                        samples with the given step is used
+        """
+        samples = [np.asarray(observed).ravel()] + [
+            np.asarray(sample).ravel() for sample in simulated
+        ]
+        lengths = np.array([len(sample) for sample in samples])
+        allValues = np.concatenate(samples)
+        if xValues is None:
+            xValues = np.arange(0, allValues.max() + step, step)
+        xValues = np.asarray(xValues)
+        nrOfX = len(xValues)
+        positions = np.searchsorted(xValues, allValues, side="left")
+        groups = np.repeat(np.arange(len(samples)), lengths)
+        counts = np.bincount(
+            groups * (nrOfX + 1) + positions,
+            minlength=len(samples) * (nrOfX + 1),
+        )
+        counts = counts.reshape(len(samples), nrOfX + 1)[:, :nrOfX]
+        values = (
+            np.cumsum(counts, axis=1) / np.maximum(lengths, 1)[:, np.newaxis]
+        )
+        return cls(name, label, xValues, values)
+
+    @staticmethod
+    def getEnvelop(values):
+        """Answer the minimum, the 2.5 and 97.5 percentiles and the maximum of
+        the simulated values at each x-value.
+        """
+        return [
+            np.min(values, axis=0),
+            np.percentile(values, 2.5, axis=0),
+            np.percentile(values, 97.5, axis=0),
+            np.max(values, axis=0),
+        ]
+
+    @property
+    def observed(self):
+        return self.values[0]
+
+    def getOutsideEnvelopFraction(self):
+        """Answer the fraction of the grid at which the observed ECDF lies
+        outside the minimum-maximum envelope.
+        """
+        if self.envelop is None:
+            return np.nan
+        outside = (self.observed < self.envelop[0]) | (
+            self.observed > self.envelop[3]
+        )
+        return np.count_nonzero(outside) / len(self.xValues)
+
+    def getMaxDeviation(self):
+        """Answer the maximal absolute difference between the observed ECDF and
+        the middle of the envelope.
+        """
+        if self.envelop is None:
+            return np.nan
+        return np.max(
+            np.abs(self.observed - (self.envelop[1] + self.envelop[2]) / 2)
+        )
+
+    def getSummary(self):
+        """Answer a table with one row for the cell, that can be merged into
+        the measurements table.
+        """
+        return {
+            "label": [self.label],
+            self.name + "_outside_envelop": [self.getOutsideEnvelopFraction()],
+            self.name + "_max_deviation": [self.getMaxDeviation()],
+        }
+
+    def toTable(self):
+        """Answer the observed ECDF and the envelope as a table with one row
+        per x-value.
+        """
+        table = {"x": self.xValues, "observed": self.observed}
+        if self.envelop is not None:
+            for index, key in enumerate(["min", "low", "high", "max"]):
+                table[key] = self.envelop[index]
+        return table
+
+
+class CellPattern:
+    """The spots of one cell and the mask of the cell, cropped to the bounding
+    box of the cell. Coordinates are in physical units, relative to the corner
+    of the bounding box.
+    """
+
+    def __init__(self, spots, labels, scale, label):
+        """Extract the spots and the mask of the cell with the given label.
+
+        :param spots: The coordinates of the spots in pixels
+        :type spots: numpy.ndarray
+        :param labels: The label image of the cells
+        :type labels: numpy.ndarray
+        :param scale: The voxel size
+        :param label: The label of the cell
+        :type label: int
+        """
+        self.label = label
+        self.scale = np.asarray(scale, dtype=float)
+        mask = np.asarray(labels) == label
+        nonZero = [
+            np.flatnonzero(
+                np.any(
+                    mask, axis=tuple(a for a in range(mask.ndim) if a != axis)
+                )
+            )
+            for axis in range(mask.ndim)
+        ]
+        if any(len(indices) == 0 for indices in nonZero):
+            self.start = np.zeros(mask.ndim, dtype=int)
+            self.mask = np.zeros((0,) * mask.ndim, dtype=bool)
+        else:
+            self.start = np.array([indices[0] for indices in nonZero])
+            end = np.array([indices[-1] + 1 for indices in nonZero])
+            self.mask = mask[
+                tuple(
+                    slice(s, e) for s, e in zip(self.start, end, strict=False)
+                )
+            ]
+        self.points = self.getPointsInCell(spots, labels)
+        self.voxelVolume = np.prod(self.scale)
+        self.volume = np.count_nonzero(self.mask) * self.voxelVolume
+        self.voxels = None
+
+    def getRandomPoints(self, nrOfPoints, rng):
+        """Answer nrOfPoints points uniformly distributed in the cell (complete
+        spatial randomness).
+        """
+        coordinates = self.getRandomVoxels(nrOfPoints, rng)
+        return (coordinates + rng.random(coordinates.shape)) * self.scale
+
+    def getPointsInCell(self, spots, labels):
+        """Answer the coordinates, relative to the bounding box and in
+        physical units, of the spots that lie in the cell.
+        """
+        spots = np.asarray(spots)
+        spotLabels = SpotsUtil.getLabelsOfSpots(spots, labels)
+        return (spots[spotLabels == self.label] - self.start) * self.scale
+
+    def getRandomVoxels(self, nrOfPoints, rng):
+        """Answer the indices of nrOfPoints voxels of the cell, drawn
+        uniformly with replacement.
+        """
+        if self.voxels is None:
+            self.voxels = np.flatnonzero(self.mask)
+        indices = rng.choice(self.voxels, size=nrOfPoints)
+        return np.column_stack(np.unravel_index(indices, self.mask.shape))
+
+    def getSpotVoxels(self):
+        """Answer the indices of the voxels of the bounding box containing
+        the spots of the cell.
+        """
+        voxels = np.floor(self.points / self.scale).astype(np.int64)
+        return np.clip(voxels, 0, np.array(self.mask.shape) - 1)
+
+    def getEmptySpaceDistances(self, voxels):
+        """Answer the sorted distances from each voxel of the cell to the
+        nearest of the given voxels, calculated with one anisotropic euclidean
+        distance transform of the bounding box.
+        """
+        spots = np.ones(self.mask.shape, dtype=bool)
+        spots[tuple(np.asarray(voxels).T)] = False
+        distances = ndimage.distance_transform_edt(spots, sampling=self.scale)
+        return np.sort(distances[self.mask])
+
+    def getSetCovariance(self, radii):
+        """Answer the isotropized set covariance of the mask at the given
+        radii, i.e. the mean volume of the intersection of the cell with the
+        cell translated by a vector of length r.
+
+        The covariance is calculated for all translations at once as the
+        autocorrelation of the mask with one FFT.
+        """
+        shape = [2 * size for size in self.mask.shape]
+        spectrum = fft.rfftn(self.mask.astype(np.float32), s=shape)
+        covariance = fft.irfftn(spectrum * np.conj(spectrum), s=shape)
+        covariance = fft.fftshift(covariance) * self.voxelVolume
+        grids = np.ogrid[
+            tuple(slice(-(size // 2), size - size // 2) for size in shape)
+        ]
+        distances = np.sqrt(
+            sum(
+                (grid * step) ** 2
+                for grid, step in zip(grids, self.scale, strict=False)
+            )
+        )
+        binWidth = np.min(self.scale) / 2
+        bins = (distances / binWidth).astype(np.int64).ravel()
+        sums = np.bincount(bins, weights=covariance.ravel())
+        counts = np.bincount(bins)
+        binCenters = (np.flatnonzero(counts) + 0.5) * binWidth
+        means = sums[counts > 0] / counts[counts > 0]
+        binCenters = np.concatenate(([0], binCenters))
+        means = np.concatenate(([self.volume], means))
+        return np.clip(
+            np.interp(radii, binCenters, means), self.voxelVolume, None
+        )
+
+
+class RipleyTask:
+    """Calculate Ripley's K-function, the L-function and the pair-correlation
+    function g(r) of the spots in a cell, with envelopes from simulations of
+    complete spatial randomness in the cell.
+
+    The pairs are counted with a kd-tree at all radii at once, so that the
+    matrix of the distances is never built. Edge effects are corrected with the
+    isotropized set covariance of the cell mask.
+    """
+
+    functions = ["K", "L", "g"]
+
+    def __init__(self, spots, labels, scale, unit, label):
+        self.spots = spots
+        self.labels = labels
+        self.scale = scale
+        self.unit = unit
+        self.label = label
+        self.function = "K"
+        self.nrOfSimulations = 100
+        self.nrOfRadii = 50
+        self.maxRadius = None
+        self.nrOfWorkers = None
+        self.seed = None
+        self.pattern = None
+        self.radii = None
+        self.covariance = None
+        self.k = None
+        self.l = None
+        self.g = None
+        self.envelop = None
+        self.envelops = {}
+
+    def run(self):
+        """Calculate the functions and the envelopes, yields once per simulation."""
+        self.pattern = CellPattern(
+            self.spots, self.labels, self.scale, self.label
+        )
+        nrOfPoints = len(self.pattern.points)
+        if nrOfPoints < 2:
+            return
+        maxRadius = self.maxRadius
+        if not maxRadius:
+            maxRadius = (
+                np.min(np.array(self.pattern.mask.shape) * self.pattern.scale)
+                / 4
+            )
+        self.radii = np.linspace(
+            maxRadius / self.nrOfRadii, maxRadius, self.nrOfRadii
+        )
+        shells = (np.concatenate(([0], self.radii[:-1])) + self.radii) / 2
+        self.covariance = self.pattern.getSetCovariance(shells)
+        self.k, self.l, self.g = self.getFunctions(self.pattern.points)
+        rng = np.random.default_rng(self.seed)
+        seeds = rng.integers(np.iinfo(np.int64).max, size=self.nrOfSimulations)
+        simulations = []
+        with ThreadPoolExecutor(max_workers=self.nrOfWorkers) as executor:
+            for result in executor.map(self.simulate, seeds):
+                simulations.append(result)
+                yield
+        for index, name in enumerate(self.functions):
+            values = np.array(
+                [simulation[index] for simulation in simulations]
+            )
+            self.envelops[name] = EcdfResult.getEnvelop(values)
+        self.envelop = self.envelops[self.function]
+
+    def simulate(self, seed):
+        rng = np.random.default_rng(seed)
+        points = self.pattern.getRandomPoints(len(self.pattern.points), rng)
+        return self.getFunctions(points)
+
+    def getFunctions(self, points):
+        """Answer K, L and g of the points at self.radii."""
+        nrOfPoints = len(points)
+        tree = cKDTree(points)
+        pairs = (
+            tree.count_neighbors(tree, self.radii).astype(float) - nrOfPoints
+        )
+        pairsPerShell = np.diff(np.concatenate(([0], pairs)))
+        volume = self.pattern.volume
+        kFunction = (
+            volume
+            * volume
+            / (nrOfPoints * (nrOfPoints - 1))
+            * np.cumsum(pairsPerShell / self.covariance)
+        )
+        lFunction = np.cbrt(3 * kFunction / (4 * np.pi))
+        gFunction = np.gradient(kFunction, self.radii) / (
+            4 * np.pi * self.radii * self.radii
+        )
+        return kFunction, lFunction, gFunction
+
+    def getResult(self):
+        """Answer the values of the selected function."""
+        return {"K": self.k, "L": self.l, "g": self.g}[self.function]
+
+
+class ExactFFunctionTask:
+    """Calculate the empty space function (F-function) of the spots in a cell
+    from the distances of all voxels of the cell to their nearest spot.
+
+    The spots are rasterized into the bounding box of the cell and the
+    distances are read from one anisotropic euclidean distance transform, so
+    that the empirical CDF is deterministic. The distances are measured
+    between voxel centers. The envelopes are calculated in the same way for
+    simulations of complete spatial randomness in the cell.
+    """
+
+    def __init__(self, spots, labels, scale, unit, label):
+        self.spots = spots
+        self.labels = labels
+        self.scale = scale
+        self.unit = unit
+        self.label = label
+        self.nrOfSimulations = 100
+        self.nrOfWorkers = None
+        self.seed = None
+        self.pattern = None
+        self.distances = None
+        self.xValues = None
+        self.result = None
+
+    def run(self):
+        """Calculate the F-function and the envelopes, yields once per
+        simulation.
+        """
+        self.pattern = CellPattern(
+            self.spots, self.labels, self.scale, self.label
+        )
+        if len(self.pattern.points) == 0:
+            return
+        self.distances = self.pattern.getEmptySpaceDistances(
+            self.pattern.getSpotVoxels()
+        )
+        step = self.pattern.scale[1]
+        self.xValues = np.arange(0, self.distances[-1] + step, step)
+        rng = np.random.default_rng(self.seed)
+        seeds = rng.integers(np.iinfo(np.int64).max, size=self.nrOfSimulations)
+        simulations = []
+        with ThreadPoolExecutor(max_workers=self.nrOfWorkers) as executor:
+            for result in executor.map(self.simulate, seeds):
+                simulations.append(result)
+                yield
+        observed = EcdfResult.fromSamples(
+            "F", self.label, self.distances, xValues=self.xValues
+        ).observed
+        self.result = EcdfResult(
+            "F", self.label, self.xValues, np.vstack([observed] + simulations)
+        )
+
+    def simulate(self, seed):
+        """Answer the ECDF of a random pattern on the grid. The simulations
+        are evaluated one by one, since the distances of all voxels of all
+        simulations would not fit into memory.
+        """
+        rng = np.random.default_rng(seed)
+        voxels = self.pattern.getRandomVoxels(len(self.pattern.points), rng)
+        distances = self.pattern.getEmptySpaceDistances(voxels)
+        return EcdfResult.fromSamples(
+            "F", self.label, distances, xValues=self.xValues
+        ).observed
+
+
+class HistogramHFunctionTask:
+    """Calculate the distribution of all pairwise distances (H-function) of
+    the spots in a cell from a histogram with a fixed number of bins.
+
+    The pairwise distances are calculated block by block and added to the
+    histogram, so that the memory needed does not grow with the square of the
+    number of spots. The empirical CDF, the maximum distance and the
+    envelopes are all calculated from histograms.
+    """
+
+    def __init__(self, spots, labels, scale, unit, label):
+        self.spots = spots
+        self.labels = labels
+        self.scale = scale
+        self.unit = unit
+        self.label = label
+        self.nrOfSimulations = 100
+        self.nrOfBins = 1000
+        self.maxBlockSize = 2**22
+        self.nrOfWorkers = None
+        self.seed = None
+        self.pattern = None
+        self.binWidth = None
+        self.histogram = None
+        self.maxDistance = None
+        self.result = None
+
+    def run(self):
+        """Calculate the H-function and the envelopes, yields once per
+        simulation.
+        """
+        self.pattern = CellPattern(
+            self.spots, self.labels, self.scale, self.label
+        )
+        if len(self.pattern.points) < 2:
+            return
+        diagonal = np.linalg.norm(
+            np.array(self.pattern.mask.shape) * self.pattern.scale
+        )
+        self.binWidth = diagonal / self.nrOfBins
+        self.histogram, self.maxDistance = self.getHistogram(
+            self.pattern.points
+        )
+        rng = np.random.default_rng(self.seed)
+        seeds = rng.integers(np.iinfo(np.int64).max, size=self.nrOfSimulations)
+        histograms = []
+        with ThreadPoolExecutor(max_workers=self.nrOfWorkers) as executor:
+            for histogram, _ in executor.map(self.simulate, seeds):
+                histograms.append(histogram)
+                yield
+        histograms = np.vstack([self.histogram] + histograms)
+        values = np.cumsum(histograms, axis=1) / np.sum(
+            histograms, axis=1, keepdims=True
+        )
+        # Keep the bins up to the first one, at which all curves have reached 1
+        lastBin = np.flatnonzero(np.min(values, axis=0) < 1)
+        end = lastBin[-1] + 2 if len(lastBin) > 0 else 1
+        xValues = np.arange(1, end + 1) * self.binWidth
+        self.result = EcdfResult("H", self.label, xValues, values[:, :end])
+
+    def simulate(self, seed):
+        rng = np.random.default_rng(seed)
+        return self.getHistogram(
+            self.pattern.getRandomPoints(len(self.pattern.points), rng)
+        )
+
+    def getHistogram(self, points):
+        """Answer the histogram of the distances of all pairs of points and
+        the maximum distance, calculating the distances block by block.
+        """
+        nrOfPoints = len(points)
+        blockSize = max(1, self.maxBlockSize // nrOfPoints)
+        histogram = np.zeros(self.nrOfBins, dtype=np.int64)
+        maxDistance = 0
+        for start in range(0, nrOfPoints - 1, blockSize):
+            end = min(start + blockSize, nrOfPoints)
+            distances = cdist(points[start:end], points[start + 1 :])
+            rows, columns = np.indices(distances.shape, sparse=True)
+            distances = distances[columns >= rows]
+            maxDistance = max(maxDistance, distances.max())
+            bins = np.minimum(
+                (distances / self.binWidth).astype(np.int64), self.nrOfBins - 1
+            )
+            histogram += np.bincount(bins, minlength=self.nrOfBins)
+        return histogram, maxDistance
+
+
+class CrossTypeTask:
+    """Calculate the cross G-function (distances from each spot of population A
+    to the nearest spot of population B) and the cross K-function of two
+    populations of spots in the same cell.
+
+    Each population is put into its own kd-tree. The envelopes are calculated
+    from random relabelings of the pooled spots, which keep the number of
+    spots of each type (label swapping), and run in parallel.
+    """
+
+    def __init__(self, spotsA, spotsB, labels, scale, unit, label):
+        self.spotsA = spotsA
+        self.spotsB = spotsB
+        self.labels = labels
+        self.scale = scale
+        self.unit = unit
+        self.label = label
+        self.nrOfPermutations = 100
+        self.nrOfRadii = 50
+        self.maxRadius = None
+        self.nrOfWorkers = None
+        self.seed = None
+        self.pattern = None
+        self.pointsA = None
+        self.pointsB = None
+        self.covariance = None
+        self.xValues = None
+        self.radii = None
+        self.nnDistances = None
+        self.result = None
+        self.k = None
+        self.kEnvelop = None
+        self.pValue = None
+        self.table = {}
+
+    def run(self):
+        """Calculate the cross functions and the permutation envelopes, yields
+        once per permutation.
+        """
+        self.pattern = CellPattern(
+            self.spotsA, self.labels, self.scale, self.label
+        )
+        self.pointsA = self.pattern.points
+        self.pointsB = self.pattern.getPointsInCell(self.spotsB, self.labels)
+        if len(self.pointsA) == 0 or len(self.pointsB) == 0:
+            return
+        maxRadius = self.maxRadius
+        if not maxRadius:
+            maxRadius = (
+                np.min(np.array(self.pattern.mask.shape) * self.pattern.scale)
+                / 4
+            )
+        self.radii = np.linspace(
+            maxRadius / self.nrOfRadii, maxRadius, self.nrOfRadii
+        )
+        shells = (np.concatenate(([0], self.radii[:-1])) + self.radii) / 2
+        self.covariance = self.pattern.getSetCovariance(shells)
+        self.nnDistances = np.sort(
+            cKDTree(self.pointsB).query(self.pointsA)[0]
+        )
+        step = self.pattern.scale[1]
+        self.xValues = np.arange(0, self.nnDistances[-1] + step, step)
+        _, self.k, meanDistance = self.getFunctions(self.pointsA, self.pointsB)
+        pooled = np.concatenate((self.pointsA, self.pointsB))
+        rng = np.random.default_rng(self.seed)
+        seeds = rng.integers(
+            np.iinfo(np.int64).max, size=self.nrOfPermutations
+        )
+        permutations = []
+        with ThreadPoolExecutor(max_workers=self.nrOfWorkers) as executor:
+            for result in executor.map(
+                lambda seed: self.permute(pooled, seed), seeds
+            ):
+                permutations.append(result)
+                yield
+        self.result = EcdfResult.fromSamples(
+            "cross_G",
+            self.label,
+            self.nnDistances,
+            [result[0] for result in permutations],
+            xValues=self.xValues,
+        )
+        self.kEnvelop = EcdfResult.getEnvelop(
+            np.array([result[1] for result in permutations])
+        )
+        permutedMeans = np.array([result[2] for result in permutations])
+        self.pValue = (1 + np.count_nonzero(permutedMeans <= meanDistance)) / (
+            1 + len(permutedMeans)
+        )
+        self.table = self.result.getSummary()
+        self.table["cross_nn_mean"] = [meanDistance]
+        self.table["cross_nn_p_value"] = [self.pValue]
+
+    def permute(self, pooled, seed):
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(pooled))
+        pointsA = pooled[order[: len(self.pointsA)]]
+        pointsB = pooled[order[len(self.pointsA) :]]
+        return self.getFunctions(pointsA, pointsB)
+
+    def getFunctions(self, pointsA, pointsB):
+        """Answer the distances from each point of A to the nearest point of
+        B, the cross K-function at self.radii and the mean of the distances.
+        """
+        treeA = cKDTree(pointsA)
+        treeB = cKDTree(pointsB)
+        distances = treeB.query(pointsA)[0]
+        pairs = treeA.count_neighbors(treeB, self.radii).astype(float)
+        pairsPerShell = np.diff(np.concatenate(([0], pairs)))
+        volume = self.pattern.volume
+        k = (
+            volume
+            * volume
+            / (len(pointsA) * len(pointsB))
+            * np.cumsum(pairsPerShell / self.covariance)
+        )
+        return distances, k, np.mean(distances)
+
+
+class HeterogeneityTask:
+    """Calculate indices of the spatial heterogeneity of the spots of all
+    cells: the variance to mean ratio of the quadrat counts, Morisita's index
+    and the Clark-Evans ratio of the nearest neighbour distances.
+
+    The counts of the voxels and of the spots per cell and quadrat are
+    accumulated for all cells at once with grouped bincounts, the nearest
+    neighbours of all cells are searched in one kd-tree, in which the label
+    is an additional coordinate, so that spots of different cells are never
+    neighbours.
+    """
+
+    minQuadratCoverage = 0.5
+
+    def __init__(self, spots, labels, scale, unit):
+        """Create a task for the given spots and cell labels.
+
+        :param spots: The coordinates of the spots in pixels
+        :type spots: numpy.ndarray
+        :param labels: The label image of the cells
+        :type labels: numpy.ndarray
+        :param scale: The voxel size
+        :param unit: The unit of the voxel size
+        """
+        self.spots = np.asarray(spots)
+        self.labels = labels
+        self.scale = np.asarray(scale, dtype=float)
+        self.unit = unit
+        self.quadratSize = None
+        self.table = {}
+
+    def getQuadratShape(self):
+        """Answer the size of the quadrats in voxels along each axis. By default
+        the quadrats are cubes with an edge of 8 times the largest voxel size.
+        """
+        quadratSize = self.quadratSize
+        if not quadratSize:
+            quadratSize = 8 * np.max(self.scale)
+        return np.maximum(np.round(quadratSize / self.scale), 1).astype(
+            np.int64
+        )
+
+    def run(self):
+        """Calculate the indices of all cells, yields once per plane of the
+        label image.
+        """
+        labels = np.asarray(self.labels)
+        quadratShape = self.getQuadratShape()
+        gridShape = -(-np.array(labels.shape) // quadratShape)
+        nrOfQuadrats = int(np.prod(gridShape))
+        keys = []
+        counts = []
+        for z in range(labels.shape[0]):
+            plane = labels[z]
+            coordinates = np.nonzero(plane)
+            if len(coordinates[0]) > 0:
+                voxels = np.column_stack(
+                    (np.full(len(coordinates[0]), z),) + coordinates
+                )
+                planeKeys, planeCounts = np.unique(
+                    self.getKeys(
+                        plane[coordinates], voxels, quadratShape, gridShape
+                    ),
+                    return_counts=True,
+                )
+                keys.append(planeKeys)
+                counts.append(planeCounts)
+            yield
+        if not keys:
+            return
+        keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        voxelCounts = np.bincount(inverse, weights=np.concatenate(counts))
+        spotLabels = SpotsUtil.getLabelsOfSpots(self.spots, labels)
+        inCell = spotLabels > 0
+        spotLabels = spotLabels[inCell].astype(np.int64)
+        spotVoxels = np.clip(
+            self.spots[inCell].astype(np.int64), 0, np.array(labels.shape) - 1
+        )
+        spotKeys = self.getKeys(
+            spotLabels, spotVoxels, quadratShape, gridShape
+        )
+        spotCounts = np.bincount(
+            np.searchsorted(keys, spotKeys), minlength=len(keys)
+        ).astype(float)
+        keyLabels = keys // nrOfQuadrats
+        cellLabels, cellRows = np.unique(keyLabels, return_inverse=True)
+        valid = voxelCounts >= self.minQuadratCoverage * np.prod(quadratShape)
+        nrOfCells = len(cellLabels)
+        q = np.bincount(cellRows, weights=valid, minlength=nrOfCells)
+        n = np.bincount(
+            cellRows, weights=spotCounts * valid, minlength=nrOfCells
+        )
+        nn = np.bincount(
+            cellRows,
+            weights=spotCounts * spotCounts * valid,
+            minlength=nrOfCells,
+        )
+        nrOfSpots = np.bincount(
+            np.searchsorted(cellLabels, spotLabels), minlength=nrOfCells
+        )
+        volumes = np.bincount(
+            cellRows, weights=voxelCounts, minlength=nrOfCells
+        ) * np.prod(self.scale)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = n / q
+            variance = (nn - q * mean * mean) / (q - 1)
+            dispersion = np.where(q > 1, variance / mean, np.nan)
+            morisita = np.where(
+                (q > 1) & (n > 1), q * (nn - n) / (n * (n - 1)), np.nan
+            )
+        self.table = {
+            "label": cellLabels,
+            "nr_of_spots": nrOfSpots,
+            "nr_of_quadrats": q.astype(np.int64),
+            "quadrat_dispersion": dispersion,
+            "morisita_index": morisita,
+            "clark_evans_ratio": self.getClarkEvansRatios(
+                spotLabels, self.spots[inCell], cellLabels, nrOfSpots, volumes
+            ),
+        }
+
+    @staticmethod
+    def getKeys(labels, voxels, quadratShape, gridShape):
+        """Answer a key per voxel, that combines its label and the index of its
+        quadrat.
+        """
+        quadrats = np.ravel_multi_index(
+            tuple((voxels // quadratShape).T), tuple(gridShape)
+        )
+        return labels.astype(np.int64) * int(np.prod(gridShape)) + quadrats
+
+    def getClarkEvansRatios(
+        self, spotLabels, spots, cellLabels, nrOfSpots, volumes
+    ):
+        """Answer the ratio of the mean nearest neighbour distance of the spots
+        of each cell to the mean distance expected under complete spatial
+        randomness with the same density.
+        """
+        ratios = np.full(len(cellLabels), np.nan)
+        if len(spots) < 2:
+            return ratios
+        points = spots * self.scale
+        separation = 2 * np.linalg.norm(np.ptp(points, axis=0)) + 1
+        tree = cKDTree(np.column_stack((points, spotLabels * separation)))
+        distances, _ = tree.query(tree.data, k=2)
+        nearest = distances[:, 1]
+        ownCell = nearest < separation
+        rows = np.searchsorted(cellLabels, spotLabels)
+        sums = np.bincount(
+            rows[ownCell], weights=nearest[ownCell], minlength=len(cellLabels)
+        )
+        valid = nrOfSpots > 1
+        density = nrOfSpots[valid] / volumes[valid]
+        expected = special.gamma(4 / 3) * np.cbrt(3 / (4 * np.pi * density))
+        ratios[valid] = sums[valid] / nrOfSpots[valid] / expected
+        return ratios
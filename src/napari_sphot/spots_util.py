@@ -0,0 +1,89 @@
+import numpy as np
+
+
+class SpotsUtil:
+    """Assign spots to the cells of a label image."""
+
+    @staticmethod
+    def getLabelsOfSpots(spots, labels):
+        """Answer the label under each spot, the coordinates of the spots are
+        truncated to integers and clipped to the label image.
+        """
+        coordinates = np.asarray(spots).astype(np.int64)
+        if len(coordinates) == 0:
+            return np.zeros(0, dtype=np.asarray(labels).dtype)
+        coordinates = np.clip(coordinates, 0, np.array(labels.shape) - 1)
+        return np.asarray(labels)[tuple(coordinates.T)]
+
+    @staticmethod
+    def addSpotsToTable(spots, labels, scale, table):
+        """Append the id, the label and the coordinates in pixels and in the
+        unit of the scale of each spot to the columns of the table, yields
+        once per spot.
+
+        :param table: A dictionary with the columns id, label, z, y, x, sz, sy
+                      and sx
+        """
+        for i, point in enumerate(spots):
+            label = labels[int(point[0]), int(point[1]), int(point[2])]
+            table["id"].append(i)
+            table["label"].append(label)
+            table["z"].append(int(point[0]))
+            table["y"].append(int(point[1]))
+            table["x"].append(int(point[2]))
+            table["sz"].append(int(point[0]) * scale[0])
+            table["sy"].append(int(point[1]) * scale[1])
+            table["sx"].append(int(point[2]) * scale[2])
+            yield
+
+    @staticmethod
+    def getSpotsPerLabel(spots, spotLabels):
+        """Answer a dictionary with the spots of each label, without the
+        background label 0.
+        """
+        order = np.argsort(spotLabels, kind="stable")
+        sortedLabels = spotLabels[order]
+        uniqueLabels, starts = np.unique(sortedLabels, return_index=True)
+        groups = np.split(np.asarray(spots)[order], starts[1:])
+        return {
+            label.item(): group
+            for label, group in zip(uniqueLabels, groups, strict=False)
+            if label > 0
+        }
+
+
+class SpotsPerCellTask:
+    """Count the spots in each cell and calculate the spot density of each
+    cell, with one bincount over the labels of the spots and one over the
+    label image.
+    """
+
+    def __init__(self, spots, labels, scale):
+        """Create a task for the given spots and cell labels.
+
+        :param spots: The coordinates of the spots in pixels
+        :type spots: numpy.ndarray
+        :param labels: The label image of the cells
+        :type labels: numpy.ndarray
+        :param scale: The voxel size
+        """
+        self.spots = np.asarray(spots)
+        self.labels = labels
+        self.scale = np.asarray(scale, dtype=float)
+        self.table = {}
+
+    def run(self):
+        labels = np.asarray(self.labels)
+        length = int(labels.max()) + 1
+        voxels = np.bincount(labels.ravel(), minlength=length)
+        spotLabels = SpotsUtil.getLabelsOfSpots(self.spots, labels)
+        counts = np.bincount(spotLabels, minlength=length)
+        presentLabels = np.nonzero(voxels)[0]
+        presentLabels = presentLabels[presentLabels > 0]
+        volumes = voxels[presentLabels] * np.prod(self.scale)
+        self.table = {
+            "label": presentLabels,
+            "nr_of_spots": counts[presentLabels],
+            "volume": volumes,
+            "spot_density": counts[presentLabels] / volumes,
+        }
@@ -0,0 +1,194 @@
+import numpy as np
+from scipy import ndimage
+
+
+class SyntheticEmbryo:
+    """Create a deterministic synthetic embryo: a label image of ellipsoidal
+    nuclei, random and clustered spots within the nuclei, an image of the
+    spots and an image of the nuclei, both with background and noise.
+
+    The same seed and the same parameters always give the same data, so that
+    the embryo can be used in tests and benchmarks without downloading
+    images. Nuclei may overlap, the overlapping voxels keep the label of the
+    nucleus created first.
+    """
+
+    sizes = {
+        "small": {
+            "shape": (32, 128, 128),
+            "nrOfNuclei": 6,
+            "nucleusRadius": (8, 20, 20),
+            "nrOfRandomSpots": 300,
+            "nrOfClusters": 10,
+            "spotsPerCluster": 20,
+        },
+        "medium": {
+            "shape": (64, 256, 256),
+            "nrOfNuclei": 20,
+            "nucleusRadius": (12, 30, 30),
+            "nrOfRandomSpots": 2000,
+            "nrOfClusters": 40,
+            "spotsPerCluster": 25,
+        },
+        "large": {
+            "shape": (128, 512, 512),
+            "nrOfNuclei": 60,
+            "nucleusRadius": (16, 40, 40),
+            "nrOfRandomSpots": 10000,
+            "nrOfClusters": 150,
+            "spotsPerCluster": 30,
+        },
+    }
+
+    def __init__(self, shape=(32, 128, 128), nrOfNuclei=6, seed=0):
+        """Create a synthetic embryo with the given shape and number of nuclei.
+
+        :param shape: The shape of the images in voxels (z, y, x)
+        :param nrOfNuclei: The number of nuclei
+        :param seed: The seed of the random number generator
+        """
+        self.shape = tuple(shape)
+        self.nrOfNuclei = nrOfNuclei
+        self.seed = seed
+        self.nucleusRadius = (8, 20, 20)
+        self.nrOfRandomSpots = 300
+        self.nrOfClusters = 10
+        self.spotsPerCluster = 20
+        self.clusterRadius = 2.0
+        self.spotSigma = (1.0, 1.5, 1.5)
+        self.spotIntensity = 400
+        self.nucleusIntensity = 300
+        self.background = 100
+        self.noise = 10
+        self.scale = (30, 30, 30)
+        self.units = ("nm", "nm", "nm")
+        self.labels = None
+        self.randomSpots = None
+        self.clusteredSpots = None
+        self.spots = None
+        self.image = None
+        self.nucleiImage = None
+
+    @classmethod
+    def ofSize(cls, name, seed=0):
+        """Answer an embryo with the parameters of one of the sizes small,
+        medium or large.
+        """
+        if name not in cls.sizes:
+            raise ValueError(
+                "Unknown size "
+                + str(name)
+                + ", use one of "
+                + str(list(cls.sizes))
+            )
+        embryo = SyntheticEmbryo(seed=seed)
+        for key, value in cls.sizes[name].items():
+            setattr(embryo, key, value)
+        return embryo
+
+    def run(self):
+        rng = np.random.default_rng(self.seed)
+        self.labels = self.createNuclei(rng)
+        self.randomSpots = self.createRandomSpots(rng)
+        self.clusteredSpots = self.createClusteredSpots(rng)
+        self.spots = np.concatenate([self.randomSpots, self.clusteredSpots])
+        self.image = self.createSpotsImage(rng)
+        self.nucleiImage = self.createNucleiImage(rng)
+
+    def createNuclei(self, rng):
+        """Answer a label image with one ellipsoid per nucleus, the radii vary
+        by up to 20 percent around the nucleus radius.
+        """
+        shape = np.asarray(self.shape)
+        dtype = np.uint16 if self.nrOfNuclei < 2**16 else np.uint32
+        labels = np.zeros(self.shape, dtype=dtype)
+        for label in range(1, self.nrOfNuclei + 1):
+            radius = np.asarray(self.nucleusRadius, dtype=float) * rng.uniform(
+                0.8, 1.2, len(shape)
+            )
+            margin = np.minimum(np.ceil(radius), shape // 2)
+            center = rng.uniform(margin, shape - margin)
+            box = tuple(
+                slice(max(int(c - r), 0), min(int(c + r) + 1, size))
+                for c, r, size in zip(center, radius, shape, strict=False)
+            )
+            grid = np.ogrid[box]
+            inside = (
+                sum(
+                    ((axis - c) / r) ** 2
+                    for axis, c, r in zip(grid, center, radius, strict=False)
+                )
+                <= 1
+            )
+            region = labels[box]
+            region[inside & (region == 0)] = label
+        return labels
+
+    def getRandomVoxelsInNuclei(self, rng, number):
+        voxels = np.flatnonzero(self.labels)
+        if len(voxels) == 0 or number == 0:
+            return np.zeros((0, self.labels.ndim))
+        chosen = voxels[rng.integers(0, len(voxels), number)]
+        return np.stack(
+            np.unravel_index(chosen, self.labels.shape), axis=1
+        ) + rng.uniform(0, 1, (number, 3))
+
+    def createRandomSpots(self, rng):
+        """Answer spots uniformly distributed within the nuclei."""
+        return self.getRandomVoxelsInNuclei(rng, self.nrOfRandomSpots)
+
+    def createClusteredSpots(self, rng):
+        """Answer clusters of spots around random centers within the nuclei.
+        Spots of a cluster, that fall outside of the nucleus of its center,
+        are dropped.
+        """
+        centers = self.getRandomVoxelsInNuclei(rng, self.nrOfClusters)
+        clusters = []
+        for center in centers:
+            spots = center + rng.normal(
+                0, self.clusterRadius, (self.spotsPerCluster, len(center))
+            )
+            spots = spots[
+                np.all((spots >= 0) & (spots < self.labels.shape), axis=1)
+            ]
+            label = self.labels[tuple(center.astype(np.int64))]
+            spots = spots[
+                self.labels[tuple(spots.astype(np.int64).T)] == label
+            ]
+            clusters.append(spots)
+        if not clusters:
+            return np.zeros((0, self.labels.ndim))
+        return np.concatenate(clusters)
+
+    def createSpotsImage(self, rng):
+        """Answer an image with a gaussian spot of the spot intensity at each
+        spot, on the background, with gaussian noise.
+        """
+        image = np.zeros(self.shape, dtype=np.float32)
+        voxels = np.clip(
+            self.spots.astype(np.int64), 0, np.array(self.shape) - 1
+        )
+        peak = (
+            self.spotIntensity
+            * (2 * np.pi) ** (len(self.shape) / 2)
+            * np.prod(self.spotSigma)
+        )
+        np.add.at(image, tuple(voxels.T), peak)
+        image = ndimage.gaussian_filter(image, self.spotSigma)
+        return self.addBackgroundAndNoise(image, rng)
+
+    def createNucleiImage(self, rng):
+        """Answer an image of the nuclei with smoothed borders, on the
+        background, with gaussian noise.
+        """
+        image = (self.labels > 0).astype(np.float32) * self.nucleusIntensity
+        image = ndimage.gaussian_filter(image, 2)
+        return self.addBackgroundAndNoise(image, rng)
+
+    def addBackgroundAndNoise(self, image, rng):
+        image = (
+            image
+            + self.background
+            + rng.normal(0, self.noise, image.shape).astype(np.float32)
+        )
+        return np.clip(np.round(image), 0, 2**16 - 1).astype(np.uint16)
@@ -0,0 +1,90 @@
+import numpy as np
+
+
+class TableUtil:
+    """Utilities for tables, represented as dictionaries with the column names
+    as keys and the data of the columns as lists or arrays.
+    """
+
+    @staticmethod
+    def getNrOfRows(table):
+        if not table:
+            return 0
+        return len(list(table.values())[0])
+
+    @staticmethod
+    def mergeRows(tableA, tableB, keys=("image", "label"), missing=np.nan):
+        """Merge the rows of tableA into tableB.
+
+        Rows of tableA whose values in the key columns match a row of tableB
+        update the columns of that row, the other rows of tableA are appended
+        to tableB. Columns of one table, that are missing in the other one, are
+        added and filled with the missing value.
+
+        :param tableA: The table whose rows are merged into tableB
+        :type tableA: dict
+        :param tableB: The table that is modified
+        :type tableB: dict
+        :param keys: The columns that identify a row
+        :type keys: (str)
+        :param missing: The value of the cells that have no data
+        """
+        rowsA = TableUtil.getNrOfRows(tableA)
+        rowsB = TableUtil.getNrOfRows(tableB)
+        for key, value in tableB.items():
+            tableB[key] = list(value)
+        for key in tableA:
+            if key not in tableB:
+                tableB[key] = [missing] * rowsB
+        index = {}
+        if all(key in tableB for key in keys):
+            columns = [tableB[key] for key in keys]
+            index = {
+                TableUtil.getKey(values): row
+                for row, values in enumerate(zip(*columns, strict=False))
+            }
+        for rowA in range(rowsA):
+            rowKey = TableUtil.getKey(
+                [tableA[key][rowA] for key in keys if key in tableA]
+            )
+            rowB = index.get(rowKey)
+            if rowB is None:
+                for key, column in tableB.items():
+                    column.append(
+                        tableA[key][rowA] if key in tableA else missing
+                    )
+                index[rowKey] = len(list(tableB.values())[0]) - 1
+            else:
+                for key, column in tableA.items():
+                    tableB[key][rowB] = column[rowA]
+
+    @staticmethod
+    def getKey(values):
+        return tuple(
+            value.item() if isinstance(value, np.generic) else value
+            for value in values
+        )
+
+    @staticmethod
+    def deleteRows(table, rowKeys, keys=("image", "label")):
+        """Delete the rows whose values in the key columns are one of rowKeys.
+
+        :param table: The table that is modified
+        :type table: dict
+        :param rowKeys: The values of the key columns of the rows to delete
+        :type rowKeys: [tuple]
+        :param keys: The columns that identify a row
+        :type keys: (str)
+        """
+        if not table or not all(key in table for key in keys):
+            return
+        rowKeys = {TableUtil.getKey(rowKey) for rowKey in rowKeys}
+        columns = [table[key] for key in keys]
+        keep = [
+            TableUtil.getKey(values) not in rowKeys
+            for values in zip(*columns, strict=False)
+        ]
+        for key, value in table.items():
+            table[key] = [
+                item for item, kept in zip(value, keep, strict=False) if kept
+            ]
@@ -0,0 +1,311 @@
+import datetime
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+
+import appdirs
+import numpy as np
+
+from napari_sphot.options import Options
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Measurement:
+    """The wall time, the cpu time, the peak memory and the input sizes of
+    one run of a function.
+
+    The cpu time is the time of the thread running the function, so that
+    jobs running at the same time are not counted twice, plus the cpu time
+    of the worker process for jobs run by the process backend. The peak
+    memory is the increase of the peak resident set size of the process
+    running the task during the run. The peak of a worker process is reset
+    before each task where the system allows it, in the process of napari,
+    which runs jobs in parallel, the increase is a lower bound. It is None on
+    systems without the resource module.
+    """
+
+    maxScannedLabelVoxels = 16 * 1024 * 1024
+
+    def __init__(self, task=None):
+        """Create a measurement of a run of a method of the task.
+
+        :param task: The object of the method run, the input sizes are read
+                     from its attributes image, labels and spots
+        """
+        self.task = task
+        self.taskName = type(task).__name__ if task is not None else None
+        self.voxels = None
+        self.spots = None
+        self.labels = None
+        self.startTime = None
+        self.startCpuTime = None
+        self.startPeakRSS = None
+        self.threadId = None
+        self.wallTime = None
+        self.cpuTime = None
+        self.peakRSS = None
+        self.processUsage = {}
+
+    def start(self):
+        """Read the input sizes and start the clocks. Must be called in the
+        thread running the function.
+        """
+        self.readInputSizes()
+        self.threadId = threading.get_ident()
+        self.startCpuTime = time.thread_time()
+        self.startPeakRSS = getPeakRSS()
+        self.startTime = time.perf_counter()
+
+    def stop(self):
+        """Stop the clocks. The cpu time is only measured, if stop is called
+        in the thread that called start.
+        """
+        if self.startTime is None or self.wallTime is not None:
+            return
+        self.wallTime = time.perf_counter() - self.startTime
+        if threading.get_ident() == self.threadId:
+            self.cpuTime = (
+                time.thread_time()
+                - self.startCpuTime
+                + self.processUsage.get("cpuTime", 0)
+            )
+        if "peakRSS" in self.processUsage:
+            self.peakRSS = self.processUsage["peakRSS"]
+        else:
+            self.peakRSS = getIncrease(self.startPeakRSS, getPeakRSS())
+
+    def wrap(self, function):
+        """Answer a function, that runs the given function between start and
+        stop. Generator functions are wrapped by generator functions, so that
+        the worker running them still reports their steps.
+        """
+        if inspect.isgeneratorfunction(function):
+
+            def measuredGenerator(*args, **kwargs):
+                self.start()
+                try:
+                    return (yield from function(*args, **kwargs))
+                finally:
+                    self.stop()
+
+            return measuredGenerator
+
+        def measuredFunction(*args, **kwargs):
+            self.start()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.stop()
+
+        return measuredFunction
+
+    def readInputSizes(self):
+        """Read the number of voxels, labels and spots of the input of the
+        task, before the clocks are started.
+        """
+        if self.task is None:
+            return
+        image = getattr(self.task, "image", None)
+        labels = getattr(self.task, "labels", None)
+        volumes = [
+            value
+            for value in (image, labels)
+            if hasattr(value, "shape") and len(value.shape) > 1
+        ]
+        if volumes:
+            self.voxels = max(int(getSize(volume.shape)) for volume in volumes)
+        if self.canCountLabels(labels):
+            self.labels = int(labels.max())
+        elif isinstance(labels, (set, list, tuple, dict)):
+            self.labels = len(labels)
+        spots = getattr(self.task, "spots", None)
+        if spots is not None and hasattr(spots, "__len__"):
+            self.spots = len(spots)
+
+    @classmethod
+    def canCountLabels(cls, labels):
+        """Answer whether the labels are counted. The count needs a scan of
+        the whole volume, so that it is skipped for large volumes and for
+        volumes, that are memory-mapped or not held in memory.
+        """
+        return (
+            isinstance(labels, np.ndarray)
+            and not isinstance(labels, np.memmap)
+            and labels.ndim > 1
+            and 0 < labels.size <= cls.maxScannedLabelVoxels
+        )
+
+    def getRecord(self, **fields):
+        """Answer the measurement as a dictionary, that can be written as json.
+
+        :param fields: Additional fields, for example the description and the
+                       state of the job
+        """
+        record = {
+            "time": datetime.datetime.now().isoformat(timespec="seconds")
+        }
+        record.update(fields)
+        record.update(
+            {
+                "task": self.taskName,
+                "wall_time_s": roundOrNone(self.wallTime),
+                "cpu_time_s": roundOrNone(self.cpuTime),
+                "peak_rss_increase_mb": roundOrNone(self.peakRSS),
+                "voxels": self.voxels,
+                "spots": self.spots,
+                "labels": self.labels,
+            }
+        )
+        return record
+
+
+class Telemetry:
+    """Collect the measurements of the jobs of the plugin and append them to a
+    log in the json-lines format, one record per line, in the data folder of
+    the plugin. The listeners are called with the record when a record is
+    added. The telemetry of the plugin can be switched off in its options.
+    """
+
+    instance = None
+    applicationName = "napari-sphot"
+    fileName = "performance.jsonl"
+    optionsName = "telemetry"
+
+    @classmethod
+    def getInstance(cls):
+        if cls.instance is None:
+            cls.instance = Telemetry()
+            cls.instance.enabled = cls.getOptions().get("enabled")
+        return cls.instance
+
+    @classmethod
+    def getOptions(cls):
+        options = Options(cls.applicationName, cls.optionsName)
+        options.setDefaultValues({"enabled": True})
+        options.load()
+        return options
+
+    def setEnabled(self, enabled):
+        """Switch the telemetry on or off and remember the choice in the
+        options of the plugin.
+        """
+        self.enabled = enabled
+        options = self.getOptions()
+        options.set("enabled", enabled)
+        options.save()
+
+    def __init__(self, path=None):
+        """Create the telemetry writing to the given path.
+
+        :param path: The path of the log or None for the log in the data
+                     folder of the plugin
+        """
+        if path is None:
+            path = os.path.join(
+                appdirs.user_data_dir(self.applicationName), self.fileName
+            )
+        self.path = path
+        self.enabled = True
+        self.records = []
+        self.maxRecords = 500
+        self.listeners = []
+
+    def add(self, record):
+        """Keep the record, append it to the log and notify the listeners. A
+        log, that can not be written, is not an error.
+        """
+        if not self.enabled:
+            return
+        self.records.append(record)
+        del self.records[: max(len(self.records) - self.maxRecords, 0)]
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError:
+            pass
+        for listener in list(self.listeners):
+            listener(record)
+
+    def clear(self):
+        self.records = []
+        for listener in list(self.listeners):
+            listener(None)
+
+
+def getPeakRSS():
+    """Answer the peak resident set size of the current process in MB or None
+    if it is not available. On Linux the peak is read from /proc, so that it
+    can be reset, ru_maxrss is the peak of the whole lifetime of the process.
+    """
+    peak = readProcStatus("VmHWM")
+    if peak is not None:
+        return peak
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def getRSS():
+    """Answer the current resident set size of the process in MB or None if
+    it is not available.
+    """
+    return readProcStatus("VmRSS")
+
+
+def resetPeakRSS():
+    """Reset the peak resident set size of the current process to its current
+    resident set size, which is only possible on Linux.
+
+    :return: The peak after the reset or, if the peak could not be reset, the
+             peak of the lifetime of the process
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    return getPeakRSS()
+
+
+def readProcStatus(key):
+    """Answer the value in MB of the memory field key of /proc/self/status or
+    None if it is not available.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    return None
+
+
+def getIncrease(start, end):
+    if start is None or end is None:
+        return None
+    return max(end - start, 0)
+
+
+def getSize(shape):
+    size = 1
+    for length in shape:
+        size = size * int(length)
+    return size
+
+
+def roundOrNone(value, digits=3):
+    if value is None:
+        return None
+    return round(float(value), digits)